@@ -58,6 +58,9 @@ module "user_datasets_bucket" {
   file_type    = "user-dataset"
   elpis_worker = module.requirements.elpis_worker
 
+  # Expire the cached outputs of processing, which are only kept to be reused.
+  expiring_prefixes = ["_processing_cache/"]
+
   depends_on = [module.requirements]
 }
 
@@ -58,9 +58,14 @@ resource "google_cloudfunctions_function" "process_dataset" {
     resource   = "projects/elpiscloud/databases/(default)/documents/users/{userId}/datasets/{dataset}"
   }
 
+  # Batches are sized to about half of process_dataset_file's timeout.
   environment_variables = {
-    TOPIC_ID = var.dataset_processing_topic.id
-    PROJECT  = var.project
+    TOPIC_ID            = var.dataset_processing_topic.id
+    PROJECT             = var.project
+    USER_FILES_BUCKET   = var.user_upload_files_bucket.name
+    JOB_BATCH_BYTES     = 268435456
+    JOB_BATCH_MAX_FILES = 50
+    JOB_BATCH_SECONDS   = 240
   }
 
   service_account_email = var.elpis_worker.email
@@ -72,18 +77,26 @@ resource "google_cloudfunctions_function" "process_dataset_file" {
   runtime     = "python310"
   region      = var.region
 
-  available_memory_mb   = 128
+  # Jobs are processed one at a time, with their audio (and /tmp) in memory.
+  available_memory_mb   = 2048
   source_archive_bucket = google_storage_bucket.source.name
   source_archive_object = google_storage_bucket_object.archive.name
   entry_point           = "process_dataset_file"
+  timeout               = 540
   event_trigger {
     event_type = "google.pubsub.topic.publish"
     resource   = var.dataset_processing_topic.name
+    failure_policy {
+      retry = true
+    }
   }
 
+  # Failed events are retried, until they're older than MAX_EVENT_AGE_SECONDS.
   environment_variables = {
-    USER_FILES_BUCKET    = var.user_upload_files_bucket.name
-    USER_DATASETS_BUCKET = var.user_datasets_bucket.name
+    TOPIC_ID              = var.dataset_processing_topic.id
+    USER_FILES_BUCKET     = var.user_upload_files_bucket.name
+    USER_DATASETS_BUCKET  = var.user_datasets_bucket.name
+    MAX_EVENT_AGE_SECONDS = 86400
   }
 
   service_account_email = var.elpis_worker.email
@@ -99,13 +112,18 @@ resource "google_cloudfunctions_function" "delete_dataset_from_bucket" {
   source_archive_bucket = google_storage_bucket.source.name
   source_archive_object = google_storage_bucket_object.archive.name
   entry_point           = "delete_dataset_from_bucket"
+  timeout               = 540
   event_trigger {
     event_type = "providers/cloud.firestore/eventTypes/document.delete"
     resource   = "projects/elpiscloud/databases/(default)/documents/users/{userId}/datasets/{dataset}"
+    failure_policy {
+      retry = true
+    }
   }
 
   environment_variables = {
-    USER_DATASETS_BUCKET = var.user_datasets_bucket.name
+    USER_DATASETS_BUCKET    = var.user_datasets_bucket.name
+    DELETE_DEADLINE_SECONDS = 480
   }
 
   service_account_email = var.elpis_worker.email
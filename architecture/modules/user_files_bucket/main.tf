@@ -4,6 +4,20 @@ resource "google_storage_bucket" "bucket" {
   force_destroy = true
 
   uniform_bucket_level_access = true
+
+  # Objects under these prefixes are deleted once they're old enough.
+  dynamic "lifecycle_rule" {
+    for_each = var.expiring_prefixes
+    content {
+      condition {
+        age            = var.expiry_days
+        matches_prefix = [lifecycle_rule.value]
+      }
+      action {
+        type = "Delete"
+      }
+    }
+  }
 }
 
 resource "google_storage_bucket_iam_binding" "sa" {
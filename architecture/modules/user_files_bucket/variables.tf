@@ -1,3 +1,14 @@
 variable "file_type" {}
 variable "location" {}
 variable "elpis_worker" {}
+
+variable "expiring_prefixes" {
+  description = "Prefixes of objects to delete once they're older than expiry_days"
+  type        = list(string)
+  default     = []
+}
+
+variable "expiry_days" {
+  type    = number
+  default = 30
+}
@@ -3,6 +3,9 @@ export interface DataPreparationOptions {
   punctuationToExplode: string;
   textToRemove: string[];
   elanOptions?: ElanOptions;
+  splitUntimedAudio?: boolean;
+  minChunkMs?: number;
+  maxChunkMs?: number;
 }
 
 export interface ElanOptions {
@@ -7,4 +7,21 @@ export interface UserFile extends DocumentData {
   tags: string[];
   timeCreated: string;
   userId: string;
+
+  // Read from the file's header when it's uploaded, for wav files.
+  sampleRate?: number;
+  channels?: number;
+  bitsPerSample?: number;
+  durationMs?: number;
+
+  // Read from the file's tier table when it's uploaded, for eaf files.
+  tiers?: ElanTier[];
+  linguisticTypes?: string[];
+}
+
+export interface ElanTier {
+  tierId: string;
+  linguisticType: string | null;
+  participant: string | null;
+  order: number;
 }
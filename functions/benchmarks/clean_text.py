@@ -0,0 +1,62 @@
+"""Times cleaning 100k transcripts with a reusable TextCleaner.
+
+With --baseline, compares against the revision's clean_text, called once per
+transcript.
+
+Run from the functions directory with:
+python -m benchmarks.clean_text [--baseline REVISION]
+"""
+import random
+import string
+from typing import List
+
+from models import DatasetOptions
+from utils.clean_text import TextCleaner
+
+from benchmarks.harness import best_of, load_baseline, parse_baseline, report
+
+LINES = 100_000
+
+OPTIONS = DatasetOptions(
+    punctuation_to_remove="!?.,'\"",
+    punctuation_to_explode=";:-",
+    text_to_remove=["um", "uh", "er", "hmm", "[laughs]", "[inaudible]"],
+)
+
+
+def generate_lines(count: int, seed: int = 0) -> List[str]:
+    """Generates some transcript-like lines of words, punctuation and fillers."""
+    rng = random.Random(seed)
+    vocabulary = [
+        "".join(rng.choices(string.ascii_letters, k=rng.randint(1, 9)))
+        for _ in range(2_000)
+    ] + OPTIONS.text_to_remove
+    punctuation = OPTIONS.punctuation_to_remove + OPTIONS.punctuation_to_explode
+
+    def word() -> str:
+        result = rng.choice(vocabulary)
+        if rng.random() < 0.2:
+            result += rng.choice(punctuation)
+        return result
+
+    return [" ".join(word() for _ in range(rng.randint(3, 20))) for _ in range(count)]
+
+
+def main() -> None:
+    revision = parse_baseline(__doc__)
+    lines = generate_lines(LINES)
+
+    timings = {"TextCleaner": best_of(lambda: TextCleaner(OPTIONS).clean_many(lines))}
+    if revision is not None:
+        baseline = load_baseline(revision, "utils.clean_text")
+        expected = [baseline.clean_text(line, OPTIONS) for line in lines]
+        assert TextCleaner(OPTIONS).clean_many(lines) == expected
+        timings[revision] = best_of(
+            lambda: [baseline.clean_text(line, OPTIONS) for line in lines]
+        )
+
+    report(f"Cleaning {LINES} lines", timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Times validating and batching datasets of 1k, 10k and 100k files with the
+single-pass DatasetIndex.
+
+With --baseline, compares against the revision's Dataset. The original
+per-transcript scans are quadratic, so the baseline is only timed for sizes
+up to BASELINE_MAX_FILES.
+
+Run from the functions directory with:
+python -m benchmarks.dataset_validation [--baseline REVISION]
+"""
+from typing import Any, List
+
+from models import Dataset, DatasetOptions
+from models.dataset import TRANSCRIPTION_EXTENSIONS
+
+from benchmarks.harness import best_of, load_baseline, parse_baseline, report
+
+SIZES = [1_000, 10_000, 100_000]
+BASELINE_MAX_FILES = 1_000
+
+
+def validate_and_batch(dataset: Any) -> int:
+    assert dataset.is_valid()
+    return len(dataset.to_batch())
+
+
+def generate_files(count: int) -> List[str]:
+    """Generates the names of a valid dataset's transcript and audio pairs."""
+    extensions = sorted(TRANSCRIPTION_EXTENSIONS)
+    files: List[str] = []
+    for index in range(count // 2):
+        files.append(f"recording_{index}{extensions[index % len(extensions)]}")
+        files.append(f"recording_{index}.wav")
+    return files
+
+
+def main() -> None:
+    revision = parse_baseline(__doc__)
+    baseline = None
+    if revision is not None:
+        baseline = load_baseline(revision, "models.dataset")
+
+    for size in SIZES:
+        files = generate_files(size)
+        dataset = Dataset(
+            name="dataset",
+            user_id="1",
+            files=files,
+            options=DatasetOptions(),
+            processed=False,
+        )
+        timings = {"DatasetIndex": best_of(lambda: validate_and_batch(dataset))}
+
+        if baseline is not None and size <= BASELINE_MAX_FILES:
+            baseline_dataset = baseline.Dataset(
+                name="dataset",
+                user_id="1",
+                files=files,
+                options=baseline.DatasetOptions(),
+                processed=False,
+            )
+            assert validate_and_batch(baseline_dataset) == validate_and_batch(dataset)
+            timings[revision] = best_of(lambda: validate_and_batch(baseline_dataset))
+
+        report(f"Validating and batching {size} files", timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Times decoding dataset creation events of 10k and 100k files, with the
+iterative unpack and snake_case keys.
+
+With --baseline, compares against the revision's unpack (which consumes its
+event) followed by decamelize.
+
+Run from the functions directory with:
+python -m benchmarks.firestore_event [--baseline REVISION]
+"""
+import copy
+from typing import Any, Dict
+
+from humps.main import decamelize
+from models import Dataset
+
+from benchmarks.harness import best_of, load_baseline, parse_baseline, report
+
+SIZES = [10_000, 100_000]
+
+
+def generate_event(count: int) -> Dict[str, Any]:
+    """Generates the value of a dataset creation event with count files."""
+    files = [
+        {"stringValue": f"recording_{index // 2}.{('eaf', 'wav')[index % 2]}"}
+        for index in range(count)
+    ]
+    return {
+        "fields": {
+            "name": {"stringValue": "dataset"},
+            "userId": {"stringValue": "1"},
+            "processed": {"booleanValue": False},
+            "files": {"arrayValue": {"values": files}},
+            "options": {
+                "mapValue": {
+                    "fields": {
+                        "punctuationToRemove": {"stringValue": ""},
+                        "punctuationToExplode": {"stringValue": ""},
+                        "textToRemove": {"arrayValue": {}},
+                        "elanOptions": {"nullValue": None},
+                    }
+                }
+            },
+        }
+    }
+
+
+def main() -> None:
+    revision = parse_baseline(__doc__)
+    baseline = None
+    if revision is not None:
+        baseline = load_baseline(revision, "utils.firestore_event_converter")
+
+    for size in SIZES:
+        event = generate_event(size)
+        timings = {
+            "unpack(snake_case=True)": best_of(
+                lambda: Dataset.from_firestore_event(event)
+            )
+        }
+
+        if baseline is not None:
+
+            def decode(copied: Dict[str, Any]) -> Dataset:
+                return Dataset.from_dict(decamelize(baseline.unpack(copied)))
+
+            expected = decode(copy.deepcopy(event))
+            assert Dataset.from_firestore_event(event) == expected
+            timings[revision] = best_of(decode, setup=lambda: copy.deepcopy(event))
+
+        report(f"Decoding a dataset event with {size} files", timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Shared helpers for the benchmarks: timing, reporting, and loading modules
+as they were at an earlier git revision to compare against.
+
+Benchmarks take the revision to compare against as their --baseline
+argument, and time only the current implementation without one.
+"""
+import argparse
+import subprocess
+import time
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable, Dict, Optional
+
+FUNCTIONS_DIR = Path(__file__).resolve().parent.parent
+REPEATS = 3
+
+
+def parse_baseline(description: Optional[str]) -> Optional[str]:
+    """Parses a benchmark's arguments.
+
+    Parameters:
+        description: The description of the benchmark, e.g. its docstring.
+
+    Returns:
+        The git revision to compare against, if one was given.
+    """
+    parser = argparse.ArgumentParser(
+        description=description,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--baseline",
+        metavar="REVISION",
+        help="a git revision whose implementation to compare against",
+    )
+    return parser.parse_args().baseline
+
+
+def load_baseline(revision: str, module_name: str) -> ModuleType:
+    """Loads a module of the functions as it was at a git revision. The
+    module's own imports resolve to the current versions of other modules.
+
+    Parameters:
+        revision: The git revision to load the module from.
+        module_name: The name of the module, e.g. utils.clean_text
+
+    Returns:
+        The loaded module.
+    """
+    path = f"{module_name.replace('.', '/')}.py"
+    source = subprocess.run(
+        ["git", "show", f"{revision}:./{path}"],
+        cwd=FUNCTIONS_DIR,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    module = ModuleType(f"{module_name}@{revision}")
+    exec(compile(source, f"{revision}:{path}", "exec"), module.__dict__)
+    return module
+
+
+def best_of(
+    function: Callable[..., Any],
+    setup: Optional[Callable[[], Any]] = None,
+    repeats: int = REPEATS,
+) -> float:
+    """Times the fastest of some runs of a function.
+
+    Parameters:
+        function: The function to time.
+        setup: If given, called before each run without being timed, and its
+            result passed to the function (e.g. for functions which consume
+            their input).
+        repeats: The number of runs.
+
+    Returns:
+        The fastest run's time in seconds.
+    """
+    timings = []
+    for _ in range(repeats):
+        arguments = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        function(*arguments)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def report(title: str, timings: Dict[str, float]) -> None:
+    """Prints the timings of some implementations, each relative to the first.
+
+    Parameters:
+        title: What was timed.
+        timings: The time taken by each implementation, by name.
+    """
+    print(f"{title} (best of {REPEATS}):")
+    width = max(len(name) for name in timings) + 1
+    first = next(iter(timings.values()))
+    for index, (name, seconds) in enumerate(timings.items()):
+        relative = "" if index == 0 else f" ({seconds / first:.1f}x)"
+        print(f"  {name + ':':<{width}} {seconds:.3f}s{relative}")
@@ -1,21 +1,30 @@
 import os
+import time
 from typing import Dict
 
 from functions_framework import Context
-from humps.main import decamelize
 from loguru import logger
+import utils.processing_cache as processing_cache
 from models import Dataset
+from models.dataset import CACHE_PREFIX_FIELD, PROCESSED_FILES_COLLECTION
+from utils.clients import get_firestore_client
 from utils.cloud_storage import delete_folder_blob
-from utils.firestore_event_converter import unpack
 
 DATASET_BUCKET_NAME = os.environ.get("USER_DATASETS_BUCKET", "dataset_bucket")
 
+# How long to spend deleting before stopping short of the function's timeout.
+# An unfinished deletion fails the invocation, so that the event is retried
+# and the deletion resumes with the objects that remain.
+DELETE_DEADLINE_SECONDS = float(os.environ.get("DELETE_DEADLINE_SECONDS", "480"))
+
 
 def delete_dataset_from_bucket(data: Dict, context: Context) -> None:
     """Cloud function that is setup to be triggered when a dataset is deleted
     from the firestore database.
 
-    This deletes the corresponding dataset from GCP cloud storage.
+    This deletes the corresponding dataset from GCP cloud storage, along with
+    the cached outputs of its files and the markers of its processed files in
+    firestore.
 
     Parameters:
         data (dict): The event data (documented at
@@ -26,11 +35,38 @@ def delete_dataset_from_bucket(data: Dict, context: Context) -> None:
     logger.info("Cloud storage cleanup after firestore dataset deletion...")
     logger.info(f"Raw firestore dataset event: {data}")
 
-    dataset = decamelize(unpack(data["oldValue"]))
-    dataset = Dataset.from_dict(dataset)
+    dataset = Dataset.from_firestore_event(data["oldValue"])
+    start = time.monotonic()
+
+    # Firestore keeps the subcollections of deleted documents, so the markers
+    # would otherwise be counted by a new dataset of the same name. They're
+    # deleted only after the cached outputs they record, so that a retry can
+    # still find any left behind.
+    db = get_firestore_client()
+    markers = (
+        db.collection("users")
+        .document(dataset.user_id)
+        .collection("datasets")
+        .document(dataset.name)
+        .collection(PROCESSED_FILES_COLLECTION)
+    )
+    cache_prefixes = {
+        cache_prefix
+        for marker in markers.select([CACHE_PREFIX_FIELD]).stream()
+        if (cache_prefix := (marker.to_dict() or {}).get(CACHE_PREFIX_FIELD))
+    }
+    processing_cache.evict(DATASET_BUCKET_NAME, sorted(cache_prefixes))
+    logger.info(f"Deleted {len(cache_prefixes)} cached outputs of the dataset")
+    db.recursive_delete(markers)
 
-    delete_folder_blob(
+    report = delete_folder_blob(
         bucket_name=DATASET_BUCKET_NAME,
         target_blob_prefix=f"{dataset.user_id}/{dataset.name}/",
+        deadline_s=DELETE_DEADLINE_SECONDS - (time.monotonic() - start),
     )
+    if not report.complete:
+        raise TimeoutError(
+            f"Deleted {report.deleted} objects of {dataset.user_id}/{dataset.name}/ "
+            "before the deadline, retrying to delete the rest"
+        )
     logger.success(f"Successfully deleted dataset: {dataset.user_id}/{dataset.name}/")
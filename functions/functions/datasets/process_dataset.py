@@ -1,31 +1,151 @@
 import os
-from typing import Dict
+from typing import Dict, Iterable, List, Optional
 
 from functions_framework import Context
-from humps.main import decamelize
 from loguru import logger
-from models.dataset import Dataset, ProcessingJob
-from utils.firestore_event_converter import unpack
+from models.dataset import TOTAL_FILES_FIELD, Dataset, ProcessingBatch, ProcessingJob
+from utils.clients import get_firestore_client
+from utils.cloud_storage import list_blobs_with_prefix
 from utils.pubsub import publish_to_topic
 
 TOPIC_NAME = os.environ.get("TOPIC_ID", "dataset_processing_topic")
+FILES_BUCKET = os.environ.get("USER_FILES_BUCKET", "elpiscloud-user-upload-files")
+
+# When set, jobs are grouped into messages of roughly this many bytes of audio
+# (and at most JOB_BATCH_MAX_FILES jobs each), so that a dataset of many small
+# files is processed by fewer function invocations. Otherwise, each job is
+# published as its own message.
+JOB_BATCH_BYTES = int(os.environ.get("JOB_BATCH_BYTES", "0"))
+JOB_BATCH_MAX_FILES = int(os.environ.get("JOB_BATCH_MAX_FILES", "50"))
+
+# Batches are also kept to roughly this many seconds of expected processing,
+# well within the processing function's timeout. A job is expected to take a
+# fixed overhead (of downloads, uploads and firestore writes) plus the time to
+# process its audio at the given rate.
+JOB_BATCH_SECONDS = float(os.environ.get("JOB_BATCH_SECONDS", "240"))
+JOB_OVERHEAD_SECONDS = float(os.environ.get("JOB_OVERHEAD_SECONDS", "2"))
+JOB_BYTES_PER_SECOND = float(os.environ.get("JOB_BYTES_PER_SECOND", "5000000"))
 
 
 def process_dataset(data: Dict, context: Context) -> None:
     """Begins processing a dataset so it may be used to train a model.
 
     Triggers when a new dataset is created. Reads all the files in a new dataset
-    and publishes an event to the dataset processing topic for each one.
+    and publishes an event to the dataset processing topic for each one, or
+    for each batch of them if job batching is enabled.
 
     Parameters:
         data (dict): The event payload.
         context (Context): Metadata for the event.
     """
     # Convert the firestore event into a dataset object.
-    dataset = decamelize(unpack(data["value"]))
-    dataset = Dataset.from_dict(dataset)
+    dataset = Dataset.from_firestore_event(data["value"])
 
     logger.info(f"Firestore newly-created dataset information: {dataset}")
 
-    jobs = map(ProcessingJob.to_dict, dataset.to_batch())
-    publish_to_topic(topic_name=TOPIC_NAME, data=jobs)
+    jobs = dataset.to_batch()
+
+    # Record how many files there are to process before any of them can
+    # finish, so that finished jobs needn't count the dataset's files.
+    db = get_firestore_client()
+    doc_ref = (
+        db.collection("users")
+        .document(dataset.user_id)
+        .collection("datasets")
+        .document(dataset.name)
+    )
+    doc_ref.update({TOTAL_FILES_FIELD: len(jobs)})
+
+    if JOB_BATCH_BYTES <= 0:
+        publish_to_topic(topic_name=TOPIC_NAME, data=map(ProcessingJob.to_dict, jobs))
+        return
+
+    sizes = get_audio_sizes(dataset.user_id, jobs)
+    batches = group_jobs(
+        jobs, sizes, JOB_BATCH_BYTES, JOB_BATCH_MAX_FILES, JOB_BATCH_SECONDS
+    )
+    logger.info(f"Grouped {len(jobs)} jobs into {len(batches)} batches")
+    publish_to_topic(topic_name=TOPIC_NAME, data=map(ProcessingBatch.to_dict, batches))
+
+
+def get_audio_sizes(user_id: str, jobs: Iterable[ProcessingJob]) -> Dict[str, int]:
+    """Finds the sizes of the jobs' audio files, from a single listing of the
+    user's files.
+
+    Parameters:
+        user_id: The ID of the user whose files the jobs process.
+        jobs: The processing jobs.
+
+    Returns:
+        A dictionary from the jobs' audio file names to their sizes in bytes.
+        Files which couldn't be found are left out.
+    """
+    audio_file_names = {job.audio_file_name for job in jobs}
+    prefix = f"{user_id}/"
+    return {
+        name: int(blob.size or 0)
+        for blob in list_blobs_with_prefix(FILES_BUCKET, prefix, delimiter="/")
+        if (name := str(blob.name)[len(prefix) :]) in audio_file_names
+    }
+
+
+def group_jobs(
+    jobs: List[ProcessingJob],
+    sizes: Dict[str, int],
+    target_bytes: int,
+    max_jobs: int,
+    max_seconds: Optional[float] = None,
+) -> List[ProcessingBatch]:
+    """Groups processing jobs into batches of roughly a target size.
+
+    Jobs are added to a batch in order until it reaches the target number of
+    bytes of audio, the maximum number of jobs or the maximum expected
+    processing time. A job larger than the target is batched on its own.
+
+    Parameters:
+        jobs: The processing jobs to group.
+        sizes: The sizes of the jobs' audio files, by name. Jobs with unknown
+            sizes are counted as the target size.
+        target_bytes: The target number of bytes of audio per batch.
+        max_jobs: The maximum number of jobs per batch.
+        max_seconds: If given, the most seconds a batch is expected to take
+            to process, as estimated by `estimate_seconds`.
+
+    Returns:
+        The batches of jobs.
+    """
+    batches: List[ProcessingBatch] = []
+    batch: List[ProcessingJob] = []
+    batch_bytes = 0
+    batch_seconds = 0.0
+
+    for job in jobs:
+        size = sizes.get(job.audio_file_name, target_bytes)
+        seconds = estimate_seconds(size)
+        if len(batch) > 0 and (
+            batch_bytes + size > target_bytes
+            or len(batch) >= max_jobs
+            or (max_seconds is not None and batch_seconds + seconds > max_seconds)
+        ):
+            batches.append(ProcessingBatch(jobs=batch))
+            batch, batch_bytes, batch_seconds = [], 0, 0.0
+
+        batch.append(job)
+        batch_bytes += size
+        batch_seconds += seconds
+
+    if len(batch) > 0:
+        batches.append(ProcessingBatch(jobs=batch))
+    return batches
+
+
+def estimate_seconds(size: int) -> float:
+    """Estimates how long a job takes to process from the size of its audio.
+
+    Parameters:
+        size: The size of the job's audio file, in bytes.
+
+    Returns:
+        The expected processing time in seconds.
+    """
+    return JOB_OVERHEAD_SECONDS + size / JOB_BYTES_PER_SECOND
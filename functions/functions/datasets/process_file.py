@@ -2,23 +2,115 @@ import base64
 import json
 import os
 from copy import copy
-from itertools import chain
+from datetime import datetime, timezone
+from io import BytesIO
 from pathlib import Path
-from typing import List, Tuple
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import quote
+from xml.etree.ElementTree import ParseError
 
+import numpy as np
 import utils.audio as audio
+import utils.manifest as manifest
+import utils.processing_cache as processing_cache
+import utils.remote_audio as remote_audio
+import utils.vad as vad
 from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists, NotFound
 from loguru import logger
-from models import Annotation, DatasetOptions, ProcessingJob
-from utils.clean_text import clean_text
-from utils.cloud_storage import download_blob, list_blobs_with_prefix, upload_blob
+from models import (
+    Annotation,
+    AnnotationBatch,
+    DatasetOptions,
+    ProcessingBatch,
+    ProcessingJob,
+)
+from models.dataset import (
+    CACHE_PREFIX_FIELD,
+    PROCESSED_COUNT_FIELD,
+    PROCESSED_FILES_COLLECTION,
+    TOTAL_FILES_FIELD,
+    TRANSCRIPTION_EXTENSIONS,
+)
+from utils.clean_text import clean_batch, clean_text
+from utils.cloud_storage import (
+    delete_folder_blob,
+    download_blob,
+    download_blob_to_file,
+    get_blob_checksum,
+    upload_blob,
+    upload_blob_from_file,
+    upload_blob_from_string,
+)
 from utils.extract_annotations import extract_annotations
-from utils.firebase import get_firestore_client
+from utils.clients import get_firestore_client
+from utils.firestore_event_converter import parse_timestamp
+from utils.pipeline import consume
+from utils.pubsub import publish_to_topic
+from utils.shards import SHARD_EXTENSION, write_shard
+from utils.wav import WavHeader
 
 DEFAULT_DIR = Path("/tmp/")
 TARGET_SAMPLE_RATE = 16_000
 FILES_BUCKET = os.environ.get("USER_FILES_BUCKET", "elpiscloud-user-upload-files")
 DATASET_BUCKET = os.environ.get("USER_DATASETS_BUCKET", "elpiscloud-user-dataset-files")
+TOPIC_NAME = os.environ.get("TOPIC_ID", "dataset_processing_topic")
+
+# The quality tier to resample audio with (low, medium or high). Defaults to
+# the resampler's own default when unset.
+RESAMPLE_QUALITY = (
+    audio.ResampleQuality(os.environ["RESAMPLE_QUALITY"])
+    if "RESAMPLE_QUALITY" in os.environ
+    else None
+)
+
+# Whether to pack each file's training data into a single shard, rather than
+# a pair of files per annotation.
+PACK_DATASET_FILES = os.environ.get("PACK_DATASET_FILES", "false").lower() == "true"
+
+# Whether to hold audio and generated files in memory rather than writing them
+# to /tmp, which on Cloud Functions is held in memory anyway.
+IN_MEMORY_PROCESSING = os.environ.get("IN_MEMORY_PROCESSING", "false").lower() == "true"
+
+# Whether to fetch only the annotated ranges of uncompressed audio files whose
+# annotations are all timed, rather than downloading them in full. Off by
+# default, as it trades one download for a request per group of nearby
+# annotations, which only pays off for large files sparsely annotated.
+RANGED_AUDIO_READS = os.environ.get("RANGED_AUDIO_READS", "false").lower() == "true"
+
+# A generated file held in memory, along with its name.
+InMemoryFile = Tuple[str, BytesIO]
+
+# Processed outputs are cached in the dataset bucket under this prefix, which
+# can't collide with a user ID. Off by default, as each cached output is a
+# second copy of it in storage. Entries are deleted along with the datasets
+# whose files they came from, and should otherwise be expired by the bucket's
+# lifecycle rules.
+PROCESSING_CACHE_ENABLED = (
+    os.environ.get("PROCESSING_CACHE_ENABLED", "false").lower() == "true"
+)
+PROCESSING_CACHE_PREFIX = "_processing_cache"
+
+# The fields of a dataset's document needed to tell whether it's processed.
+PROGRESS_FIELDS = [PROCESSED_COUNT_FIELD, TOTAL_FILES_FIELD, "processed"]
+
+# Concurrency of the upload stage, and how many generated files may wait for it.
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", "8"))
+MAX_PENDING_UPLOADS = int(os.environ.get("MAX_PENDING_UPLOADS", "32"))
+
+# Failed events are redelivered for up to a week. Those older than this are
+# dropped instead, as they're unlikely to ever succeed.
+MAX_EVENT_AGE_SECONDS = int(os.environ.get("MAX_EVENT_AGE_SECONDS", "86400"))
+
+
+class DatasetDeleted(Exception):
+    """Raised when a job's dataset is deleted while its file is processed."""
+
+
+# Errors which retrying a job won't fix: its dataset or files have been
+# deleted, or its files can't be parsed.
+TERMINAL_ERRORS = (DatasetDeleted, NotFound, ValueError, ParseError)
 
 
 def process_dataset_file(event, context) -> None:
@@ -28,45 +120,423 @@ def process_dataset_file(event, context) -> None:
     This processes the incoming file, whose path it can infer from the event. It
     cleans the data inside if it's a transcription file, and saves it to cloud
     storage so that it can be used in training with the dataset it came from.
+    Events may also carry a batch of processing jobs, which are processed in
+    turn. A failed job doesn't stop the rest of its batch, and is published
+    again as a message of its own to be retried.
+
+    Jobs failing with one of the TERMINAL_ERRORS are logged and dropped rather
+    than retried, as are events older than MAX_EVENT_AGE_SECONDS.
 
     Parameters:
          event: The cloud event.
+         context: The metadata of the event.
 
     """
-    # Decode and deserialize the processing job
+    if is_expired(context):
+        logger.error(f"Dropping event {context.event_id} from {context.timestamp}")
+        return
+
+    # Decode and deserialize the processing jobs
     data = base64.b64decode(event["data"]).decode("utf-8")
     data = json.loads(data)
     logger.info(f"Event data: {data}")
-    job = ProcessingJob.from_dict(data)
+    batch = ProcessingBatch.from_dict(data)
+
+    if len(batch.jobs) == 1:
+        # Failing the event retries the job.
+        try:
+            process_job(batch.jobs[0])
+        except TERMINAL_ERRORS:
+            logger.exception(f"Dropping {batch.jobs[0].transcription_file_name}")
+        return
+
+    failed: List[ProcessingJob] = []
+    for job in batch.jobs:
+        try:
+            process_job(job)
+        except TERMINAL_ERRORS:
+            logger.exception(f"Dropping {job.transcription_file_name}")
+        except Exception:
+            logger.exception(f"Failed to process {job.transcription_file_name}")
+            failed.append(job)
+
+    if len(failed) == 0:
+        return
+
+    published = publish_to_topic(TOPIC_NAME, map(ProcessingJob.to_dict, failed))
+    if published < len(failed):
+        # Retry the whole batch rather than lose jobs. Its processed jobs are
+        # only counted once.
+        raise RuntimeError(f"Couldn't publish {len(failed)} failed jobs for retry")
+    logger.warning(f"Published {len(failed)} failed jobs for retry")
+
+
+def is_expired(context: Any) -> bool:
+    """Checks whether an event is too old to keep retrying.
+
+    Parameters:
+        context: The metadata of the event, or None if it has none.
+
+    Returns:
+        true iff the event was published over MAX_EVENT_AGE_SECONDS ago.
+    """
+    timestamp = getattr(context, "timestamp", None)
+    if timestamp is None:
+        return False
+
+    age = datetime.now(timezone.utc) - parse_timestamp(timestamp)
+    return age.total_seconds() > MAX_EVENT_AGE_SECONDS
+
+
+def process_job(job: ProcessingJob) -> None:
+    """Processes a single transcription and audio file pair, and records that
+    it's been processed. Jobs whose datasets have been deleted are skipped, so
+    that their outputs aren't uploaded again.
+
+    Parameters:
+        job: The processing job.
+    """
+    prefix = f"{job.user_id}/{job.dataset_name}"
+
+    if not get_dataset_ref(job).get(field_paths=["processed"]).exists:
+        logger.warning(f"Skipping {job.transcription_file_name}, as {prefix} is gone")
+        return
+
+    # Reuse the outputs of identical processing for another dataset
+    cache_prefix = get_cache_prefix(job)
+    restored = cache_prefix is not None and processing_cache.restore(
+        DATASET_BUCKET, cache_prefix, prefix, workers=UPLOAD_WORKERS
+    )
+
+    if not restored:
+        # Keep scratch files to a directory of their own, which is removed
+        # however processing ends, as /tmp is held in memory and outlives the
+        # invocation.
+        with TemporaryDirectory(dir=DEFAULT_DIR) as scratch:
+            uploaded_names = process_files(job, Path(scratch))
+
+        if cache_prefix is not None:
+            processing_cache.store(
+                DATASET_BUCKET, prefix, uploaded_names, cache_prefix, UPLOAD_WORKERS
+            )
+
+    try:
+        post_processing_hook(job, cache_prefix)
+    except DatasetDeleted:
+        # The dataset's files were deleted while this job's were uploaded
+        delete_folder_blob(DATASET_BUCKET, f"{prefix}/")
+        raise
+
+
+def process_files(job: ProcessingJob, dir: Path) -> List[str]:
+    """Generates the training data for a job's files, and uploads it to the
+    dataset bucket as it's generated.
+
+    Parameters:
+        job: The processing job.
+        dir: The scratch directory to use while processing.
+
+    Returns:
+        The names of the uploaded files, relative to the dataset's prefix.
+    """
+    prefix = f"{job.user_id}/{job.dataset_name}"
 
-    transcription_file, audio_file = download_files(job)
+    transcription_file = download_transcription(job, dir)
     annotations = extract_annotations(transcription_file, job.options.elan_options)
 
-    # Resample audio to standardise for training
-    audio.resample(
-        audio_path=audio_file, destination=audio_file, sample_rate=TARGET_SAMPLE_RATE
+    # Uncompressed audio whose annotations are all timed can be read in
+    # parts, so only the annotated audio is fetched.
+    header = None
+    if RANGED_AUDIO_READS and annotations.all_timed():
+        header = remote_audio.read_header(
+            FILES_BUCKET, f"{job.user_id}/{job.audio_file_name}"
+        )
+
+    # Generate training files from the annotations
+    processed_files: Iterable[Union[Path, InMemoryFile]]
+    if header is not None:
+        logger.info(f"Reading annotated ranges of {job.audio_file_name}: {header}")
+        annotations = clean_batch(annotations, job.options)
+        processed_files = generate_ranged_files(
+            job, annotations, header, None if IN_MEMORY_PROCESSING else dir
+        )
+    else:
+        processed_files = generate_downloaded_files(job, annotations, dir)
+
+    # Upload the training files as they're generated, noting what the
+    # manifest needs to know about each.
+    descriptions: List[manifest.FileDescription] = []
+
+    def upload(file: Union[Path, InMemoryFile]) -> None:
+        if isinstance(file, Path):
+            name = file.name
+            description = manifest.describe_file(name, file)
+            upload_blob(DATASET_BUCKET, file, f"{prefix}/{name}")
+        else:
+            name, buffer = file
+            description = manifest.describe_file(name, buffer)
+            upload_blob_from_file(DATASET_BUCKET, buffer, f"{prefix}/{name}")
+        descriptions.append(description)
+
+    consume(
+        processed_files,
+        upload,
+        workers=UPLOAD_WORKERS,
+        max_pending=MAX_PENDING_UPLOADS,
     )
 
-    # Clean the annotations
-    annotations = map(
-        lambda annotation: clean_annotation(annotation, job.options), annotations
+    # Record this file's part of the dataset's manifest
+    entries = manifest.build_entries(descriptions)
+    part_name = f"{Path(job.transcription_file_name).stem}{manifest.PART_SUFFIX}"
+    upload_blob_from_string(
+        DATASET_BUCKET, manifest.serialize(entries), f"{prefix}/{part_name}"
     )
+    return [description.name for description in descriptions] + [part_name]
 
-    # Generate training files from the annotations
-    processed_files = chain(
-        *map(
-            lambda annotation: generate_training_files(annotation, audio_file),
+
+def generate_downloaded_files(
+    job: ProcessingJob, annotations: AnnotationBatch, dir: Path
+) -> Iterable[Union[Path, InMemoryFile]]:
+    """Downloads a job's audio file, and generates the training files for
+    its annotations from it.
+
+    Parameters:
+        job: The processing job.
+        annotations: The annotations within the job's audio file, which are
+            cleaned once any untimed annotations have been split.
+        dir: The scratch directory to use while processing.
+
+    Returns:
+        An iterable of the training files, on disk or in memory.
+    """
+    audio_file: audio.AudioSource
+    if IN_MEMORY_PROCESSING:
+        audio_file = download_audio_to_memory(job)
+    else:
+        audio_file = download_audio(job, dir)
+
+    # Normalize audio to standardise for training, in the cheapest way that
+    # the file allows. Timed annotations are resampled as they're cut, so only
+    # the annotated audio is processed, but untimed annotations span the
+    # whole file.
+    plan = audio.plan_normalization(audio_file, TARGET_SAMPLE_RATE)
+    fused = (
+        plan.action == audio.NormalizationAction.RESAMPLE and annotations.all_timed()
+    )
+    if fused:
+        sample_rate = TARGET_SAMPLE_RATE
+    elif isinstance(audio_file, BytesIO):
+        audio_file = audio.normalize_in_memory(
+            audio_file, plan, quality=RESAMPLE_QUALITY
+        )
+        sample_rate = None
+    else:
+        audio.normalize(audio_file, audio_file, plan, quality=RESAMPLE_QUALITY)
+        sample_rate = None
+    logger.info(
+        f"Normalized {job.audio_file_name} with action: {plan.action.value}, "
+        f"fused: {fused}, plan: {plan}"
+    )
+
+    # Splitting relies on the line breaks which cleaning removes
+    if job.options.split_untimed_audio:
+        annotations = split_untimed_annotations(annotations, audio_file, job.options)
+    annotations = clean_batch(annotations, job.options)
+
+    if isinstance(audio_file, BytesIO) and PACK_DATASET_FILES:
+        return [
+            generate_shard_in_memory(
+                annotations,
+                audio_file,
+                job.audio_file_name,
+                sample_rate=sample_rate,
+                quality=RESAMPLE_QUALITY,
+            )
+        ]
+    if isinstance(audio_file, BytesIO):
+        return generate_training_buffers(
             annotations,
+            audio_file,
+            job.audio_file_name,
+            sample_rate=sample_rate,
+            quality=RESAMPLE_QUALITY,
         )
+    if PACK_DATASET_FILES:
+        return [
+            generate_shard(
+                annotations,
+                audio_file,
+                dir,
+                sample_rate=sample_rate,
+                quality=RESAMPLE_QUALITY,
+            )
+        ]
+    return generate_training_files(
+        annotations,
+        audio_file,
+        dir,
+        sample_rate=sample_rate,
+        quality=RESAMPLE_QUALITY,
     )
 
-    # Upload all the training files
-    for file in processed_files:
-        upload_blob(
-            DATASET_BUCKET, file, f"{job.user_id}/{job.dataset_name}/{file.name}"
+
+def split_untimed_annotations(
+    annotations: Iterable[Annotation],
+    audio_file: audio.AudioSource,
+    options: DatasetOptions,
+) -> AnnotationBatch:
+    """Splits untimed annotations of long recordings into a timed annotation
+    per line of their transcripts, at pauses in speech. See vad.split_annotation.
+
+    Parameters:
+        annotations: The uncleaned annotations within the audio file.
+        audio_file: The normalized audio file which the annotations reference.
+        options: The processing options for the dataset, giving the bounds
+            on chunk durations.
+
+    Returns:
+        The annotations, with each untimed annotation replaced by its chunks.
+    """
+    annotations = AnnotationBatch.from_annotations(annotations)
+    if annotations.all_timed():
+        return annotations
+
+    samples, sample_rate = audio.read_samples(audio_file)
+    untimed = set(annotations.untimed_indices())
+    result: List[Dict[str, Any]] = []
+    for index, row in enumerate(annotations.to_dicts()):
+        if index not in untimed:
+            result.append(row)
+            continue
+
+        chunks = vad.split_annotation(
+            annotations[index],
+            samples,
+            sample_rate,
+            min_chunk_ms=options.min_chunk_ms,
+            max_chunk_ms=options.max_chunk_ms,
+        )
+        logger.info(f"Split {row['audio_file_name']} into {len(chunks)} chunks")
+        result.extend(chunk.to_dict() for chunk in chunks)
+    return AnnotationBatch.from_dicts(result)
+
+
+def generate_ranged_files(
+    job: ProcessingJob,
+    annotations: AnnotationBatch,
+    header: WavHeader,
+    dir: Optional[Path] = None,
+) -> Iterable[Union[Path, InMemoryFile]]:
+    """Generates the training files for some timed annotations by fetching
+    only the annotated ranges of the job's audio file from cloud storage.
+
+    Parameters:
+        job: The processing job.
+        annotations: The cleaned annotations within the job's audio file,
+            which must all be timed.
+        header: The header of the job's audio file, from
+            remote_audio.read_header.
+        dir: The directory in which to create the training files. If None,
+            they're created in memory.
+
+    Returns:
+        An iterable of the training files, on disk or in memory.
+    """
+    rows = annotations.to_dicts()
+    entries = (
+        (rows[index], samples, sample_rate)
+        for index, samples, sample_rate in remote_audio.read_segments(
+            FILES_BUCKET,
+            f"{job.user_id}/{job.audio_file_name}",
+            header,
+            annotations.timed_segments(),
+            sample_rate=TARGET_SAMPLE_RATE,
+            quality=RESAMPLE_QUALITY,
         )
+    )
+
+    stem = Path(job.audio_file_name).stem
+    if PACK_DATASET_FILES and dir is None:
+        return [(f"{stem}{SHARD_EXTENSION}", write_shard(BytesIO(), entries))]
+    if PACK_DATASET_FILES:
+        return [write_shard(dir / f"{stem}{SHARD_EXTENSION}", entries)]
+    return generate_segment_files(entries, job.audio_file_name, dir)
+
+
+def generate_segment_files(
+    entries: Iterable[Tuple[Dict[str, Any], np.ndarray, int]],
+    audio_file_name: str,
+    dir: Optional[Path] = None,
+) -> Iterator[Union[Path, InMemoryFile]]:
+    """Generates transcript and audio file pairings for some timed
+    annotations whose samples have already been read.
+
+    Parameters:
+        entries: An iterable of (annotation dictionary, samples, sample_rate)
+            tuples.
+        audio_file_name: The name of the file which the annotations reference.
+        dir: The directory in which to create the training files. If None,
+            they're created in memory.
+
+    Returns:
+        An iterator over the transcription and audio files for the given
+            annotations.
+    """
+    for row, samples, sample_rate in entries:
+        name = f"{Path(audio_file_name).stem}_{row['start_ms']}"
+        transcription = json.dumps(row)
+
+        if dir is None:
+            yield f"{name}.json", BytesIO(transcription.encode("utf-8"))
+            yield f"{name}.wav", audio.encode_samples(samples, sample_rate)
+            continue
+
+        transcription_file = dir / f"{name}.json"
+        transcription_file.write_text(transcription)
+        yield transcription_file
 
-    post_processing_hook(job)
+        audio_file = dir / f"{name}.wav"
+        audio.write_samples(audio_file, samples, sample_rate)
+        yield audio_file
+
+
+def get_cache_prefix(job: ProcessingJob) -> Optional[str]:
+    """Gets the location in the processing cache for the outputs of a job.
+
+    The location is keyed by the contents of the job's files, along with
+    everything else that affects how they're processed, so identical jobs
+    from different datasets share it.
+
+    Parameters:
+        job: The processing job.
+
+    Returns:
+        The prefix of the job's cached outputs within the dataset bucket, or
+        None if caching is disabled or the job's files couldn't be found.
+    """
+    if not PROCESSING_CACHE_ENABLED:
+        return None
+
+    audio_checksum = get_blob_checksum(
+        FILES_BUCKET, f"{job.user_id}/{job.audio_file_name}"
+    )
+    transcription_checksum = get_blob_checksum(
+        FILES_BUCKET, f"{job.user_id}/{job.transcription_file_name}"
+    )
+    if audio_checksum is None or transcription_checksum is None:
+        return None
+
+    key = processing_cache.get_cache_key(
+        job.audio_file_name,
+        audio_checksum,
+        job.transcription_file_name,
+        transcription_checksum,
+        job.options.to_dict(),
+        TARGET_SAMPLE_RATE,
+        RESAMPLE_QUALITY and RESAMPLE_QUALITY.value,
+        PACK_DATASET_FILES,
+    )
+    return f"{PROCESSING_CACHE_PREFIX}/{job.user_id}/{key}"
 
 
 def download_files(job: ProcessingJob, dir: Path = DEFAULT_DIR) -> Tuple[Path, Path]:
@@ -80,22 +550,67 @@ def download_files(job: ProcessingJob, dir: Path = DEFAULT_DIR) -> Tuple[Path, P
         A tuple containing the path of the downloaded transcription,
         and audio files.
     """
-    # Download transcription file
+    return download_transcription(job, dir), download_audio(job, dir)
+
+
+def download_transcription(job: ProcessingJob, dir: Path = DEFAULT_DIR) -> Path:
+    """Download the transcription file for the job.
+
+    The transcription is always written to disk, as the annotation extractors
+    read from a path, but it's small next to the audio.
+
+    Parameters:
+        job: The processing job.
+        dir: The directory in which to store the file.
+
+    Returns:
+        The path of the downloaded transcription file.
+    """
     transcription_file = dir / job.transcription_file_name
     download_blob(
         bucket_name=FILES_BUCKET,
         source_blob_name=f"{job.user_id}/{job.transcription_file_name}",
         destination_file_name=transcription_file,
     )
+    return transcription_file
+
+
+def download_audio(job: ProcessingJob, dir: Path = DEFAULT_DIR) -> Path:
+    """Download the audio file for the job.
 
-    # Download audio file
+    Parameters:
+        job: The processing job.
+        dir: The directory in which to store the file.
+
+    Returns:
+        The path of the downloaded audio file.
+    """
     audio_file = dir / job.audio_file_name
     download_blob(
         bucket_name=FILES_BUCKET,
         source_blob_name=f"{job.user_id}/{job.audio_file_name}",
         destination_file_name=audio_file,
     )
-    return transcription_file, audio_file
+    return audio_file
+
+
+def download_audio_to_memory(job: ProcessingJob) -> BytesIO:
+    """Download the audio file for the job into memory.
+
+    Parameters:
+        job: The processing job.
+
+    Returns:
+        The contents of the audio file.
+    """
+    audio_file = BytesIO()
+    download_blob_to_file(
+        bucket_name=FILES_BUCKET,
+        source_blob_name=f"{job.user_id}/{job.audio_file_name}",
+        destination_file=audio_file,
+    )
+    audio_file.seek(0)
+    return audio_file
 
 
 def clean_annotation(annotation: Annotation, options: DatasetOptions) -> Annotation:
@@ -115,115 +630,337 @@ def clean_annotation(annotation: Annotation, options: DatasetOptions) -> Annotat
 
 
 def generate_training_files(
-    annotation: Annotation, audio_file: Path, dir: Path = DEFAULT_DIR
-) -> Tuple[Path, Path]:
-    """Generates a transcript and audio file pairing for this annotation.
+    annotations: Iterable[Annotation],
+    audio_file: Path,
+    dir: Path = DEFAULT_DIR,
+    sample_rate: Optional[int] = None,
+    quality: Optional[audio.ResampleQuality] = None,
+) -> Iterator[Path]:
+    """Generates transcript and audio file pairings for the given annotations.
+
+    If an annotation is timed (has a start and stop time), a new audio file is
+    created, which is constrained to the given times. Otherwise, the
+    annotation spans the entire audio file, and so its path is yielded
+    unmodified. All timed segments are cut from a single read of the audio
+    file, and are resampled while being cut if a sample rate is given.
+
+    Parameters:
+        annotations: The annotations for sections of audio within the
+            supplied audio_file.
+        audio_file: The file which the annotations reference.
+        dir: The directory in which to create the training files.
+        sample_rate: The sample rate to resample timed segments to. If None,
+            segments keep the sample rate of the audio file.
+        quality: The quality of resampling to use, if resampling.
+
+    Returns:
+        An iterator over the transcription and audio file paths for the given
+            annotations.
+    """
+    segments: List[Tuple[Path, int, int]] = []
+    for row in AnnotationBatch.from_annotations(annotations).to_dicts():
+        # Get a unique name prefix based on annotation start time, which is
+        # only present for timed annotations
+        name = audio_file.stem
+        if row["start_ms"] is not None:
+            name = f"{name}_{row['start_ms']}"
+
+        # Save transcription_file
+        transcription_file = dir / f"{name}.json"
+        with open(transcription_file, "w") as f:
+            json.dump(row, f)
+        yield transcription_file
+
+        if row["start_ms"] is not None:
+            segments.append((dir / f"{name}.wav", row["start_ms"], row["stop_ms"]))
+        else:
+            yield audio_file
+
+    if len(segments) == 0:
+        return
+
+    if sample_rate is None:
+        yield from audio.cut_many(audio_file, segments)
+    else:
+        yield from audio.cut_many_resampled(
+            audio_file, segments, sample_rate, quality=quality
+        )
+
+
+def generate_training_buffers(
+    annotations: Iterable[Annotation],
+    audio_file: BytesIO,
+    audio_file_name: str,
+    sample_rate: Optional[int] = None,
+    quality: Optional[audio.ResampleQuality] = None,
+) -> Iterator[InMemoryFile]:
+    """Generates transcript and audio file pairings for the given annotations,
+    entirely in memory.
+
+    This mirrors generate_training_files, but each file is encoded into a
+    buffer rather than written to disk.
+
+    Parameters:
+        annotations: The annotations for sections of audio within the
+            supplied audio_file.
+        audio_file: The contents of the file which the annotations reference.
+        audio_file_name: The name of the file which the annotations reference.
+        sample_rate: The sample rate to resample timed segments to. If None,
+            segments keep the sample rate of the audio file.
+        quality: The quality of resampling to use, if resampling.
+
+    Returns:
+        An iterator over the names and contents of the transcription and
+            audio files for the given annotations.
+    """
+    segments: List[Tuple[str, int, int]] = []
+    for row in AnnotationBatch.from_annotations(annotations).to_dicts():
+        # Get a unique name prefix based on annotation start time, which is
+        # only present for timed annotations
+        name = Path(audio_file_name).stem
+        if row["start_ms"] is not None:
+            name = f"{name}_{row['start_ms']}"
+
+        transcription = json.dumps(row).encode("utf-8")
+        yield f"{name}.json", BytesIO(transcription)
+
+        if row["start_ms"] is not None:
+            segments.append((f"{name}.wav", row["start_ms"], row["stop_ms"]))
+        else:
+            # Each upload needs its own position in the (shared) contents
+            yield audio_file_name, BytesIO(audio_file.getvalue())
+
+    if len(segments) == 0:
+        return
+
+    if sample_rate is None:
+        entries = audio.read_segments(audio_file, segments)
+    else:
+        entries = audio.read_segments_resampled(
+            audio_file, segments, sample_rate, quality=quality
+        )
+    for name, samples, rate in entries:
+        yield name, audio.encode_samples(samples, rate)
+
+
+def generate_shard(
+    annotations: Iterable[Annotation],
+    audio_file: Path,
+    dir: Path = DEFAULT_DIR,
+    sample_rate: Optional[int] = None,
+    quality: Optional[audio.ResampleQuality] = None,
+) -> Path:
+    """Packs the transcripts and audio for the given annotations into a
+    single shard file.
+
+    Timed annotations contribute the audio within their times, and untimed
+    annotations contribute the entire audio file.
+
+    Parameters:
+        annotations: The annotations for sections of audio within the
+            supplied audio_file.
+        audio_file: The file which the annotations reference.
+        dir: The directory in which to create the shard.
+        sample_rate: The sample rate to resample timed segments to. If None,
+            segments keep the sample rate of the audio file.
+        quality: The quality of resampling to use, if resampling.
+
+    Returns:
+        The path to the created shard.
+    """
+    entries = _shard_entries(annotations, audio_file, sample_rate, quality)
+    return write_shard(dir / f"{audio_file.stem}{SHARD_EXTENSION}", entries)
+
 
-    If the annotation is timed (has a start and stop time), we return a path
-    to a new audio file, which is constrained to the given times. Otherwise,
-    the annotation spans the entire audio path, and so we return this path,
-    unmodified.
+def generate_shard_in_memory(
+    annotations: Iterable[Annotation],
+    audio_file: BytesIO,
+    audio_file_name: str,
+    sample_rate: Optional[int] = None,
+    quality: Optional[audio.ResampleQuality] = None,
+) -> InMemoryFile:
+    """Packs the transcripts and audio for the given annotations into a
+    single shard, entirely in memory. See generate_shard.
 
     Parameters:
-        annotation: The annotation for a given section of audio within the
+        annotations: The annotations for sections of audio within the
             supplied audio_file.
-        audio_file: The file which the annotation references.
-
-    Returns:
-        A tuple containing a transcription and audio file path for the given
-            annotation.
-    """
-    # Get a unique name prefix based on annotation start time
-    name = audio_file.stem
-    if annotation.start_ms is not None:
-        name = f"{name}_{annotation.start_ms}"
-
-    # Save transcription_file
-    transcription_file = dir / f"{name}.json"
-    with open(transcription_file, "w") as f:
-        json.dump(annotation.to_dict(), f)
-
-    # Save audio file.
-    # Type ignoring is because is_timed ensures sample_rate, start_ms and stop_ms exist
-    if annotation.is_timed():
-        cut_audio_file = dir / f"{name}.wav"
-        audio.cut(
-            audio_path=audio_file,
-            destination=cut_audio_file,
-            start_ms=annotation.start_ms,  # type: ignore
-            stop_ms=annotation.stop_ms,  # type: ignore
+        audio_file: The contents of the file which the annotations reference.
+        audio_file_name: The name of the file which the annotations reference.
+        sample_rate: The sample rate to resample timed segments to. If None,
+            segments keep the sample rate of the audio file.
+        quality: The quality of resampling to use, if resampling.
+
+    Returns:
+        The name and contents of the created shard.
+    """
+    entries = _shard_entries(annotations, audio_file, sample_rate, quality)
+    name = f"{Path(audio_file_name).stem}{SHARD_EXTENSION}"
+    return name, write_shard(BytesIO(), entries)
+
+
+def _shard_entries(
+    annotations: Iterable[Annotation],
+    audio_file: audio.AudioSource,
+    sample_rate: Optional[int],
+    quality: Optional[audio.ResampleQuality],
+) -> Iterator[Tuple[Dict[str, Any], np.ndarray, int]]:
+    """Reads the samples for each of the given annotations, for a shard."""
+    batch = AnnotationBatch.from_annotations(annotations)
+    rows = batch.to_dicts()
+
+    segments = batch.timed_segments()
+    if sample_rate is None:
+        entries = audio.read_segments(audio_file, segments)
+    else:
+        entries = audio.read_segments_resampled(
+            audio_file, segments, sample_rate, quality=quality
         )
-        audio_file = cut_audio_file
+    yield from ((rows[index], samples, rate) for index, samples, rate in entries)
 
-    return transcription_file, audio_file
+    untimed = batch.untimed_indices()
+    if len(untimed) > 0:
+        samples, rate = audio.read_samples(audio_file)
+        yield from ((rows[index], samples, rate) for index in untimed)
 
 
-def post_processing_hook(job: ProcessingJob) -> None:
-    """Determine if all the files in a dataset have been processed, and if so,
-    updates the document accordingly in firestore.
+def post_processing_hook(
+    job: ProcessingJob, cache_prefix: Optional[str] = None
+) -> None:
+    """Records that a job's file has been processed, and if it was the last
+    file in its dataset, marks the dataset as processed in firestore and
+    merges its manifest.
 
     Parameters:
-        job: The dataset processing job to check
+        job: The dataset processing job which has finished.
+        cache_prefix: Where the job's outputs are cached, if they are.
     """
-    # Get the list of files included in the dataset within firestore
     db = get_firestore_client()
-    doc_ref: firestore.firestore.DocumentReference = (
-        db.collection("users")
+    doc_ref = get_dataset_ref(job)
+    record_processed_file(db, doc_ref, job, cache_prefix)
+
+    # Only the jobs finishing once every file is counted need a transaction
+    # (or all of them, for datasets without a recorded total), so the rest
+    # don't contend on the dataset's document.
+    dataset = doc_ref.get(field_paths=PROGRESS_FIELDS).to_dict() or {}
+    if TOTAL_FILES_FIELD in dataset and not has_finished_processing(dataset):
+        return
+    if not mark_dataset_processed(db.transaction(), doc_ref):
+        return
+
+    try:
+        count = manifest.merge(DATASET_BUCKET, f"{job.user_id}/{job.dataset_name}")
+    except Exception:
+        # Let the retried job mark the dataset and merge its manifest again.
+        doc_ref.update({"processed": False})
+        raise
+    logger.info(f"Merged dataset manifest with {count} entries")
+
+
+def get_dataset_ref(job: ProcessingJob) -> firestore.firestore.DocumentReference:
+    """Gets a reference to the document of a job's dataset.
+
+    Parameters:
+        job: The dataset processing job.
+
+    Returns:
+        The reference to the dataset's document.
+    """
+    return (
+        get_firestore_client()
+        .collection("users")
         .document(job.user_id)
         .collection("datasets")
         .document(job.dataset_name)
     )
-    snapshot = doc_ref.get()
 
-    # Error handling  for if user deletes dataset before processing this file.
-    if not snapshot.exists:
-        raise RuntimeError(
-            f"Dataset doesn't exist at users/{job.user_id}/datasets/{job.dataset_name}"
-        )
 
-    dataset = snapshot.to_dict()
-    if dataset is None:
-        logger.error(
-            f"Dataset users/{job.user_id}/datasets/{job.dataset_name} not found!!"
-        )
-        return
+def record_processed_file(
+    db: firestore.firestore.Client,
+    doc_ref: firestore.firestore.DocumentReference,
+    job: ProcessingJob,
+    cache_prefix: Optional[str] = None,
+) -> bool:
+    """Counts a job's file towards its dataset's processed files.
+
+    The file's marker is created along with the count's increment, in a single
+    write, so a retried job is only ever counted once. Markers also record
+    where the file's outputs are cached, so they're deleted with the dataset.
 
-    file_names: List[str] = dataset["files"]
-    logger.info(f"Firestore dataset file names: {file_names}")
+    Parameters:
+        db: The firestore client.
+        doc_ref: A reference to the dataset's document.
+        job: The dataset processing job which has finished.
+        cache_prefix: Where the job's outputs are cached, if they are.
 
-    # Get the list of files currently uploaded to the bucket.
-    processed_file_names = [
-        str(blob.name)
-        for blob in list_blobs_with_prefix(
-            DATASET_BUCKET, f"{job.user_id}/{job.dataset_name}/"
+    Returns:
+        true iff the file was counted, rather than already having been.
+    """
+    marker_ref = doc_ref.collection(PROCESSED_FILES_COLLECTION).document(
+        quote(job.transcription_file_name, safe="")
+    )
+    batch = db.batch()
+    marker: Dict[str, Any] = {"processedAt": firestore.SERVER_TIMESTAMP}
+    if cache_prefix is not None:
+        marker[CACHE_PREFIX_FIELD] = cache_prefix
+    batch.create(marker_ref, marker)
+    batch.update(doc_ref, {PROCESSED_COUNT_FIELD: firestore.Increment(1)})
+    try:
+        batch.commit()
+    except AlreadyExists:
+        logger.info(f"Already counted {job.transcription_file_name} as processed")
+        return False
+    except NotFound:
+        # Error handling for if user deletes dataset before processing this file.
+        raise DatasetDeleted(
+            f"Dataset doesn't exist at users/{job.user_id}/datasets/{job.dataset_name}"
         )
-    ]
-    logger.info(f"Processed file names: {processed_file_names}")
 
-    if has_finished_processing(file_names, processed_file_names):
-        doc_ref.update({"processed": True})
+    logger.info(f"Counted {job.transcription_file_name} as processed")
+    return True
 
 
-def has_finished_processing(
-    dataset_files: List[str], processed_files: List[str]
+@firestore.transactional
+def mark_dataset_processed(
+    transaction: firestore.firestore.Transaction,
+    doc_ref: firestore.firestore.DocumentReference,
 ) -> bool:
-    """Checks whether the dataset has finished processing.
+    """Marks a dataset as processed if all of its files have been, within a
+    transaction so that only one of the jobs finishing it does.
 
     Parameters:
-        dataset_files: A list of names of the files in the dataset.
-        processed_files: A list of names of files uploaded to cloud storage for
-            the corresponding dataset.
+        transaction: The firestore transaction to run within.
+        doc_ref: A reference to the dataset's document.
 
     Returns:
-        true iff the supplied list of processed files would be a valid
-        processed dataset for the initial files.
+        true iff the dataset was marked as processed by this call.
     """
+    snapshot = doc_ref.get(transaction=transaction)
+    if not snapshot.exists or not has_finished_processing(snapshot.to_dict() or {}):
+        return False
+
+    transaction.update(doc_ref, {"processed": True})
+    return True
 
-    required_stems = {Path(name).stem for name in dataset_files}
-    uploaded_stems = {Path(name).stem for name in processed_files}
 
-    def is_processed(required_stem: str) -> bool:
-        starts_with_required_stem = lambda stem: stem.startswith(required_stem)
-        return any(map(starts_with_required_stem, uploaded_stems))
+def has_finished_processing(dataset: Dict[str, Any]) -> bool:
+    """Checks whether every transcription file in a dataset has been
+    processed, and the dataset hasn't yet been marked as processed.
 
-    return all(map(is_processed, required_stems))
+    Datasets whose processing began before their number of files was recorded
+    count their files instead.
+
+    Parameters:
+        dataset: The dataset's document.
+
+    Returns:
+        true iff the dataset has finished processing but isn't marked as such.
+    """
+    total = dataset.get(TOTAL_FILES_FIELD)
+    if total is None:
+        total = sum(
+            Path(name).suffix in TRANSCRIPTION_EXTENSIONS
+            for name in dataset.get("files", [])
+        )
+    count = dataset.get(PROCESSED_COUNT_FIELD, 0)
+    return count >= total and not dataset.get("processed", False)
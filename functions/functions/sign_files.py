@@ -1,11 +1,16 @@
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from enum import Enum
-from typing import Dict, Tuple
+from typing import Any, Dict, List, Tuple
 
 import flask
-from google.cloud import storage
+from google.auth.credentials import Signing
+from google.auth.transport.requests import Request
 from loguru import logger
 from utils.auth import decode_auth_header
+from utils.clients import get_storage_client
 from utils.cors import cors_preflight, cors_wrap_abort, cors_wrap_response
 
 
@@ -13,9 +18,24 @@ class UploadTypes(Enum):
     FILES = "files"
 
 
+class UrlTypes(Enum):
+    # A resumable upload session, which the client can query for progress.
+    RESUMABLE = "resumable"
+    # A V4 signed URL for a single PUT of the file.
+    SIGNED = "signed"
+
+
 # Note: Must be in sync with terraform buckets
 BUCKETS = {UploadTypes.FILES: "elpiscloud-user-upload-files"}
 
+# The number of upload URLs to generate concurrently.
+SIGNING_WORKERS = int(os.environ.get("SIGNING_WORKERS", "16"))
+
+# How long signed upload URLs remain valid.
+SIGNED_URL_EXPIRATION = timedelta(
+    minutes=int(os.environ.get("SIGNED_URL_EXPIRATION_MINUTES", "60"))
+)
+
 VALIDATED_USER_INFO = "X-Apigateway-Api-Userinfo"
 
 
@@ -53,33 +73,117 @@ def sign_files(request: flask.Request) -> Tuple[Dict[str, str], int, Dict[str, s
     user_info = json.loads(user_info)
     logger.info("user_info as a Python Object:", str(user_info))
 
-    result = {}
     user_id = user_info.get("user_id")
     origin = request.headers.get("Origin", "*")
     file_names = request.json["file_names"]
 
+    try:
+        url_type = UrlTypes(request.json.get("url_type", UrlTypes.RESUMABLE.value))
+    except ValueError:
+        cors_wrap_abort(400)
+
     # Make signed urls for all filenames in the request
     bucket = BUCKETS[UploadTypes.FILES]
-    for name in file_names:
-        blob_name = f"{user_id}/{name}"
-        result[name] = generate_resumable_upload_url(bucket, blob_name, origin)
+    blob_names = [f"{user_id}/{name}" for name in file_names]
+    urls = generate_upload_urls(bucket, blob_names, origin, url_type)
+    result = dict(zip(file_names, urls))
 
     logger.info("result:", result)
     return cors_wrap_response(result, 200)
 
 
+def generate_upload_urls(
+    bucket_name: str, blob_names: List[str], origin: str, url_type: UrlTypes
+) -> List[str]:
+    """Generates upload urls for some blobs concurrently, with a bounded pool
+    of workers.
+
+    Each resumable url starts an upload session, in a request to storage.
+    Signed urls are computed locally when the credentials hold a private key,
+    and otherwise take a request to the IAM API's signBlob each.
+
+    Parameters:
+        bucket_name (str): The name of the bucket where we want to upload the files.
+        blob_names (List[str]): The eventual paths to the files within the bucket.
+        origin (str): The origin of the request
+        url_type (UrlTypes): The type of upload url to generate.
+
+    Returns:
+        (List[str]): The upload urls, in the order of the blob names.
+    """
+    if len(blob_names) == 0:
+        return []
+
+    if url_type == UrlTypes.SIGNED:
+        signing_options = get_signing_options()
+        generate = lambda name: generate_signed_upload_url(
+            bucket_name, name, signing_options
+        )
+    else:
+        generate = lambda name: generate_resumable_upload_url(bucket_name, name, origin)
+
+    with ThreadPoolExecutor(max_workers=min(SIGNING_WORKERS, len(blob_names))) as pool:
+        return list(pool.map(generate, blob_names))
+
+
+def get_signing_options() -> Dict[str, Any]:
+    """Works out how to sign urls with the storage client's credentials.
+
+    Credentials with a private key sign urls locally. Others (e.g. those of a
+    cloud function's service account) sign through the IAM API, which needs
+    their email and a fresh access token.
+
+    Returns:
+        The keyword arguments to generate signed urls with.
+    """
+    credentials = get_storage_client()._credentials
+    if isinstance(credentials, Signing):
+        return {}
+
+    if not credentials.valid:
+        credentials.refresh(Request())
+    return {
+        "service_account_email": credentials.service_account_email,
+        "access_token": credentials.token,
+    }
+
+
+def generate_signed_upload_url(
+    bucket_name: str, blob_name: str, signing_options: Dict[str, Any]
+) -> str:
+    """Generates a v4 signed URL for uploading a blob in a single HTTP PUT.
+
+    Parameters:
+        bucket_name (str): The name of the bucket where we want to upload the file.
+        blob_name (str): The eventual path to the file within the bucket.
+        signing_options (Dict[str, Any]): How to sign the url, from
+            get_signing_options.
+
+    Returns:
+        (str): The signed upload url.
+    """
+    blob = get_storage_client().bucket(bucket_name).blob(blob_name)
+    return blob.generate_signed_url(
+        version="v4",
+        expiration=SIGNED_URL_EXPIRATION,
+        method="PUT",
+        **signing_options,
+    )
+
+
 def generate_resumable_upload_url(bucket_name: str, blob_name: str, origin: str) -> str:
-    """Generates a v4 signed URL for uploading a blob using HTTP PUT.
+    """Starts a resumable upload session for a blob, which the client uploads
+    to and queries for progress with HTTP PUTs.
 
     Parameters:
         bucket_name (str): The name of the bucket where we want to upload the file.
-        blob_bame (str): The eventual path to the file within the bucket.
+        blob_name (str): The eventual path to the file within the bucket.
         origin (str): The origin of the request
 
     Returns:
-        (str): The signed upload url.
+        (str): The url of the upload session.
     """
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(blob_name)
 
@@ -1,4 +1,15 @@
-from utils.firebase import get_firestore_client
+import os
+from pathlib import PurePosixPath
+from typing import Any, Dict, Optional
+
+import utils.wav as wav
+from loguru import logger
+from utils.clients import get_firestore_client
+from utils.cloud_storage import download_blob_range, open_blob
+from utils.elan import read_tiers
+
+# The size of each ranged read made while streaming an eaf file's tier table.
+EAF_PROBE_CHUNK_SIZE = int(os.environ.get("EAF_PROBE_CHUNK_SIZE", str(256 * 1024)))
 
 
 def storage_watcher(event, context):
@@ -26,9 +37,93 @@ def storage_watcher(event, context):
         "size": size,
         "tags": [],
     }
+    data.update(probe_file(event["bucket"], event["name"], int(size)))
 
     db = get_firestore_client()
     user_ref = db.collection("users").document(uid)
     file_ref = user_ref.collection("files").document(file_name)
 
     file_ref.set(data)
+
+
+def probe_file(bucket_name: str, blob_name: str, size: int) -> Dict[str, Any]:
+    """Reads the properties of an uploaded file needed to plan its
+    processing, so that they don't need to be found by downloading it again.
+
+    Probing is best effort: files which can't be read give no properties.
+
+    Parameters:
+        bucket_name: The ID of the GCS bucket holding the file.
+        blob_name: The path to the file within the bucket.
+        size: The size of the file in bytes.
+
+    Returns:
+        The fields to add to the file's document.
+    """
+    suffix = PurePosixPath(blob_name).suffix.lower()
+    try:
+        if suffix == ".wav":
+            return probe_audio(bucket_name, blob_name, size) or {}
+        if suffix == ".eaf":
+            return probe_elan(bucket_name, blob_name)
+    except Exception as error:
+        logger.warning(f"Couldn't probe {blob_name}: {error}")
+    return {}
+
+
+def probe_audio(
+    bucket_name: str, blob_name: str, size: int
+) -> Optional[Dict[str, Any]]:
+    """Reads the format and duration of a wav file from its header, with a
+    single ranged read.
+
+    Parameters:
+        bucket_name: The ID of the GCS bucket holding the file.
+        blob_name: The path to the file within the bucket.
+        size: The size of the file in bytes.
+
+    Returns:
+        The file's audio properties, or None if it isn't a wav file.
+    """
+    data = download_blob_range(bucket_name, blob_name, 0, wav.HEADER_PROBE_SIZE - 1)
+    header = wav.parse_header(data)
+    if header is None or header.block_align == 0 or header.sample_rate == 0:
+        return None
+
+    # Headers of files written by streaming recorders may overstate (or
+    # leave unset) the size of their data, so clamp it to the file's size.
+    header.data_size = max(0, min(header.data_size, size - header.data_offset))
+    return {
+        "sampleRate": header.sample_rate,
+        "channels": header.num_channels,
+        "bitsPerSample": header.bits_per_sample,
+        "durationMs": header.duration_ms,
+    }
+
+
+def probe_elan(bucket_name: str, blob_name: str) -> Dict[str, Any]:
+    """Reads the tiers and linguistic types of an eaf file, streaming it in
+    ranged reads and discarding its annotations as they're parsed.
+
+    Parameters:
+        bucket_name: The ID of the GCS bucket holding the file.
+        blob_name: The path to the file within the bucket.
+
+    Returns:
+        The file's tiers and linguistic types.
+    """
+    with open_blob(bucket_name, blob_name, EAF_PROBE_CHUNK_SIZE) as stream:
+        table = read_tiers(stream)
+
+    return {
+        "tiers": [
+            {
+                "tierId": tier.tier_id,
+                "linguisticType": tier.linguistic_type,
+                "participant": tier.participant,
+                "order": tier.order,
+            }
+            for tier in table.tiers
+        ],
+        "linguisticTypes": table.linguistic_types,
+    }
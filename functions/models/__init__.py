@@ -1,13 +1,22 @@
 from models.annotation import Annotation
-from models.dataset import Dataset, DatasetOptions, ElanOptions, ProcessingJob
+from models.annotation_batch import AnnotationBatch
+from models.dataset import (
+    Dataset,
+    DatasetOptions,
+    ElanOptions,
+    ProcessingBatch,
+    ProcessingJob,
+)
 from models.elan_tier_selector import TierSelector
 from models.model import Model
 
 __all__ = [
     "Annotation",
+    "AnnotationBatch",
     "Dataset",
     "DatasetOptions",
     "ElanOptions",
+    "ProcessingBatch",
     "ProcessingJob",
     "TierSelector",
     "Model",
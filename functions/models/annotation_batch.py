@@ -0,0 +1,234 @@
+from dataclasses import dataclass, replace
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    overload,
+)
+
+import numpy as np
+from models.annotation import Annotation
+
+# The value stored in the time columns of untimed annotations, and in the
+# code columns of missing values.
+MISSING = -1
+
+
+@dataclass(frozen=True, eq=False)
+class AnnotationBatch:
+    """A class which represents the annotations of a transcription file in
+    columns, rather than as an Annotation per section of speech.
+
+    Times are held in integer arrays, with MISSING for untimed annotations,
+    and the audio file name and speaker columns are interned: each row holds
+    a code into a list of the distinct values. Iterating or indexing a batch
+    gives Annotations, so it can stand in for a list of them.
+    """
+
+    audio_file_names: List[str]
+    audio_file_codes: np.ndarray
+    transcripts: List[str]
+    speakers: List[str]
+    speaker_codes: np.ndarray
+    start_ms: np.ndarray
+    stop_ms: np.ndarray
+
+    @classmethod
+    def from_columns(
+        cls,
+        audio_file_names: Sequence[str],
+        transcripts: List[str],
+        speakers: Optional[Sequence[Optional[str]]] = None,
+        start_ms: Optional[Sequence[Optional[int]]] = None,
+        stop_ms: Optional[Sequence[Optional[int]]] = None,
+    ) -> "AnnotationBatch":
+        """Builds a batch from a column of values per annotation attribute.
+
+        Parameters:
+            audio_file_names: The audio file name of each annotation.
+            transcripts: The transcript of each annotation.
+            speakers: The speaker of each annotation, if any.
+            start_ms: The start time of each annotation, if any.
+            stop_ms: The stop time of each annotation, if any.
+
+        Returns:
+            The batch of annotations.
+        """
+        length = len(transcripts)
+        names, name_codes = _intern(audio_file_names)
+        speaker_values, speaker_codes = _intern(speakers or [None] * length)
+        return cls(
+            audio_file_names=names,
+            audio_file_codes=name_codes,
+            transcripts=transcripts,
+            speakers=speaker_values,
+            speaker_codes=speaker_codes,
+            start_ms=_times(start_ms, length),
+            stop_ms=_times(stop_ms, length),
+        )
+
+    @classmethod
+    def from_annotations(cls, annotations: Iterable[Annotation]) -> "AnnotationBatch":
+        """Builds a batch from some annotations."""
+        if isinstance(annotations, AnnotationBatch):
+            return annotations
+
+        annotations = list(annotations)
+        return cls.from_columns(
+            audio_file_names=[annotation.audio_file_name for annotation in annotations],
+            transcripts=[annotation.transcript for annotation in annotations],
+            speakers=[annotation.speaker_id for annotation in annotations],
+            start_ms=[annotation.start_ms for annotation in annotations],
+            stop_ms=[annotation.stop_ms for annotation in annotations],
+        )
+
+    @classmethod
+    def from_dicts(cls, rows: Sequence[Dict[str, Any]]) -> "AnnotationBatch":
+        """Builds a batch from some annotations' serializable dictionaries,
+        in the shape of Annotation.to_dict.
+        """
+        return cls.from_columns(
+            audio_file_names=[row["audio_file_name"] for row in rows],
+            transcripts=[row["transcript"] for row in rows],
+            speakers=[row.get("speaker_id") for row in rows],
+            start_ms=[row.get("start_ms") for row in rows],
+            stop_ms=[row.get("stop_ms") for row in rows],
+        )
+
+    @classmethod
+    def empty(cls) -> "AnnotationBatch":
+        """Builds a batch with no annotations."""
+        return cls.from_columns(audio_file_names=[], transcripts=[])
+
+    def __len__(self) -> int:
+        return len(self.transcripts)
+
+    @overload
+    def __getitem__(self, index: int) -> Annotation:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "AnnotationBatch":
+        ...
+
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union[Annotation, "AnnotationBatch"]:
+        if isinstance(index, slice):
+            return replace(
+                self,
+                audio_file_codes=self.audio_file_codes[index],
+                transcripts=self.transcripts[index],
+                speaker_codes=self.speaker_codes[index],
+                start_ms=self.start_ms[index],
+                stop_ms=self.stop_ms[index],
+            )
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Annotation index out of range: {index}")
+
+        timed = self.start_ms[index] != MISSING and self.stop_ms[index] != MISSING
+        speaker_code = self.speaker_codes[index]
+        return Annotation(
+            audio_file_name=self.audio_file_names[self.audio_file_codes[index]],
+            transcript=self.transcripts[index],
+            speaker_id=self.speakers[speaker_code] if speaker_code != MISSING else None,
+            start_ms=int(self.start_ms[index]) if timed else None,
+            stop_ms=int(self.stop_ms[index]) if timed else None,
+        )
+
+    def __iter__(self) -> Iterator[Annotation]:
+        return (self[index] for index in range(len(self)))
+
+    def is_timed(self) -> np.ndarray:
+        """Returns a boolean mask of the annotations which exist between a
+        start and stop time.
+        """
+        return (self.start_ms != MISSING) & (self.stop_ms != MISSING)
+
+    def all_timed(self) -> bool:
+        """Returns true iff every annotation in the batch is timed."""
+        return bool(self.is_timed().all())
+
+    def timed_segments(self) -> List[Tuple[int, int, int]]:
+        """Returns (index, start_ms, stop_ms) for each timed annotation, in
+        order, for cutting their audio.
+        """
+        indices = np.flatnonzero(self.is_timed())
+        return list(
+            zip(
+                indices.tolist(),
+                self.start_ms[indices].tolist(),
+                self.stop_ms[indices].tolist(),
+            )
+        )
+
+    def untimed_indices(self) -> List[int]:
+        """Returns the indices of the untimed annotations, in order."""
+        return np.flatnonzero(~self.is_timed()).tolist()
+
+    def with_transcripts(self, transcripts: List[str]) -> "AnnotationBatch":
+        """Returns a batch with the same annotations but new transcripts,
+        sharing the other columns with this batch.
+        """
+        if len(transcripts) != len(self):
+            raise ValueError(
+                f"Expected {len(self)} transcripts, but got {len(transcripts)}"
+            )
+        return replace(self, transcripts=transcripts)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Converts each annotation to a serializable dictionary, in the same
+        shape as Annotation.to_dict, straight from the columns.
+        """
+        # MISSING codes index the None appended to each list of values
+        names = self.audio_file_names + [None]
+        speakers = self.speakers + [None]
+        columns = zip(
+            self.audio_file_codes.tolist(),
+            self.transcripts,
+            self.speaker_codes.tolist(),
+            self.start_ms.tolist(),
+            self.stop_ms.tolist(),
+            self.is_timed().tolist(),
+        )
+        return [
+            {
+                "audio_file_name": names[name_code],
+                "transcript": transcript,
+                "speaker_id": speakers[speaker_code],
+                "start_ms": start_ms if timed else None,
+                "stop_ms": stop_ms if timed else None,
+            }
+            for name_code, transcript, speaker_code, start_ms, stop_ms, timed in columns
+        ]
+
+
+def _intern(values: Sequence[Optional[str]]) -> Tuple[List[str], np.ndarray]:
+    """Splits a column of values into its distinct values, and the code of
+    each row's value (MISSING for None).
+    """
+    distinct: Dict[str, int] = {}
+    codes = np.empty(len(values), dtype=np.int32)
+    for index, value in enumerate(values):
+        codes[index] = (
+            MISSING if value is None else distinct.setdefault(value, len(distinct))
+        )
+    return list(distinct), codes
+
+
+def _times(values: Optional[Sequence[Optional[int]]], length: int) -> np.ndarray:
+    """Builds a time column, with MISSING for missing times."""
+    if values is None:
+        return np.full(length, MISSING, dtype=np.int64)
+    return np.array(
+        [MISSING if value is None else value for value in values], dtype=np.int64
+    )
@@ -1,11 +1,23 @@
 from dataclasses import dataclass, field, fields
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from models.elan_tier_selector import TierSelector
+from utils.firestore_event_converter import unpack
 
 TRANSCRIPTION_EXTENSIONS = {".eaf", ".txt"}
 
+# Fields of a dataset's document tracking its processing: how many of its
+# transcription files there are to process, and how many have been.
+TOTAL_FILES_FIELD = "totalFiles"
+PROCESSED_COUNT_FIELD = "processedCount"
+
+# The subcollection of a dataset's document holding a marker for each of its
+# processed transcription files, so that retried jobs are only counted once.
+# Markers record where the file's outputs were cached, if they were.
+PROCESSED_FILES_COLLECTION = "processedFiles"
+CACHE_PREFIX_FIELD = "cachePrefix"
+
 
 @dataclass
 class ElanOptions:
@@ -37,15 +49,24 @@ class DatasetOptions:
     text_to_remove: List[str] = field(default_factory=list)
     elan_options: Optional[ElanOptions] = None
 
+    # Whether to split untimed recordings longer than max_chunk_ms into a
+    # chunk per line of their transcripts, at the longest pauses in speech.
+    # Chunks are at least min_chunk_ms long, and any still longer than
+    # max_chunk_ms are dropped.
+    split_untimed_audio: bool = False
+    min_chunk_ms: int = 2_000
+    max_chunk_ms: int = 15_000
+
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "DatasetOptions":
+        # Options added since a dataset was created keep their defaults.
         kwargs = {
             field.name: data[field.name]
             for field in fields(DatasetOptions)
-            if field.name != "elan_options"
+            if field.name != "elan_options" and field.name in data
         }
 
-        if "elan_options" in data:
+        if data.get("elan_options") is not None:
             elan_options = ElanOptions.from_dict(data["elan_options"])
         else:
             elan_options = None
@@ -85,6 +106,73 @@ class ProcessingJob:
         return cls(options=options, **kwargs)
 
 
+@dataclass
+class ProcessingBatch:
+    """A class encapsulating several processing jobs which are published and
+    processed together as a single message.
+    """
+
+    jobs: List[ProcessingJob]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"jobs": [job.to_dict() for job in self.jobs]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ProcessingBatch":
+        """Builds a batch from a serialized batch, or from a single serialized
+        processing job.
+        """
+        if "jobs" not in data:
+            return cls(jobs=[ProcessingJob.from_dict(data)])
+        return cls(jobs=[ProcessingJob.from_dict(job) for job in data["jobs"]])
+
+
+@dataclass
+class DatasetIndex:
+    """A class indexing a dataset's file names by their stems, built in a
+    single pass over the files so that each check on the dataset is linear.
+    """
+
+    files: Set[str]
+    # Stem -> the distinct transcription file names with that stem, in the
+    # order they first appear.
+    transcripts: Dict[str, List[str]]
+
+    @classmethod
+    def build(cls, files: List[str]) -> "DatasetIndex":
+        transcripts: Dict[str, List[str]] = {}
+        for file in dict.fromkeys(files):
+            stem, suffix = _split_name(file)
+            if suffix in TRANSCRIPTION_EXTENSIONS:
+                transcripts.setdefault(stem, []).append(file)
+        return cls(files=set(files), transcripts=transcripts)
+
+    def transcript_files(self) -> List[str]:
+        """Returns the distinct transcription file names, in order."""
+        return [file for names in self.transcripts.values() for file in names]
+
+    def mismatched_files(self) -> Set[str]:
+        """Returns the file names which aren't part of a transcript and audio
+        file pair.
+        """
+        matched_files: Set[str] = set()
+        for stem, names in self.transcripts.items():
+            audio_file = f"{stem}.wav"
+            if audio_file in self.files:
+                matched_files.update(names)
+                matched_files.add(audio_file)
+        return self.files.difference(matched_files)
+
+    def colliding_files(self) -> Set[str]:
+        """Returns the transcription file names which share a stem."""
+        return {
+            file
+            for names in self.transcripts.values()
+            if len(names) > 1
+            for file in names
+        }
+
+
 @dataclass
 class Dataset:
     """A class representing an unprocessed dataset within firestore."""
@@ -103,14 +191,17 @@ class Dataset:
         """Returns true iff any of the files in the dataset is an elan file."""
         return any(map((lambda file_name: file_name.endswith(".eaf")), self.files))
 
+    def index(self) -> DatasetIndex:
+        """Indexes the dataset's files by their stems, in a single pass."""
+        return DatasetIndex.build(self.files)
+
     def is_valid(self) -> bool:
         """Returns true iff this dataset is valid for processing."""
-        return (
-            not self.is_empty()
-            and len(self.files) % 2 == 0
-            and len(self.mismatched_files()) == 0
-            and len(self.colliding_files()) == 0
-        )
+        if self.is_empty() or len(self.files) % 2 != 0:
+            return False
+
+        index = self.index()
+        return len(index.mismatched_files()) == 0 and len(index.colliding_files()) == 0
 
     @staticmethod
     def corresponding_audio_file(transcript_file: str) -> str:
@@ -127,17 +218,7 @@ class Dataset:
         Returns:
             A list of the mismatched file names.
         """
-        transcripts_with_audio = set(
-            filter(
-                lambda file: Dataset.corresponding_audio_file(file) in self.files,
-                self._transcript_files(),
-            )
-        )
-        matched_files = transcripts_with_audio | set(
-            Dataset.corresponding_audio_file(file) for file in transcripts_with_audio
-        )
-
-        return set(self.files).difference(matched_files)
+        return self.index().mismatched_files()
 
     def colliding_files(self) -> Set[str]:
         """Returns the list of transcript file names that collide.
@@ -148,21 +229,7 @@ class Dataset:
         Returns:
             A list of the colliding file names.
         """
-
-        def would_collide(transcript_file: str) -> bool:
-            other_files = self._transcript_files().difference({transcript_file})
-            other_file_names = map(lambda file: Path(file).stem, other_files)
-            return Path(transcript_file).stem in other_file_names
-
-        return set(filter(would_collide, self._transcript_files()))
-
-    def _transcript_files(self) -> Set[str]:
-        """Returns a set of all transcription files within the dataset."""
-        return set(
-            filter(
-                lambda file: Path(file).suffix in TRANSCRIPTION_EXTENSIONS, self.files
-            )
-        )
+        return self.index().colliding_files()
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "Dataset":
@@ -174,6 +241,13 @@ class Dataset:
         options = DatasetOptions.from_dict(data["options"])
         return cls(options=options, **kwargs)
 
+    @classmethod
+    def from_firestore_event(cls, data: Dict[str, Any]) -> "Dataset":
+        """Generates a dataset from a google firestore event dictionary
+        representing a dataset document, e.g. the event's value or oldValue.
+        """
+        return cls.from_dict(unpack(data, snake_case=True))
+
     def to_batch(self) -> List["ProcessingJob"]:
         """Converts a valid dataset to a list of processing jobs, matching
         transcript and audio files.
@@ -182,14 +256,26 @@ class Dataset:
             ProcessingJob(
                 dataset_name=self.name,
                 transcription_file_name=transcription_file_name,
-                audio_file_name=self.corresponding_audio_file(transcription_file_name),
+                audio_file_name=f"{stem}.wav",
                 options=self.options,
                 user_id=self.user_id,
             )
-            for transcription_file_name in self._transcript_files()
+            for stem, names in self.index().transcripts.items()
+            for transcription_file_name in names
         ]
 
     def to_dict(self) -> Dict[str, Any]:
         result = dict(self.__dict__)
         result["options"] = self.options.to_dict()
         return result
+
+
+def _split_name(file: str) -> Tuple[str, str]:
+    """Splits a file name into its stem and suffix, as Path(file).stem and
+    Path(file).suffix would, without the cost of building a Path.
+    """
+    name = file.rsplit("/", 1)[-1]
+    dot = name.rfind(".")
+    if 0 < dot < len(name) - 1:
+        return name[:dot], name[dot:]
+    return name, ""
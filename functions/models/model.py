@@ -2,7 +2,6 @@ from dataclasses import dataclass, fields
 from enum import Enum
 from typing import Any, Dict
 
-from humps.main import decamelize
 from utils.firestore_event_converter import unpack
 
 BASE_MODEL = "facebook/wav2vec2-base-960h"
@@ -25,6 +24,8 @@ class TrainingOptions:
     max_duration: int = 60
     word_delimiter_token: str = " "
     test_size: float = 0.2
+    # Seeds the train/test split and training, so runs are reproducible.
+    seed: int = 42
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "TrainingOptions":
@@ -52,7 +53,7 @@ class Model:
         representing changes to a model within firestore.
         """
         # Unpack value dictionary and convert to snake case
-        data = decamelize(unpack(data))
+        data = unpack(data, snake_case=True)
         return cls(
             model_name=data["model_name"],
             dataset_name=data["dataset_name"],
@@ -0,0 +1,60 @@
+from unittest.mock import Mock
+
+import pytest
+from utils.cloud_storage import DeletionReport
+
+from functions.datasets.delete_datasets import delete_dataset_from_bucket
+
+EVENT = {
+    "oldValue": {
+        "fields": {
+            "name": {"stringValue": "dataset"},
+            "userId": {"stringValue": "1"},
+            "files": {"arrayValue": {"values": []}},
+            "options": {"mapValue": {"fields": {}}},
+            "processed": {"booleanValue": True},
+        }
+    }
+}
+
+
+def _mock_markers(mocker, cache_prefixes) -> Mock:
+    """Mocks the markers of the dataset's processed files.
+
+    Returns:
+        The mock of the firestore client.
+    """
+    db = mocker.patch("functions.datasets.delete_datasets.get_firestore_client")
+    markers = [Mock() for _ in cache_prefixes]
+    for marker, cache_prefix in zip(markers, cache_prefixes):
+        marker.to_dict.return_value = {"cachePrefix": cache_prefix}
+    doc_ref = db.return_value.collection.return_value.document.return_value
+    collection = doc_ref.collection.return_value.document.return_value.collection
+    collection.return_value.select.return_value.stream.return_value = markers
+    return db.return_value
+
+
+def test_delete_dataset_from_bucket(mocker):
+    db = _mock_markers(mocker, ["_processing_cache/1/a", None, "_processing_cache/1/a"])
+    evict = mocker.patch("utils.processing_cache.evict")
+    delete = mocker.patch(
+        "functions.datasets.delete_datasets.delete_folder_blob",
+        return_value=DeletionReport(deleted=2, seconds=1, complete=True),
+    )
+
+    delete_dataset_from_bucket(EVENT, None)
+    assert list(evict.call_args.args[1]) == ["_processing_cache/1/a"]
+    db.recursive_delete.assert_called_once()
+    assert delete.call_args.kwargs["target_blob_prefix"] == "1/dataset/"
+
+
+def test_delete_dataset_from_bucket_retries_at_deadline(mocker):
+    _mock_markers(mocker, [])
+    mocker.patch("utils.processing_cache.evict")
+    mocker.patch(
+        "functions.datasets.delete_datasets.delete_folder_blob",
+        return_value=DeletionReport(deleted=2, seconds=1, complete=False),
+    )
+
+    with pytest.raises(TimeoutError):
+        delete_dataset_from_bucket(EVENT, None)
@@ -0,0 +1,93 @@
+from unittest.mock import Mock
+
+from models import DatasetOptions, ProcessingJob
+
+from functions.datasets.process_dataset import (
+    get_audio_sizes,
+    group_jobs,
+    process_dataset,
+)
+
+
+def _job(name: str) -> ProcessingJob:
+    return ProcessingJob(
+        user_id="1",
+        transcription_file_name=f"{name}.eaf",
+        audio_file_name=f"{name}.wav",
+        dataset_name="dataset",
+        options=DatasetOptions(),
+    )
+
+
+JOBS = [_job(name) for name in "abcde"]
+
+
+def test_group_jobs_by_size():
+    sizes = {"a.wav": 40, "b.wav": 40, "c.wav": 40, "d.wav": 250, "e.wav": 10}
+    batches = group_jobs(JOBS, sizes, target_bytes=100, max_jobs=10)
+    assert [[job.audio_file_name for job in batch.jobs] for batch in batches] == [
+        ["a.wav", "b.wav"],
+        ["c.wav"],
+        ["d.wav"],
+        ["e.wav"],
+    ]
+
+
+def test_group_jobs_by_count():
+    sizes = {job.audio_file_name: 1 for job in JOBS}
+    batches = group_jobs(JOBS, sizes, target_bytes=100, max_jobs=2)
+    assert [len(batch.jobs) for batch in batches] == [2, 2, 1]
+
+
+def test_group_jobs_by_expected_seconds(mocker):
+    mocker.patch("functions.datasets.process_dataset.JOB_OVERHEAD_SECONDS", 1)
+    mocker.patch("functions.datasets.process_dataset.JOB_BYTES_PER_SECOND", 10)
+    sizes = {job.audio_file_name: 20 for job in JOBS}
+
+    # Each job is expected to take 3 seconds
+    batches = group_jobs(JOBS, sizes, target_bytes=1000, max_jobs=10, max_seconds=7)
+    assert [len(batch.jobs) for batch in batches] == [2, 2, 1]
+
+
+def test_group_jobs_with_unknown_sizes():
+    batches = group_jobs(JOBS, {}, target_bytes=100, max_jobs=10)
+    assert [len(batch.jobs) for batch in batches] == [1] * len(JOBS)
+
+
+def test_get_audio_sizes(mocker):
+    blobs = [Mock(size=10), Mock(size=20), Mock(size=30)]
+    blobs[0].name = "1/a.wav"
+    blobs[1].name = "1/a.eaf"
+    blobs[2].name = "1/b.wav"
+    list_mock: Mock = mocker.patch(
+        "functions.datasets.process_dataset.list_blobs_with_prefix",
+        return_value=blobs,
+    )
+
+    assert get_audio_sizes("1", JOBS) == {"a.wav": 10, "b.wav": 30}
+    assert list_mock.call_count == 1
+
+
+def test_process_dataset_records_total_files(mocker):
+    db = mocker.patch("functions.datasets.process_dataset.get_firestore_client")
+    publish = mocker.patch("functions.datasets.process_dataset.publish_to_topic")
+    files = ["abui_1.eaf", "abui_1.wav", "abui_2.eaf", "abui_2.wav"]
+    event = {
+        "value": {
+            "fields": {
+                "name": {"stringValue": "dataset"},
+                "userId": {"stringValue": "1"},
+                "files": {
+                    "arrayValue": {"values": [{"stringValue": f} for f in files]}
+                },
+                "options": {"mapValue": {"fields": {}}},
+                "processed": {"booleanValue": False},
+            }
+        }
+    }
+
+    process_dataset(event, None)
+    doc_ref = db.return_value.collection.return_value.document.return_value
+    doc_ref = doc_ref.collection.return_value.document.return_value
+    doc_ref.update.assert_called_once_with({"totalFiles": 2})
+    assert len(list(publish.call_args.kwargs["data"])) == 2
@@ -1,14 +1,35 @@
+import base64
 import json
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
 from pathlib import Path
 from unittest.mock import Mock
 
-from models import Annotation, DatasetOptions, ProcessingJob
+import numpy as np
+import pytest
+from google.api_core.exceptions import AlreadyExists, NotFound
+from models import Annotation, DatasetOptions, ProcessingBatch, ProcessingJob
+from utils.audio import read_samples, write_samples
+from utils.shards import read_shard_index
 
 from functions.datasets.process_file import (
+    DATASET_BUCKET,
+    DatasetDeleted,
     clean_annotation,
     download_files,
+    generate_shard,
+    generate_segment_files,
+    generate_shard_in_memory,
+    generate_training_buffers,
     generate_training_files,
+    get_cache_prefix,
     has_finished_processing,
+    is_expired,
+    post_processing_hook,
+    process_dataset_file,
+    process_job,
+    record_processed_file,
+    split_untimed_annotations,
 )
 
 TEST_ANNOTATION = Annotation(audio_file_name="test.wav", transcript="hi")
@@ -28,6 +49,8 @@ TEST_JOB = ProcessingJob(
 )
 
 
+DATA_DIR = Path(__file__).parent.parent / "data"
+
 ABUI_DATASET_FILES = ["abui_1.eaf", "abui_1.wav", "abui_2.eaf", "abui_2.wav"]
 
 
@@ -54,11 +77,11 @@ def test_clean_annotation(mocker):
 
 
 def test_generate_training_files_with_untimed_annotation(tmp_path: Path, mocker):
-    cut_mock: Mock = mocker.patch("functions.datasets.process_file.audio.cut")
+    cut_mock: Mock = mocker.patch("functions.datasets.process_file.audio.cut_many")
     audio_file = tmp_path / "test.wav"
 
     transcription, audio = generate_training_files(
-        TEST_ANNOTATION, audio_file, tmp_path
+        [TEST_ANNOTATION], audio_file, tmp_path
     )
     cut_mock.assert_not_called()
     assert transcription == tmp_path / "test.json"
@@ -69,11 +92,12 @@ def test_generate_training_files_with_untimed_annotation(tmp_path: Path, mocker)
 
 
 def test_generate_training_files_with_timed_annotation(tmp_path: Path, mocker):
-    cut_mock: Mock = mocker.patch("functions.datasets.process_file.audio.cut")
+    cut_mock: Mock = mocker.patch("functions.datasets.process_file.audio.cut_many")
+    cut_mock.side_effect = lambda _, segments: (path for path, *_ in segments)
     audio_file = tmp_path / "test.wav"
 
     transcription, audio = generate_training_files(
-        TEST_ANNOTATION_TIMED, audio_file, tmp_path
+        [TEST_ANNOTATION_TIMED], audio_file, tmp_path
     )
     cut_mock.assert_called_once()
     assert transcription == tmp_path / f"test_{TEST_ANNOTATION_TIMED.start_ms}.json"
@@ -83,40 +107,372 @@ def test_generate_training_files_with_timed_annotation(tmp_path: Path, mocker):
         assert Annotation.from_dict(json.load(f)) == TEST_ANNOTATION_TIMED
 
 
+def test_generate_training_files_cuts_audio_once(tmp_path: Path, mocker):
+    cut_mock: Mock = mocker.patch("functions.datasets.process_file.audio.cut_many")
+    cut_mock.side_effect = lambda _, segments: (path for path, *_ in segments)
+    audio_file = tmp_path / "test.wav"
+    annotations = [
+        Annotation(
+            audio_file_name="test.wav",
+            transcript="hi",
+            start_ms=start_ms,
+            stop_ms=start_ms + 500,
+        )
+        for start_ms in (0, 1000, 2000)
+    ]
+
+    files = list(generate_training_files(annotations, audio_file, tmp_path))
+    cut_mock.assert_called_once()
+    assert len(files) == 6
+    assert {file.suffix for file in files} == {".json", ".wav"}
+
+
+def test_generate_training_files_with_sample_rate_resamples_segments(
+    tmp_path: Path, mocker
+):
+    cut_mock: Mock = mocker.patch("functions.datasets.process_file.audio.cut_many")
+    resampled_cut_mock: Mock = mocker.patch(
+        "functions.datasets.process_file.audio.cut_many_resampled"
+    )
+    resampled_cut_mock.side_effect = lambda *args, **kwargs: iter([])
+    audio_file = tmp_path / "test.wav"
+
+    list(
+        generate_training_files(
+            [TEST_ANNOTATION_TIMED], audio_file, tmp_path, sample_rate=16_000
+        )
+    )
+    cut_mock.assert_not_called()
+    resampled_cut_mock.assert_called_once()
+    assert resampled_cut_mock.call_args.args[2] == 16_000
+
+
+def test_generate_shard(tmp_path: Path):
+    audio_file = DATA_DIR / "test.wav"
+    annotations = [TEST_ANNOTATION_TIMED, TEST_ANNOTATION]
+
+    shard = generate_shard(annotations, audio_file, tmp_path)
+    assert shard == tmp_path / "test.tar"
+
+    index = read_shard_index(shard)
+    assert [Annotation.from_dict(entry) for entry in index] == annotations
+    assert index[0]["frames"] == 16_000
+    assert index[1]["offset"] == 16_000
+
+
+def test_generate_training_buffers():
+    audio_file = BytesIO((DATA_DIR / "test.wav").read_bytes())
+    annotations = [TEST_ANNOTATION, TEST_ANNOTATION_TIMED]
+
+    files = dict(generate_training_buffers(annotations, audio_file, "test.wav"))
+    assert set(files) == {"test.json", "test.wav", "test_0.json", "test_0.wav"}
+    assert json.loads(files["test_0.json"].read()) == TEST_ANNOTATION_TIMED.to_dict()
+    assert files["test.wav"].read() == audio_file.getvalue()
+
+    samples, sample_rate = read_samples(files["test_0.wav"])
+    assert samples.shape == (1, 16_000)
+    assert sample_rate == 16_000
+
+
+def test_generate_shard_in_memory():
+    audio_file = BytesIO((DATA_DIR / "test.wav").read_bytes())
+    annotations = [TEST_ANNOTATION_TIMED, TEST_ANNOTATION]
+
+    name, shard = generate_shard_in_memory(annotations, audio_file, "test.wav")
+    assert name == "test.tar"
+
+    index = read_shard_index(shard)
+    assert [Annotation.from_dict(entry) for entry in index] == annotations
+    assert index[0]["frames"] == 16_000
+    assert index[1]["offset"] == 16_000
+
+
+def test_generate_segment_files(tmp_path: Path):
+    samples = np.zeros((1, 16_000), dtype=np.int16)
+    entries = [(TEST_ANNOTATION_TIMED.to_dict(), samples, 16_000)]
+
+    files = list(generate_segment_files(entries, "test.wav", tmp_path))
+    assert files == [tmp_path / "test_0.json", tmp_path / "test_0.wav"]
+    assert read_samples(files[1])[0].shape == (1, 16_000)
+
+    buffers = dict(generate_segment_files(entries, "test.wav"))
+    assert json.loads(buffers["test_0.json"].read()) == TEST_ANNOTATION_TIMED.to_dict()
+    assert read_samples(buffers["test_0.wav"])[0].shape == (1, 16_000)
+
+
+def test_split_untimed_annotations(tmp_path: Path):
+    options = DatasetOptions(
+        split_untimed_audio=True, min_chunk_ms=500, max_chunk_ms=2_000
+    )
+    audio_file = tmp_path / "test.wav"
+    noise = (np.random.default_rng(0).standard_normal((1, 16_000)) * 8_000).astype(
+        np.int16
+    )
+    silence = np.zeros((1, 16_000), dtype=np.int16)
+    write_samples(audio_file, np.concatenate([noise, silence, noise], axis=1), 16_000)
+
+    annotation = Annotation(audio_file_name="test.wav", transcript="a b\nc d")
+    annotations = [annotation, TEST_ANNOTATION_TIMED]
+
+    result = split_untimed_annotations(annotations, audio_file, options)
+    assert result[-1] == TEST_ANNOTATION_TIMED
+    assert [chunk.transcript for chunk in result[:-1]] == ["a b", "c d"]
+    assert all(chunk.is_timed() for chunk in result)
+    assert 1_000 <= result[0].stop_ms <= 2_000  # type: ignore
+
+
+def test_get_cache_prefix(mocker):
+    mocker.patch("functions.datasets.process_file.PROCESSING_CACHE_ENABLED", True)
+    checksum_mock: Mock = mocker.patch(
+        "functions.datasets.process_file.get_blob_checksum"
+    )
+    checksum_mock.return_value = "abc"
+    prefix = get_cache_prefix(TEST_JOB)
+    assert prefix is not None
+    assert prefix.startswith(f"_processing_cache/{TEST_JOB.user_id}/")
+
+    # Jobs with different options shouldn't share outputs
+    other_job = ProcessingJob.from_dict(TEST_JOB.to_dict())
+    other_job.options.text_to_remove = ["um"]
+    assert get_cache_prefix(other_job) != prefix
+
+    # Nor should jobs whose files have changed
+    checksum_mock.return_value = "def"
+    assert get_cache_prefix(TEST_JOB) != prefix
+
+
+def test_get_cache_prefix_with_missing_files(mocker):
+    mocker.patch("functions.datasets.process_file.PROCESSING_CACHE_ENABLED", True)
+    mocker.patch("functions.datasets.process_file.get_blob_checksum", return_value=None)
+    assert get_cache_prefix(TEST_JOB) is None
+
+
 def test_has_finished_processing():
-    processed_files = ["abui_1.json", "abui_1.wav", "abui_2.json", "abui_2.wav"]
-    assert has_finished_processing(ABUI_DATASET_FILES, processed_files)
+    dataset = {"totalFiles": 2, "processedCount": 1, "processed": False}
+    assert not has_finished_processing(dataset)
 
 
-def test_has_finished_procesing_with_path_prefixes():
-    processed_files = ["abui_1.json", "abui_1.wav", "abui_2.json", "abui_2.wav"]
-    prefix = "someUserId/datasetName/"
-    processed_files = [prefix + name for name in processed_files]
-    assert has_finished_processing(ABUI_DATASET_FILES, processed_files)
+def test_has_finished_processing_for_last_file():
+    dataset = {"totalFiles": 2, "processedCount": 2, "processed": False}
+    assert has_finished_processing(dataset)
 
 
-def test_has_finished_processing_with_incomplete_files_should_return_false():
-    processed_files = ["abui_1.json", "abui_1.wav"]
-    assert not has_finished_processing(ABUI_DATASET_FILES, processed_files)
+def test_has_finished_processing_for_processed_dataset():
+    dataset = {"totalFiles": 2, "processedCount": 2, "processed": True}
+    assert not has_finished_processing(dataset)
 
 
-def test_has_finished_processing_with_timed_annotations():
-    processed_files = [
-        "abui_1.json",
-        "abui_1.wav",
-        "abui_2_1000.json",
-        "abui_2_1000.wav",
-    ]
-    assert has_finished_processing(ABUI_DATASET_FILES, processed_files)
+def test_has_finished_processing_counts_files_without_total():
+    dataset = {"files": ABUI_DATASET_FILES, "processedCount": 2, "processed": False}
+    assert has_finished_processing(dataset)
 
 
-def test_has_finished_processing_with_timed_and_multiple_annotations():
-    processed_files = [
-        "abui_1.json",
-        "abui_1.wav",
-        "abui_2_1000.json",
-        "abui_2_1000.wav",
-        "abui_2_3000.json",
-        "abui_2_3000.wav",
-    ]
-    assert has_finished_processing(ABUI_DATASET_FILES, processed_files)
+def test_record_processed_file():
+    db, doc_ref = Mock(), Mock()
+    assert record_processed_file(db, doc_ref, TEST_JOB)
+
+    batch = db.batch.return_value
+    marker_ref = doc_ref.collection.return_value.document.return_value
+    doc_ref.collection.assert_called_once_with("processedFiles")
+    doc_ref.collection.return_value.document.assert_called_once_with("test.eaf")
+    assert batch.create.call_args.args[0] == marker_ref
+    assert batch.update.call_args.args[0] == doc_ref
+    batch.commit.assert_called_once()
+
+
+def test_record_processed_file_records_cache_prefix():
+    db = Mock()
+    record_processed_file(db, Mock(), TEST_JOB, "_processing_cache/1/key")
+    marker = db.batch.return_value.create.call_args.args[1]
+    assert marker["cachePrefix"] == "_processing_cache/1/key"
+
+
+def test_record_processed_file_counts_retried_files_once():
+    db = Mock()
+    db.batch.return_value.commit.side_effect = AlreadyExists("marker exists")
+    assert not record_processed_file(db, Mock(), TEST_JOB)
+
+
+def test_record_processed_file_for_deleted_dataset():
+    db = Mock()
+    db.batch.return_value.commit.side_effect = NotFound("no dataset")
+    with pytest.raises(DatasetDeleted):
+        record_processed_file(db, Mock(), TEST_JOB)
+
+
+def _mock_progress(mocker, dataset: dict) -> Mock:
+    """Mocks firestore with a dataset document with the given progress.
+
+    Returns:
+        The mock of the dataset's document.
+    """
+    db = mocker.patch("functions.datasets.process_file.get_firestore_client")
+    doc_ref = db.return_value.collection.return_value.document.return_value
+    doc_ref = doc_ref.collection.return_value.document.return_value
+    doc_ref.get.return_value.to_dict.return_value = dataset
+    mocker.patch("functions.datasets.process_file.record_processed_file")
+    return doc_ref
+
+
+def test_post_processing_hook_merges_finished_dataset(mocker):
+    _mock_progress(mocker, {"totalFiles": 2, "processedCount": 2})
+    mark = mocker.patch(
+        "functions.datasets.process_file.mark_dataset_processed", return_value=True
+    )
+    merge = mocker.patch("utils.manifest.merge", return_value=2)
+
+    post_processing_hook(TEST_JOB)
+    mark.assert_called_once()
+    merge.assert_called_once()
+
+
+def test_post_processing_hook_skips_unfinished_dataset(mocker):
+    _mock_progress(mocker, {"totalFiles": 2, "processedCount": 1})
+    mark = mocker.patch("functions.datasets.process_file.mark_dataset_processed")
+
+    post_processing_hook(TEST_JOB)
+    mark.assert_not_called()
+
+
+def test_post_processing_hook_unmarks_dataset_if_merge_fails(mocker):
+    doc_ref = _mock_progress(mocker, {"totalFiles": 2, "processedCount": 2})
+    mocker.patch(
+        "functions.datasets.process_file.mark_dataset_processed", return_value=True
+    )
+    mocker.patch("utils.manifest.merge", side_effect=IOError("merge failed"))
+
+    with pytest.raises(IOError):
+        post_processing_hook(TEST_JOB)
+    doc_ref.update.assert_called_once_with({"processed": False})
+
+
+def _event(data) -> dict:
+    return {"data": base64.b64encode(json.dumps(data).encode("utf-8"))}
+
+
+def test_process_dataset_file_with_single_job(mocker):
+    process_mock: Mock = mocker.patch("functions.datasets.process_file.process_job")
+    process_dataset_file(_event(TEST_JOB.to_dict()), None)
+    process_mock.assert_called_once_with(TEST_JOB)
+
+
+OTHER_JOB = ProcessingJob.from_dict(
+    {**TEST_JOB.to_dict(), "transcription_file_name": "other.eaf"}
+)
+
+
+def test_process_dataset_file_with_batch(mocker):
+    process_mock: Mock = mocker.patch("functions.datasets.process_file.process_job")
+    batch = ProcessingBatch(jobs=[TEST_JOB, OTHER_JOB])
+
+    process_dataset_file(_event(batch.to_dict()), None)
+    assert [call.args[0] for call in process_mock.call_args_list] == batch.jobs
+
+
+def test_process_dataset_file_republishes_failed_jobs(mocker):
+    mocker.patch(
+        "functions.datasets.process_file.process_job",
+        side_effect=[IOError("failed"), None],
+    )
+    publish_mock: Mock = mocker.patch(
+        "functions.datasets.process_file.publish_to_topic", return_value=1
+    )
+    batch = ProcessingBatch(jobs=[TEST_JOB, OTHER_JOB])
+
+    process_dataset_file(_event(batch.to_dict()), None)
+    assert list(publish_mock.call_args.args[1]) == [TEST_JOB.to_dict()]
+
+
+def test_process_dataset_file_retries_batch_if_republishing_fails(mocker):
+    mocker.patch(
+        "functions.datasets.process_file.process_job", side_effect=IOError("failed")
+    )
+    mocker.patch("functions.datasets.process_file.publish_to_topic", return_value=1)
+    batch = ProcessingBatch(jobs=[TEST_JOB, OTHER_JOB])
+
+    with pytest.raises(RuntimeError):
+        process_dataset_file(_event(batch.to_dict()), None)
+
+
+def test_process_dataset_file_fails_single_job(mocker):
+    mocker.patch(
+        "functions.datasets.process_file.process_job", side_effect=IOError("failed")
+    )
+    publish_mock: Mock = mocker.patch(
+        "functions.datasets.process_file.publish_to_topic"
+    )
+
+    with pytest.raises(IOError):
+        process_dataset_file(_event(TEST_JOB.to_dict()), None)
+    publish_mock.assert_not_called()
+
+
+def test_process_dataset_file_drops_terminal_failures(mocker):
+    mocker.patch(
+        "functions.datasets.process_file.process_job",
+        side_effect=[ValueError("not audio"), NotFound("no dataset")],
+    )
+    publish_mock: Mock = mocker.patch(
+        "functions.datasets.process_file.publish_to_topic"
+    )
+
+    process_dataset_file(_event(TEST_JOB.to_dict()), None)
+    process_dataset_file(_event(TEST_JOB.to_dict()), None)
+    publish_mock.assert_not_called()
+
+
+def test_process_dataset_file_drops_terminal_failures_in_batch(mocker):
+    mocker.patch(
+        "functions.datasets.process_file.process_job",
+        side_effect=[ValueError("not audio"), IOError("failed")],
+    )
+    publish_mock: Mock = mocker.patch(
+        "functions.datasets.process_file.publish_to_topic", return_value=1
+    )
+    batch = ProcessingBatch(jobs=[TEST_JOB, OTHER_JOB])
+
+    process_dataset_file(_event(batch.to_dict()), None)
+    assert list(publish_mock.call_args.args[1]) == [OTHER_JOB.to_dict()]
+
+
+def test_process_dataset_file_drops_expired_events(mocker):
+    process_mock: Mock = mocker.patch("functions.datasets.process_file.process_job")
+    context = Mock(event_id="1", timestamp="2020-01-01T00:00:00.000Z")
+
+    process_dataset_file(_event(TEST_JOB.to_dict()), context)
+    process_mock.assert_not_called()
+
+
+def test_is_expired():
+    now = datetime.now(timezone.utc)
+    assert not is_expired(None)
+    assert not is_expired(Mock(timestamp=now.isoformat()))
+    assert is_expired(Mock(timestamp=(now - timedelta(days=2)).isoformat()))
+
+
+def test_process_job_skips_deleted_dataset(mocker):
+    dataset_ref = mocker.patch("functions.datasets.process_file.get_dataset_ref")
+    dataset_ref.return_value.get.return_value.exists = False
+    process_mock: Mock = mocker.patch("functions.datasets.process_file.process_files")
+
+    process_job(TEST_JOB)
+    process_mock.assert_not_called()
+
+
+def test_process_job_removes_outputs_of_deleted_dataset(mocker):
+    mocker.patch("functions.datasets.process_file.get_dataset_ref")
+    mocker.patch("functions.datasets.process_file.get_cache_prefix", return_value=None)
+    mocker.patch("functions.datasets.process_file.process_files", return_value=[])
+    mocker.patch(
+        "functions.datasets.process_file.post_processing_hook",
+        side_effect=DatasetDeleted("deleted"),
+    )
+    delete_mock: Mock = mocker.patch(
+        "functions.datasets.process_file.delete_folder_blob"
+    )
+
+    with pytest.raises(DatasetDeleted):
+        process_job(TEST_JOB)
+    delete_mock.assert_called_once_with(
+        DATASET_BUCKET, f"{TEST_JOB.user_id}/{TEST_JOB.dataset_name}/"
+    )
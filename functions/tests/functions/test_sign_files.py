@@ -0,0 +1,70 @@
+from unittest.mock import Mock
+
+from google.auth.credentials import Signing
+
+from functions.sign_files import (
+    SIGNED_URL_EXPIRATION,
+    UrlTypes,
+    generate_signed_upload_url,
+    generate_upload_urls,
+    get_signing_options,
+)
+
+NAMES = [f"1/{index}.wav" for index in range(20)]
+
+
+def test_generate_resumable_upload_urls(mocker):
+    generate_mock: Mock = mocker.patch(
+        "functions.sign_files.generate_resumable_upload_url",
+        side_effect=lambda bucket, name, origin: f"{origin}/{name}",
+    )
+
+    urls = generate_upload_urls("bucket", NAMES, "origin", UrlTypes.RESUMABLE)
+    assert urls == [f"origin/{name}" for name in NAMES]
+    assert generate_mock.call_count == len(NAMES)
+
+
+def test_generate_signed_upload_urls(mocker):
+    mocker.patch("functions.sign_files.get_signing_options", return_value={})
+    generate_mock: Mock = mocker.patch(
+        "functions.sign_files.generate_signed_upload_url",
+        side_effect=lambda bucket, name, options: f"signed/{name}",
+    )
+
+    urls = generate_upload_urls("bucket", NAMES, "origin", UrlTypes.SIGNED)
+    assert urls == [f"signed/{name}" for name in NAMES]
+    assert generate_mock.call_count == len(NAMES)
+
+
+def test_generate_no_upload_urls():
+    assert generate_upload_urls("bucket", [], "origin", UrlTypes.SIGNED) == []
+
+
+def test_signing_options_with_private_key(mocker):
+    client = Mock()
+    client._credentials = Mock(spec=Signing)
+    mocker.patch("functions.sign_files.get_storage_client", return_value=client)
+    assert get_signing_options() == {}
+
+
+def test_signing_options_without_private_key(mocker):
+    client = Mock()
+    client._credentials = Mock(valid=True, service_account_email="a@b", token="t")
+    mocker.patch("functions.sign_files.get_storage_client", return_value=client)
+    assert get_signing_options() == {
+        "service_account_email": "a@b",
+        "access_token": "t",
+    }
+
+
+def test_generate_signed_upload_url(mocker):
+    client = mocker.patch("functions.sign_files.get_storage_client").return_value
+    blob = client.bucket.return_value.blob.return_value
+    blob.generate_signed_url.return_value = "signed"
+    options = {"service_account_email": "a@b", "access_token": "t"}
+
+    assert generate_signed_upload_url("bucket", "1/test.wav", options) == "signed"
+    client.bucket.return_value.blob.assert_called_once_with("1/test.wav")
+    blob.generate_signed_url.assert_called_once_with(
+        version="v4", expiration=SIGNED_URL_EXPIRATION, method="PUT", **options
+    )
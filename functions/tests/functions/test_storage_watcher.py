@@ -0,0 +1,78 @@
+from pathlib import Path
+from unittest.mock import Mock
+
+from functions.storage_watcher import probe_file, storage_watcher
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+
+TEST_EVENT = {
+    "bucket": "bucket",
+    "name": "uid/test.wav",
+    "contentType": "audio/wav",
+    "timeCreated": "2022-01-01T00:00:00.000Z",
+    "size": "84218",
+}
+
+
+def _ranged_read(path: Path):
+    data = path.read_bytes()
+    return lambda bucket, blob, start, end: data[start : end + 1]
+
+
+def test_probe_audio(mocker):
+    wav_file = DATA_DIR / "test.wav"
+    mocker.patch(
+        "functions.storage_watcher.download_blob_range",
+        side_effect=_ranged_read(wav_file),
+    )
+
+    fields = probe_file("bucket", "uid/test.wav", wav_file.stat().st_size)
+    assert fields == {
+        "sampleRate": 16_000,
+        "channels": 1,
+        "bitsPerSample": 16,
+        "durationMs": 2_630,
+    }
+
+
+def test_probe_audio_clamps_duration_to_file_size(mocker):
+    wav_file = DATA_DIR / "test.wav"
+    mocker.patch(
+        "functions.storage_watcher.download_blob_range",
+        side_effect=_ranged_read(wav_file),
+    )
+
+    # A second of 16kHz, 16 bit mono audio is 32,000 bytes
+    truncated = wav_file.stat().st_size - 32_000
+    assert probe_file("bucket", "uid/test.wav", truncated)["durationMs"] == 1_630
+
+
+def test_probe_elan(mocker):
+    open_mock: Mock = mocker.patch("functions.storage_watcher.open_blob")
+    open_mock.side_effect = lambda *args: open(DATA_DIR / "test.eaf", "rb")
+
+    fields = probe_file("bucket", "uid/test.eaf", 0)
+    assert [tier["order"] for tier in fields["tiers"]] == [1, 2, 3]
+    assert fields["tiers"][0]["participant"] == "SL"
+    assert fields["linguisticTypes"] == ["default-lt"]
+
+
+def test_probe_file_ignores_unreadable_files(mocker):
+    mocker.patch(
+        "functions.storage_watcher.download_blob_range", side_effect=IOError("nope")
+    )
+    assert probe_file("bucket", "uid/test.wav", 100) == {}
+    assert probe_file("bucket", "uid/notes.txt", 100) == {}
+
+
+def test_storage_watcher_stores_probed_fields(mocker):
+    mocker.patch(
+        "functions.storage_watcher.probe_file", return_value={"durationMs": 1_000}
+    )
+    db_mock: Mock = mocker.patch("functions.storage_watcher.get_firestore_client")
+
+    storage_watcher(TEST_EVENT, None)
+    file_ref = db_mock().collection().document().collection().document()
+    data = file_ref.set.call_args.args[0]
+    assert data["fileName"] == "test.wav"
+    assert data["durationMs"] == 1_000
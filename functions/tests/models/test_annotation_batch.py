@@ -0,0 +1,64 @@
+from models import Annotation, AnnotationBatch
+
+ANNOTATIONS = [
+    Annotation(
+        audio_file_name="test.wav",
+        transcript="hello",
+        speaker_id="SL",
+        start_ms=0,
+        stop_ms=1000,
+    ),
+    Annotation(audio_file_name="test.wav", transcript="there"),
+    Annotation(
+        audio_file_name="test.wav",
+        transcript="friend",
+        speaker_id="SL",
+        start_ms=2000,
+        stop_ms=3000,
+    ),
+]
+
+
+def test_batch_round_trips_annotations():
+    batch = AnnotationBatch.from_annotations(ANNOTATIONS)
+    assert len(batch) == 3
+    assert list(batch) == ANNOTATIONS
+    assert batch[-1] == ANNOTATIONS[-1]
+    assert list(batch[1:]) == ANNOTATIONS[1:]
+
+
+def test_batch_interns_columns():
+    batch = AnnotationBatch.from_annotations(ANNOTATIONS)
+    assert batch.audio_file_names == ["test.wav"]
+    assert batch.speakers == ["SL"]
+    assert batch.speaker_codes.tolist() == [0, -1, 0]
+
+
+def test_batch_to_dicts_matches_annotations():
+    batch = AnnotationBatch.from_annotations(ANNOTATIONS)
+    assert batch.to_dicts() == [annotation.to_dict() for annotation in ANNOTATIONS]
+
+
+def test_batch_timing():
+    batch = AnnotationBatch.from_annotations(ANNOTATIONS)
+    assert not batch.all_timed()
+    assert batch.timed_segments() == [(0, 0, 1000), (2, 2000, 3000)]
+    assert batch.untimed_indices() == [1]
+    assert AnnotationBatch.empty().all_timed()
+
+
+def test_batch_with_transcripts():
+    batch = AnnotationBatch.from_annotations(ANNOTATIONS)
+    result = batch.with_transcripts(["a", "b", "c"])
+    assert [annotation.transcript for annotation in result] == ["a", "b", "c"]
+    assert result.start_ms is batch.start_ms
+    assert [annotation.transcript for annotation in batch] == [
+        "hello",
+        "there",
+        "friend",
+    ]
+
+
+def test_batch_from_dicts():
+    rows = [annotation.to_dict() for annotation in ANNOTATIONS]
+    assert list(AnnotationBatch.from_dicts(rows)) == ANNOTATIONS
@@ -1,4 +1,13 @@
-from models import Dataset, DatasetOptions, ElanOptions, ProcessingJob, TierSelector
+from models import (
+    Dataset,
+    DatasetOptions,
+    ElanOptions,
+    ProcessingBatch,
+    ProcessingJob,
+    TierSelector,
+)
+from humps.main import camelize
+from models.dataset import DatasetIndex
 from pytest import raises
 
 # ====== Elan Options ======
@@ -38,6 +47,9 @@ VALID_DATASET_OPTIONS_WITHOUT_ELAN_DICT = {
     "punctuation_to_remove": ":",
     "punctuation_to_explode": ";",
     "text_to_remove": ["<UNK>"],
+    "split_untimed_audio": True,
+    "min_chunk_ms": 1_000,
+    "max_chunk_ms": 10_000,
 }
 
 VALID_DATASET_OPTIONS_DICT = VALID_DATASET_OPTIONS_WITHOUT_ELAN_DICT | {
@@ -70,12 +82,27 @@ def test_build_dataset_options_without_elan():
     assert options.elan_options is None
 
 
+def test_build_dataset_options_without_chunk_options():
+    options = DatasetOptions.from_dict({"punctuation_to_remove": ":"})
+    assert options.punctuation_to_remove == ":"
+    assert options.split_untimed_audio is False
+    assert options.max_chunk_ms == DatasetOptions().max_chunk_ms
+
+
+def test_dataset_options_round_trip_without_elan():
+    options = DatasetOptions(punctuation_to_remove=":")
+    assert DatasetOptions.from_dict(options.to_dict()) == options
+
+
 def test_serialize_dataset_options():
     options = DatasetOptions(
         punctuation_to_remove=":",
         punctuation_to_explode=";",
         text_to_remove=["<UNK>"],
         elan_options=ElanOptions.from_dict(VALID_ELAN_OPTIONS_DICT),
+        split_untimed_audio=True,
+        min_chunk_ms=1_000,
+        max_chunk_ms=10_000,
     )
     assert options.to_dict() == VALID_DATASET_OPTIONS_DICT
 
@@ -105,6 +132,28 @@ def test_build_dataset():
     assert dataset.processed == False
 
 
+def _to_firestore_value(value):
+    if isinstance(value, dict):
+        fields = {camelize(key): _to_firestore_value(v) for key, v in value.items()}
+        return {"mapValue": {"fields": fields}}
+    if isinstance(value, list):
+        return {"arrayValue": {"values": [_to_firestore_value(v) for v in value]}}
+    if isinstance(value, bool):
+        return {"booleanValue": value}
+    if isinstance(value, int):
+        return {"integerValue": str(value)}
+    return {"stringValue": value}
+
+
+def test_build_dataset_from_firestore_event():
+    event_value = {
+        "name": "projects/p/databases/(default)/documents/users/1/datasets/dataset",
+        "fields": _to_firestore_value(VALID_DATASET_DICT)["mapValue"]["fields"],
+    }
+    dataset = Dataset.from_firestore_event(event_value)
+    assert dataset == Dataset.from_dict(VALID_DATASET_DICT)
+
+
 def test_serialize_dataset():
     dataset = Dataset.from_dict(VALID_DATASET_DICT)
     assert dataset.to_dict() == VALID_DATASET_DICT
@@ -155,6 +204,31 @@ def test_dataset_batching():
     assert job.options == dataset.options
 
 
+def test_dataset_index():
+    index = DatasetIndex.build(["1.eaf", "1.wav", "2.txt", "2.wav", "1.eaf"])
+    assert index.transcript_files() == ["1.eaf", "2.txt"]
+    assert index.mismatched_files() == set()
+    assert index.colliding_files() == set()
+
+
+def test_dataset_index_matches_dataset_checks():
+    for files in [FILES_WITH_ELAN, MISMATCHED_FILES, COLLIDING_FILES]:
+        dataset = Dataset.from_dict({**VALID_DATASET_DICT, "files": files})
+        index = dataset.index()
+        assert index.mismatched_files() == dataset.mismatched_files()
+        assert index.colliding_files() == dataset.colliding_files()
+        assert len(dataset.to_batch()) == len(index.transcript_files())
+
+
+def test_dataset_is_valid():
+    dataset = Dataset.from_dict(VALID_DATASET_DICT)
+    assert dataset.is_valid()
+
+    for files in [[], MISMATCHED_FILES, COLLIDING_FILES, ["1.eaf", "2.wav"]]:
+        dataset.files = files
+        assert not dataset.is_valid()
+
+
 # ====== Processing Job ======
 VALID_JOB_DICT = {
     "user_id": VALID_DATASET_DICT["user_id"],
@@ -177,3 +251,14 @@ def test_build_processing_job():
 def test_serialize_processing_job():
     job = ProcessingJob.from_dict(VALID_JOB_DICT)
     assert job.to_dict() == VALID_JOB_DICT
+
+
+def test_processing_batch_round_trip():
+    job = ProcessingJob.from_dict(VALID_JOB_DICT)
+    batch = ProcessingBatch(jobs=[job, job])
+    assert ProcessingBatch.from_dict(batch.to_dict()) == batch
+
+
+def test_processing_batch_from_single_job():
+    batch = ProcessingBatch.from_dict(VALID_JOB_DICT)
+    assert batch.jobs == [ProcessingJob.from_dict(VALID_JOB_DICT)]
@@ -1,8 +1,23 @@
 import wave
+from io import BytesIO
 from pathlib import Path
 
+import numpy as np
 from loguru import logger
-from utils.audio import cut, get_sample_rate, resample
+from utils.audio import (
+    NormalizationAction,
+    ResampleQuality,
+    cut,
+    encode_samples,
+    cut_many,
+    cut_many_resampled,
+    get_sample_rate,
+    normalize,
+    normalize_in_memory,
+    plan_normalization,
+    read_samples,
+    resample,
+)
 
 DATA_DIR = Path(__file__).parent.parent / "data"
 TARGET_SAMPLE_RATE = 23_000
@@ -46,3 +61,163 @@ def test_resample(tmp_path: Path):
 def test_get_sample_rate():
     audio = DATA_DIR / "test.wav"
     assert get_sample_rate(audio) == 16_000
+
+
+def test_cut_many(tmp_path: Path):
+    audio = DATA_DIR / "test.wav"
+    segments = [
+        (tmp_path / f"test_{start_ms}.wav", start_ms, start_ms + 500)
+        for start_ms in (0, 700, 1500)
+    ]
+
+    written = list(cut_many(audio, segments))
+    assert written == [destination for destination, *_ in segments]
+
+    samples, sample_rate = read_samples(audio)
+    for destination, start_ms, stop_ms in segments:
+        start = start_ms * sample_rate // 1000
+        stop = stop_ms * sample_rate // 1000
+        cut_samples, cut_sample_rate = read_samples(destination)
+        assert cut_sample_rate == sample_rate
+        assert (cut_samples == samples[:, start:stop]).all()
+
+
+def test_read_samples():
+    audio = DATA_DIR / "test.wav"
+    samples, sample_rate = read_samples(audio)
+    assert sample_rate == 16_000
+    assert samples.shape[0] == 1
+
+
+def test_resample_in_chunks_matches_whole_file(tmp_path: Path):
+    audio = DATA_DIR / "test.wav"
+    whole = tmp_path / "whole.wav"
+    chunked = tmp_path / "chunked.wav"
+
+    resample(audio, whole, TARGET_SAMPLE_RATE, chunk_frames=None)
+    resample(audio, chunked, TARGET_SAMPLE_RATE, chunk_frames=1000)
+    assert (read_samples(whole)[0] == read_samples(chunked)[0]).all()
+
+
+def test_resample_in_place(tmp_path: Path):
+    audio = tmp_path / "test.wav"
+    audio.write_bytes((DATA_DIR / "test.wav").read_bytes())
+
+    resample(audio, audio, TARGET_SAMPLE_RATE)
+    assert get_sample_rate(audio) == TARGET_SAMPLE_RATE
+    assert not (tmp_path / "test.partial.wav").exists()
+
+
+def test_cut_many_resampled_matches_resampling_whole_file(tmp_path: Path):
+    audio = DATA_DIR / "test.wav"
+    resampled_audio = tmp_path / "resampled.wav"
+    resample(audio, resampled_audio, TARGET_SAMPLE_RATE)
+
+    segments = [(0, 400), (300, 900), (2000, 2500)]
+    expected = list(
+        cut_many(
+            resampled_audio,
+            [
+                (tmp_path / f"expected_{start}.wav", start, stop)
+                for start, stop in segments
+            ],
+        )
+    )
+    result = list(
+        cut_many_resampled(
+            audio,
+            [
+                (tmp_path / f"result_{start}.wav", start, stop)
+                for start, stop in segments
+            ],
+            TARGET_SAMPLE_RATE,
+        )
+    )
+
+    for expected_file, result_file in zip(expected, result):
+        expected_samples, _ = read_samples(expected_file)
+        result_samples, sample_rate = read_samples(result_file)
+        assert sample_rate == TARGET_SAMPLE_RATE
+        assert expected_samples.shape == result_samples.shape
+        # Allow for rounding differences at the edges of the resampled ranges
+        difference = np.abs(expected_samples.astype(int) - result_samples)
+        assert difference.max() <= 2
+
+
+def test_plan_normalization_for_matching_file():
+    plan = plan_normalization(DATA_DIR / "test.wav", 16_000)
+    assert plan.action == NormalizationAction.PASS_THROUGH
+    assert plan.num_channels == 1
+    assert plan.sample_format == "<i2"
+    assert plan.duration_ms == 2630
+
+
+def test_plan_normalization_for_different_sample_rate():
+    plan = plan_normalization(DATA_DIR / "test.wav", TARGET_SAMPLE_RATE)
+    assert plan.action == NormalizationAction.RESAMPLE
+    assert plan.source_sample_rate == 16_000
+
+
+def test_plan_normalization_for_broken_header(tmp_path: Path):
+    audio = tmp_path / "test.wav"
+    data = bytearray((DATA_DIR / "test.wav").read_bytes())
+    data[4:8] = b"\xff\xff\xff\xff"
+    audio.write_bytes(bytes(data))
+
+    plan = plan_normalization(audio, 16_000)
+    assert plan.action == NormalizationAction.REWRITE_HEADER
+
+    normalize(audio, audio, plan)
+    assert plan_normalization(audio, 16_000).action == NormalizationAction.PASS_THROUGH
+
+
+def test_normalize_with_quality(tmp_path: Path):
+    audio = DATA_DIR / "test.wav"
+    destination = tmp_path / "test.wav"
+    plan = plan_normalization(audio, TARGET_SAMPLE_RATE)
+
+    normalize(audio, destination, plan, quality=ResampleQuality.LOW)
+    assert get_sample_rate(destination) == TARGET_SAMPLE_RATE
+
+
+def test_read_samples_in_memory():
+    audio = DATA_DIR / "test.wav"
+    samples, sample_rate = read_samples(BytesIO(audio.read_bytes()))
+    expected, expected_sample_rate = read_samples(audio)
+    assert sample_rate == expected_sample_rate
+    assert np.array_equal(samples, expected)
+
+
+def test_encode_samples():
+    samples = np.arange(-100, 100, dtype=np.int16).reshape(1, -1)
+    encoded = encode_samples(samples, 8_000)
+    decoded, sample_rate = read_samples(encoded)
+    assert sample_rate == 8_000
+    assert np.array_equal(decoded, samples)
+
+
+def test_normalize_in_memory(tmp_path: Path):
+    audio = DATA_DIR / "test.wav"
+    audio_file = BytesIO(audio.read_bytes())
+
+    plan = plan_normalization(audio_file, 16_000)
+    assert normalize_in_memory(audio_file, plan) is audio_file
+
+    plan = plan_normalization(audio_file, TARGET_SAMPLE_RATE)
+    assert plan.action == NormalizationAction.RESAMPLE
+    resampled = normalize_in_memory(audio_file, plan)
+    resample(audio, tmp_path / "resampled.wav", TARGET_SAMPLE_RATE)
+    assert resampled.getvalue() == (tmp_path / "resampled.wav").read_bytes()
+
+
+def test_normalize_in_memory_with_broken_header():
+    data = bytearray((DATA_DIR / "test.wav").read_bytes())
+    data[4:8] = b"\xff\xff\xff\xff"
+    audio_file = BytesIO(bytes(data))
+
+    plan = plan_normalization(audio_file, 16_000)
+    assert plan.action == NormalizationAction.REWRITE_HEADER
+    repaired = normalize_in_memory(audio_file, plan)
+    assert plan_normalization(repaired, 16_000).action == (
+        NormalizationAction.PASS_THROUGH
+    )
@@ -1,5 +1,12 @@
-from models import DatasetOptions
-from utils.clean_text import clean_text, collapse, explode, remove_consecutive_spaces
+from models import Annotation, AnnotationBatch, DatasetOptions
+from utils.clean_text import (
+    TextCleaner,
+    clean_batch,
+    clean_text,
+    collapse,
+    explode,
+    remove_consecutive_spaces,
+)
 
 
 def test_explode():
@@ -35,3 +42,55 @@ def test_clean_text():
     )
     expected = "This is going to be interesting".lower()
     assert clean_text(text, cleaning_options) == expected
+
+
+def test_clean_batch():
+    batch = AnnotationBatch.from_annotations(
+        [
+            Annotation(audio_file_name="test.wav", transcript="Hello, there!"),
+            Annotation(
+                audio_file_name="test.wav", transcript="Um hi", start_ms=0, stop_ms=1
+            ),
+        ]
+    )
+    options = DatasetOptions(text_to_remove=["um"], punctuation_to_remove=",!")
+    result = clean_batch(batch, options)
+    assert [annotation.transcript for annotation in result] == ["hello there", "hi"]
+    assert result[1].is_timed()
+
+
+def test_text_cleaner_matches_clean_text_by_word():
+    texts = [
+        "Hello, World!  um  UM there",
+        ";leading and trailing; ;;",
+        "a-b-c d:e",
+        "",
+        "   ",
+    ]
+    option_sets = [
+        DatasetOptions(),
+        DatasetOptions(text_to_remove=["um", "there"]),
+        DatasetOptions(punctuation_to_explode=";:-"),
+        DatasetOptions(punctuation_to_remove=",!", punctuation_to_explode="-"),
+        DatasetOptions(punctuation_to_remove="-", punctuation_to_explode="-"),
+        DatasetOptions(punctuation_to_remove=" ,", punctuation_to_explode=";"),
+    ]
+    for options in option_sets:
+        cleaner = TextCleaner(options)
+        for text in texts:
+            expected = _clean_by_word(text, options)
+            assert cleaner.clean(text) == expected
+            assert clean_text(text, options) == expected
+        assert cleaner.clean_many(texts) == [cleaner.clean(text) for text in texts]
+
+
+def _clean_by_word(text: str, options: DatasetOptions) -> str:
+    """Cleans text a word at a time with the regex helpers."""
+    words = [
+        word for word in text.lower().split() if word not in options.text_to_remove
+    ]
+    if options.punctuation_to_explode != "":
+        words = [explode(word, options.punctuation_to_explode) for word in words]
+    if options.punctuation_to_remove != "":
+        words = [collapse(word, options.punctuation_to_remove) for word in words]
+    return remove_consecutive_spaces(" ".join(words).strip())
@@ -0,0 +1,68 @@
+import os
+import threading
+from unittest.mock import Mock
+
+import pytest
+import utils.clients as clients
+
+
+@pytest.fixture(autouse=True)
+def reset_clients():
+    clients.reset()
+    yield
+    clients.reset()
+
+
+def test_get_client_creates_once():
+    factory = Mock(side_effect=object)
+    assert clients.get_client("test", factory) is clients.get_client("test", factory)
+    factory.assert_called_once()
+
+
+def test_get_client_is_thread_safe():
+    factory = Mock(side_effect=object)
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(clients.get_client("t", factory))
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    factory.assert_called_once()
+    assert all(result is results[0] for result in results)
+
+
+def test_reset():
+    factory = Mock(side_effect=object)
+    first = clients.get_client("test", factory)
+    clients.reset()
+    assert clients.get_client("test", factory) is not first
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="Requires fork")
+def test_forked_child_starts_empty():
+    clients.get_client("test", object)
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        os.write(write, str(len(clients._clients)).encode())
+        os._exit(0)
+
+    os.close(write)
+    os.waitpid(pid, 0)
+    assert os.read(read, 16) == b"0"
+    os.close(read)
+    assert "test" in clients._clients
+
+
+def test_storage_client_is_shared(mocker):
+    client_mock: Mock = mocker.patch("utils.clients.storage.Client")
+    assert clients.get_storage_client() is clients.get_storage_client()
+    client_mock.assert_called_once()
+    client_mock.return_value._http.mount.assert_called_once()
@@ -0,0 +1,105 @@
+import re
+from typing import Callable, List
+from unittest.mock import Mock
+
+import pytest
+from google.api_core.exceptions import Forbidden
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import storage
+from requests import Response
+from utils.cloud_storage import MAX_BATCH_DELETES, delete_folder_blob
+
+DELETED_NAME = re.compile(r"DELETE \S+/b/bucket/o/1%2Fdataset%2F(\d+)\.json")
+
+
+def _batch_response(statuses: List[int]) -> Response:
+    """Builds the multipart response of a batch request."""
+    parts = "".join(
+        f"--batch\r\nContent-Type: application/http\r\n"
+        f"Content-ID: <response-{index}>\r\n\r\n"
+        f"HTTP/1.1 {status} Status\r\nContent-Length: 0\r\n\r\n"
+        for index, status in enumerate(statuses)
+    )
+    response = Response()
+    response.status_code = 200
+    response.headers["content-type"] = "multipart/mixed; boundary=batch"
+    response._content = f"{parts}--batch--\r\n".encode("utf-8")
+    return response
+
+
+def _mock_clients(mocker, count: int, status: Callable[[int], int] = lambda _: 204):
+    """Lists `count` objects, and answers each batch deletion with the status
+    of each object given by its index.
+
+    Returns:
+        The mock of the batch endpoint.
+    """
+    blobs = [Mock() for _ in range(count)]
+    for index, blob in enumerate(blobs):
+        blob.name = f"1/dataset/{index}.json"
+    shared = Mock()
+    shared.list_blobs.return_value = iter(blobs)
+    mocker.patch("utils.cloud_storage.get_storage_client", return_value=shared)
+    endpoint = Mock(
+        side_effect=lambda data: _batch_response(
+            [status(int(index)) for index in DELETED_NAME.findall(data)]
+        )
+    )
+
+    def make_request(method, url, data=None, **kwargs) -> Response:
+        if url.endswith("/batch/storage/v1"):
+            return endpoint(data)
+        # Newer clients look up the bucket's metadata in the background.
+        response = Response()
+        response.status_code = 404
+        return response
+
+    def create_client() -> storage.Client:
+        client = storage.Client(project="test", credentials=AnonymousCredentials())
+        client._base_connection._make_request = make_request
+        return client
+
+    mocker.patch("utils.cloud_storage.create_storage_client", side_effect=create_client)
+    return endpoint
+
+
+def test_delete_folder_blob_in_batches(mocker):
+    endpoint = _mock_clients(mocker, 250)
+
+    report = delete_folder_blob("bucket", "1/dataset/", workers=2)
+    assert report.complete
+    assert report.deleted == 250
+    assert endpoint.call_count == 3
+
+
+def test_delete_folder_blob_skips_deleted_objects(mocker):
+    # Every other object has already been deleted.
+    _mock_clients(mocker, MAX_BATCH_DELETES, lambda index: 404 if index % 2 else 204)
+
+    report = delete_folder_blob("bucket", "1/dataset/")
+    assert report.complete
+    assert report.deleted == MAX_BATCH_DELETES // 2
+
+
+def test_delete_folder_blob_raises_failed_deletions(mocker):
+    _mock_clients(mocker, 10, lambda index: 403 if index == 3 else 204)
+
+    with pytest.raises(Forbidden):
+        delete_folder_blob("bucket", "1/dataset/")
+
+
+def test_delete_folder_blob_needs_every_response(mocker):
+    endpoint = _mock_clients(mocker, 10)
+    endpoint.side_effect = lambda data: _batch_response([204] * 9)
+
+    with pytest.raises(ValueError):
+        delete_folder_blob("bucket", "1/dataset/")
+
+
+def test_delete_folder_blob_stops_at_deadline(mocker):
+    endpoint = _mock_clients(mocker, 250)
+
+    report = delete_folder_blob("bucket", "1/dataset/", deadline_s=-1)
+    assert not report.complete
+    assert report.deleted == 0
+    endpoint.assert_not_called()
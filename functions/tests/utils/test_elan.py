@@ -0,0 +1,89 @@
+from io import BytesIO
+from pathlib import Path
+
+from utils.elan import read_annotations, read_tiers
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+ELAN_PATH = DATA_DIR / "test.eaf"
+
+REFERENCE_EAF = """<?xml version="1.0" encoding="UTF-8"?>
+<ANNOTATION_DOCUMENT>
+    <TIME_ORDER>
+        <TIME_SLOT TIME_SLOT_ID="ts1" TIME_VALUE="100"/>
+        <TIME_SLOT TIME_SLOT_ID="ts2" TIME_VALUE="900"/>
+        <TIME_SLOT TIME_SLOT_ID="ts3"/>
+        <TIME_SLOT TIME_SLOT_ID="ts4" TIME_VALUE="1500"/>
+    </TIME_ORDER>
+    <TIER TIER_ID="Phrase" LINGUISTIC_TYPE_REF="phrase" PARTICIPANT="A">
+        <ANNOTATION>
+            <ALIGNABLE_ANNOTATION ANNOTATION_ID="a1" TIME_SLOT_REF1="ts1" TIME_SLOT_REF2="ts2">
+                <ANNOTATION_VALUE>hello</ANNOTATION_VALUE>
+            </ALIGNABLE_ANNOTATION>
+        </ANNOTATION>
+        <ANNOTATION>
+            <ALIGNABLE_ANNOTATION ANNOTATION_ID="a2" TIME_SLOT_REF1="ts3" TIME_SLOT_REF2="ts4">
+                <ANNOTATION_VALUE>unaligned</ANNOTATION_VALUE>
+            </ALIGNABLE_ANNOTATION>
+        </ANNOTATION>
+    </TIER>
+    <TIER TIER_ID="Translation" LINGUISTIC_TYPE_REF="translation" PARENT_REF="Phrase">
+        <ANNOTATION>
+            <REF_ANNOTATION ANNOTATION_ID="a3" ANNOTATION_REF="a1">
+                <ANNOTATION_VALUE>hola</ANNOTATION_VALUE>
+            </REF_ANNOTATION>
+        </ANNOTATION>
+    </TIER>
+</ANNOTATION_DOCUMENT>
+"""
+
+
+def test_read_annotations_by_tier_name():
+    result = read_annotations(ELAN_PATH, lambda tier: tier.tier_id == "Phrase")
+    assert len(result.annotations) == 2
+    assert all(annotation.participant == "SL" for annotation in result.annotations)
+    assert [tier.order for tier in result.tiers] == [1, 2, 3]
+
+
+def test_read_annotations_by_tier_type():
+    result = read_annotations(
+        ELAN_PATH, lambda tier: tier.linguistic_type == "default-lt"
+    )
+    assert len(result.annotations) == 6
+
+
+def test_read_annotations_with_no_selected_tiers():
+    result = read_annotations(ELAN_PATH, lambda tier: False)
+    assert result.annotations == []
+    assert len(result.tiers) == 3
+
+
+def test_read_reference_annotations_use_parent_times(tmp_path: Path):
+    path = tmp_path / "reference.eaf"
+    path.write_text(REFERENCE_EAF)
+
+    result = read_annotations(path, lambda tier: tier.tier_id == "Translation")
+    [annotation] = result.annotations
+    assert annotation.value == "hola"
+    assert (annotation.start_ms, annotation.stop_ms) == (100, 900)
+
+
+def test_read_annotations_skips_unaligned_times(tmp_path: Path):
+    path = tmp_path / "reference.eaf"
+    path.write_text(REFERENCE_EAF)
+
+    result = read_annotations(path, lambda tier: tier.tier_id == "Phrase")
+    assert [annotation.value for annotation in result.annotations] == ["hello"]
+
+
+def test_read_tiers():
+    table = read_tiers(ELAN_PATH)
+    assert [tier.order for tier in table.tiers] == [1, 2, 3]
+    assert table.tiers == read_annotations(ELAN_PATH, lambda tier: False).tiers
+    assert "default-lt" in table.linguistic_types
+
+
+def test_read_tiers_from_stream():
+    table = read_tiers(BytesIO(REFERENCE_EAF.encode("utf-8")))
+    assert [tier.tier_id for tier in table.tiers] == ["Phrase", "Translation"]
+    assert [tier.linguistic_type for tier in table.tiers] == ["phrase", "translation"]
+    assert table.linguistic_types == []
@@ -1,3 +1,7 @@
+from copy import deepcopy
+from datetime import datetime, timezone
+
+from humps.main import decamelize
 from utils.firestore_event_converter import unpack
 
 STRING_TEST = {"name": {"stringValue": "test"}}
@@ -28,3 +32,68 @@ def test_unpack_fields():
     result = unpack(FIELD_TEST)
     assert result["hi"] == "there"
     assert result["numba"] == 0
+
+
+NESTED_TEST = {
+    "userId": {"stringValue": "uid"},
+    "files": {
+        "arrayValue": {"values": [{"stringValue": "a.eaf"}, {"stringValue": "a.wav"}]}
+    },
+    "options": {
+        "mapValue": {
+            "fields": {
+                "elanOptions": {
+                    "mapValue": {"fields": {"selectionMechanism": {"nullValue": None}}}
+                },
+                "splitUntimedAudio": {"booleanValue": True},
+            }
+        }
+    },
+    "emptyMap": {"mapValue": {}},
+    "emptyArray": {"arrayValue": {}},
+}
+
+
+def test_unpack_nested():
+    result = unpack(NESTED_TEST)
+    assert result["files"] == ["a.eaf", "a.wav"]
+    assert result["options"]["elanOptions"] == {"selectionMechanism": None}
+    assert result["options"]["splitUntimedAudio"] is True
+    assert result["emptyMap"] == {}
+    assert result["emptyArray"] == []
+
+
+def test_unpack_leaves_event_unchanged():
+    event = deepcopy(NESTED_TEST)
+    unpack(event)
+    assert event == NESTED_TEST
+
+
+def test_unpack_with_snake_case_matches_decamelize():
+    result = unpack(NESTED_TEST, snake_case=True)
+    assert result == decamelize(unpack(NESTED_TEST))
+    assert result["options"]["elan_options"] == {"selection_mechanism": None}
+
+
+def test_unpack_timestamps_and_references():
+    result = unpack(
+        {
+            "created": {"timestampValue": "2022-03-04T05:06:07.123456789Z"},
+            "dataset": {"referenceValue": "projects/p/databases/(default)/documents/x"},
+        }
+    )
+    assert result["created"] == datetime(
+        2022, 3, 4, 5, 6, 7, 123456, tzinfo=timezone.utc
+    )
+    assert result["dataset"] == "projects/p/databases/(default)/documents/x"
+
+
+def test_unpack_deeply_nested_values():
+    value = {"integerValue": "1"}
+    for _ in range(5_000):
+        value = {"arrayValue": {"values": [value]}}
+
+    result = unpack({"deep": value})["deep"]
+    for _ in range(5_000):
+        [result] = result
+    assert result == 1
@@ -0,0 +1,115 @@
+import json
+from io import BytesIO
+from pathlib import Path
+from unittest.mock import Mock
+
+import numpy as np
+from models import Annotation
+from utils.audio import encode_samples
+from utils.manifest import (
+    MANIFEST_NAME,
+    ManifestEntry,
+    build_entries,
+    checksum,
+    describe_file,
+    merge,
+)
+from utils.shards import write_shard
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+
+UNTIMED = Annotation(audio_file_name="test.wav", transcript="hello there")
+TIMED = Annotation(
+    audio_file_name="test.wav", transcript="hi", start_ms=0, stop_ms=1000
+)
+
+
+def _json(annotation: Annotation) -> BytesIO:
+    return BytesIO(json.dumps(annotation.to_dict()).encode("utf-8"))
+
+
+def test_checksum(tmp_path: Path):
+    # Matches the base64 encoded CRC32C that cloud storage reports
+    assert checksum(BytesIO(b"abc")) == "Nks/tw=="
+
+    file = tmp_path / "abc"
+    file.write_bytes(b"abc")
+    assert checksum(file) == "Nks/tw=="
+
+
+def test_build_entries_for_untimed_annotation():
+    descriptions = [
+        describe_file("test.json", _json(UNTIMED)),
+        describe_file("test.wav", DATA_DIR / "test.wav"),
+    ]
+    [entry] = build_entries(descriptions)
+
+    assert entry.path == "test.wav"
+    assert entry.transcript == "hello there"
+    assert entry.transcript_length == 11
+    assert entry.sample_rate == 16_000
+    assert entry.duration_ms == entry.samples * 1000 // 16_000
+    assert entry.crc32c == checksum(DATA_DIR / "test.wav")
+    assert entry.offset is None
+
+
+def test_build_entries_for_timed_annotation():
+    audio = encode_samples(np.zeros((1, 16_000), dtype=np.int16), 16_000)
+    descriptions = [
+        describe_file("test_0.json", _json(TIMED)),
+        describe_file("test_0.wav", audio),
+        describe_file("test.wav", DATA_DIR / "test.wav"),
+    ]
+    [entry] = build_entries(descriptions)
+
+    assert entry.path == "test_0.wav"
+    assert entry.samples == 16_000
+    assert entry.duration_ms == 1000
+
+
+def test_build_entries_for_shard():
+    entries = [
+        (TIMED.to_dict(), np.zeros((1, 1600), dtype=np.int16), 16_000),
+        (UNTIMED.to_dict(), np.zeros((1, 800), dtype=np.int16), 16_000),
+    ]
+    shard = write_shard(BytesIO(), entries)
+
+    result = build_entries([describe_file("test.tar", shard)])
+    assert [entry.path for entry in result] == ["test.tar", "test.tar"]
+    assert [entry.offset for entry in result] == [0, 1600]
+    assert [entry.samples for entry in result] == [1600, 800]
+    assert result[1].duration_ms == 50
+
+
+def test_merge(mocker):
+    entry = ManifestEntry(
+        path="test.wav",
+        transcript="hi",
+        duration_ms=1000,
+        samples=16_000,
+        sample_rate=16_000,
+        transcript_length=2,
+        speaker=None,
+        crc32c="Nks/tw==",
+    )
+    line = json.dumps(entry.to_dict()) + "\n"
+
+    blobs = [Mock(), Mock(), Mock()]
+    blobs[0].name = "1/dataset/a.manifest.jsonl"
+    blobs[1].name = "1/dataset/a.json"
+    blobs[2].name = "1/dataset/b.manifest.jsonl"
+    mocker.patch("utils.manifest.list_blobs_with_prefix", return_value=blobs)
+    download_mock = mocker.patch(
+        "utils.manifest.download_blob_as_bytes", return_value=line.encode("utf-8")
+    )
+    upload_mock = mocker.patch("utils.manifest.upload_blob_from_string")
+
+    assert merge("bucket", "1/dataset") == 2
+    assert download_mock.call_count == 2
+
+    _, data, name = upload_mock.call_args.args
+    assert name == f"1/dataset/{MANIFEST_NAME}"
+    assert [ManifestEntry.from_dict(json.loads(x)) for x in data.splitlines()] == [
+        entry,
+        entry,
+    ]
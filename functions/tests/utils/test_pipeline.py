@@ -0,0 +1,59 @@
+import time
+from threading import Lock
+
+from pytest import raises
+from utils.pipeline import consume
+
+
+def test_consume_all_items():
+    consumed = []
+    lock = Lock()
+
+    def consumer(item: int) -> None:
+        with lock:
+            consumed.append(item)
+
+    consume(range(100), consumer, workers=4)
+    assert sorted(consumed) == list(range(100))
+
+
+def test_consume_overlaps_production_and_consumption():
+    def produce():
+        for item in range(4):
+            time.sleep(0.05)
+            yield item
+
+    start = time.perf_counter()
+    consume(produce(), lambda _: time.sleep(0.05), workers=2)
+    elapsed = time.perf_counter() - start
+
+    # Run one after the other, this would take at least 0.4 seconds.
+    assert elapsed < 0.35
+
+
+def test_consume_raises_consumer_errors():
+    produced = []
+
+    def produce():
+        for item in range(1000):
+            produced.append(item)
+            yield item
+
+    def consumer(item: int) -> None:
+        if item == 5:
+            raise ValueError("Bad item")
+
+    with raises(ValueError):
+        consume(produce(), consumer, workers=2, max_pending=2)
+
+    # Production should stop shortly after the failure
+    assert len(produced) < 1000
+
+
+def test_consume_raises_producer_errors():
+    def produce():
+        yield 1
+        raise RuntimeError("Bad producer")
+
+    with raises(RuntimeError):
+        consume(produce(), lambda _: None)
@@ -0,0 +1,74 @@
+import json
+from unittest.mock import Mock
+
+from google.api_core.exceptions import NotFound
+from utils.processing_cache import INDEX_NAME, evict, get_cache_key, restore, store
+
+BUCKET = "bucket"
+CACHE_PREFIX = "_processing_cache/1/key"
+DATASET_PREFIX = "1/dataset"
+NAMES = ["test_0.json", "test_0.wav"]
+
+
+def test_get_cache_key_is_deterministic():
+    options = {"b": 1, "a": [1, 2]}
+    assert get_cache_key("audio", "hash", options) == get_cache_key(
+        "audio", "hash", dict(reversed(options.items()))
+    )
+
+
+def test_get_cache_key_changes_with_parts():
+    assert get_cache_key("audio", "hash", 16_000) != get_cache_key(
+        "audio", "other_hash", 16_000
+    )
+    assert get_cache_key("audio", "hash", 16_000) != get_cache_key(
+        "audio", "hash", 8_000
+    )
+
+
+def test_restore_missing_entry(mocker):
+    mocker.patch("utils.processing_cache.download_blob_as_bytes", return_value=None)
+    copy_mock: Mock = mocker.patch("utils.processing_cache.copy_blob")
+
+    assert not restore(BUCKET, CACHE_PREFIX, DATASET_PREFIX)
+    copy_mock.assert_not_called()
+
+
+def test_restore_cached_entry(mocker):
+    index = json.dumps(NAMES).encode("utf-8")
+    mocker.patch("utils.processing_cache.download_blob_as_bytes", return_value=index)
+    copy_mock: Mock = mocker.patch("utils.processing_cache.copy_blob")
+
+    assert restore(BUCKET, CACHE_PREFIX, DATASET_PREFIX)
+    copied = {call.args[3] for call in copy_mock.call_args_list}
+    assert copied == {f"{DATASET_PREFIX}/{name}" for name in NAMES}
+
+
+def test_restore_expired_entry(mocker):
+    index = json.dumps(NAMES).encode("utf-8")
+    mocker.patch("utils.processing_cache.download_blob_as_bytes", return_value=index)
+    mocker.patch("utils.processing_cache.copy_blob", side_effect=NotFound("expired"))
+
+    assert not restore(BUCKET, CACHE_PREFIX, DATASET_PREFIX)
+
+
+def test_store(mocker):
+    copy_mock: Mock = mocker.patch("utils.processing_cache.copy_blob")
+    upload_mock: Mock = mocker.patch("utils.processing_cache.upload_blob_from_string")
+
+    store(BUCKET, DATASET_PREFIX, NAMES, CACHE_PREFIX)
+    copied = {call.args[3] for call in copy_mock.call_args_list}
+    assert copied == {f"{CACHE_PREFIX}/{name}" for name in NAMES}
+
+    # The index must only be written once the outputs are in the cache
+    upload_mock.assert_called_once_with(
+        BUCKET, json.dumps(NAMES), f"{CACHE_PREFIX}/{INDEX_NAME}"
+    )
+
+
+def test_evict(mocker):
+    delete_mock: Mock = mocker.patch("utils.processing_cache.delete_folder_blob")
+
+    evict(BUCKET, [CACHE_PREFIX, "_processing_cache/1/other"])
+    deleted = {call.args[1] for call in delete_mock.call_args_list}
+    assert deleted == {f"{CACHE_PREFIX}/", "_processing_cache/1/other/"}
@@ -0,0 +1,33 @@
+import json
+from concurrent.futures import Future
+from unittest.mock import Mock
+
+import utils.clients as clients
+import utils.pubsub as pubsub
+
+
+def _done_future() -> Future:
+    future: Future = Future()
+    future.set_result("id")
+    return future
+
+
+def test_publisher_is_shared(mocker):
+    clients.reset()
+    client_mock: Mock = mocker.patch("utils.pubsub.pubsub_v1.PublisherClient")
+
+    assert pubsub.get_publisher() is pubsub.get_publisher()
+    client_mock.assert_called_once()
+    clients.reset()
+
+
+def test_publish_to_topic(mocker):
+    publisher = Mock()
+    publisher.publish.side_effect = lambda *args: _done_future()
+    mocker.patch("utils.pubsub.get_publisher", return_value=publisher)
+
+    assert pubsub.publish_to_topic("topic", [{"a": 1}, {"b": 2}]) == 2
+    assert publisher.publish.call_count == 2
+    topic, message = publisher.publish.call_args.args
+    assert topic == "topic"
+    assert json.loads(message) == {"b": 2}
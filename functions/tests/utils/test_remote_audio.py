@@ -0,0 +1,71 @@
+from pathlib import Path
+from unittest.mock import Mock
+
+import numpy as np
+from utils.audio import read_segments, read_segments_resampled
+from utils.remote_audio import read_header, read_segments as read_remote_segments
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+AUDIO_DATA = (DATA_DIR / "test.wav").read_bytes()
+SEGMENTS = [("a", 0, 250), ("b", 300, 500), ("c", 2000, 2400)]
+
+
+def _mock_storage(mocker) -> Mock:
+    mocker.patch("utils.remote_audio.get_blob_size", return_value=len(AUDIO_DATA))
+    return mocker.patch(
+        "utils.remote_audio.download_blob_range",
+        side_effect=lambda _, __, start, end: AUDIO_DATA[start : end + 1],
+    )
+
+
+def test_read_header(mocker):
+    range_mock = _mock_storage(mocker)
+    header = read_header("bucket", "test.wav")
+
+    assert header is not None
+    assert header.sample_rate == 16_000
+    assert header.dtype == "<i2"
+    range_mock.assert_called_once()
+
+
+def test_read_header_of_missing_file(mocker):
+    mocker.patch("utils.remote_audio.get_blob_size", return_value=None)
+    assert read_header("bucket", "test.wav") is None
+
+
+def test_read_segments_coalesces_nearby_ranges(mocker):
+    range_mock = _mock_storage(mocker)
+    header = read_header("bucket", "test.wav")
+    assert header is not None
+    range_mock.reset_mock()
+
+    segments = list(
+        read_remote_segments("bucket", "test.wav", header, SEGMENTS, max_gap_ms=1000)
+    )
+    expected = list(read_segments(DATA_DIR / "test.wav", SEGMENTS))
+
+    assert [key for key, _, _ in segments] == ["a", "b", "c"]
+    for (_, samples, sample_rate), (_, expected_samples, _) in zip(segments, expected):
+        assert sample_rate == 16_000
+        assert np.array_equal(samples, expected_samples)
+
+    # The first two segments are close enough to share a request
+    assert range_mock.call_count == 2
+    start, end = range_mock.call_args_list[0].args[2:]
+    assert end - start + 1 == 500 * 16 * 2
+
+
+def test_read_segments_resampled(mocker):
+    _mock_storage(mocker)
+    header = read_header("bucket", "test.wav")
+    assert header is not None
+
+    segments = read_remote_segments(
+        "bucket", "test.wav", header, SEGMENTS, sample_rate=8_000
+    )
+    expected = read_segments_resampled(DATA_DIR / "test.wav", SEGMENTS, 8_000)
+
+    for (_, samples, sample_rate), (_, expected_samples, _) in zip(segments, expected):
+        assert sample_rate == 8_000
+        assert samples.shape == expected_samples.shape
+        assert np.allclose(samples, expected_samples, atol=1e-2)
@@ -0,0 +1,68 @@
+import tarfile
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+from models import Annotation
+from utils.audio import read_samples
+from utils.shards import AUDIO_NAME, INDEX_NAME, read_shard_index, write_shard
+
+SAMPLE_RATE = 16_000
+
+
+def _annotation(start_ms: int, stop_ms: int) -> Dict[str, Any]:
+    return Annotation(
+        audio_file_name="test.wav",
+        transcript=f"from {start_ms}",
+        start_ms=start_ms,
+        stop_ms=stop_ms,
+    ).to_dict()
+
+
+def test_write_shard(tmp_path: Path):
+    entries = [
+        (_annotation(0, 100), np.full((1, 1600), 1, dtype=np.int16), SAMPLE_RATE),
+        (_annotation(500, 550), np.full((1, 800), 2, dtype=np.int16), SAMPLE_RATE),
+    ]
+    shard = write_shard(tmp_path / "test.tar", entries)
+
+    index = read_shard_index(shard)
+    assert len(index) == 2
+    assert Annotation.from_dict(index[1]).to_dict() == entries[1][0]
+    assert (index[0]["offset"], index[0]["frames"]) == (0, 1600)
+    assert (index[1]["offset"], index[1]["frames"]) == (1600, 800)
+
+    with tarfile.open(shard) as archive:
+        assert archive.getnames() == [INDEX_NAME, AUDIO_NAME]
+        archive.extract(AUDIO_NAME, tmp_path)
+
+    samples, sample_rate = read_samples(tmp_path / AUDIO_NAME)
+    assert sample_rate == SAMPLE_RATE
+    assert (samples[0, :1600] == 1).all()
+    assert (samples[0, 1600:] == 2).all()
+    assert not (tmp_path / "test.shard.wav").exists()
+
+
+def test_write_empty_shard(tmp_path: Path):
+    shard = write_shard(tmp_path / "test.tar", [])
+    assert read_shard_index(shard) == []
+
+
+def test_write_shard_in_memory(tmp_path: Path):
+    entries = [
+        (_annotation(0, 100), np.full((1, 1600), 1, dtype=np.int16), SAMPLE_RATE),
+    ]
+    shard = write_shard(BytesIO(), entries)
+
+    index = read_shard_index(shard)
+    assert Annotation.from_dict(index[0]).to_dict() == entries[0][0]
+
+    shard.seek(0)
+    with tarfile.open(fileobj=shard) as archive:
+        assert archive.getnames() == [INDEX_NAME, AUDIO_NAME]
+        audio_file = archive.extractfile(AUDIO_NAME)
+        assert audio_file is not None
+        samples, _ = read_samples(BytesIO(audio_file.read()))
+    assert (samples == 1).all()
+    assert list(tmp_path.iterdir()) == []
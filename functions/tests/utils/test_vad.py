@@ -0,0 +1,91 @@
+import numpy as np
+from models import Annotation
+from utils.vad import FRAME_MS, find_pauses, frame_energies, split_annotation
+
+SAMPLE_RATE = 16_000
+
+
+def _speech(pattern: str, unit_ms: int = 1_000) -> np.ndarray:
+    """Builds mono audio from a pattern of tones (x) and silences (-)."""
+    rng = np.random.default_rng(0)
+    unit = SAMPLE_RATE * unit_ms // 1000
+    parts = [
+        (rng.standard_normal(unit) * 8_000).astype(np.int16)
+        if symbol == "x"
+        else np.zeros(unit, dtype=np.int16)
+        for symbol in pattern
+    ]
+    return np.concatenate(parts).reshape(1, -1)
+
+
+def test_frame_energies():
+    energies = frame_energies(_speech("x-"), SAMPLE_RATE)
+    assert len(energies) == 2 * 1000 // FRAME_MS
+    assert (energies[:50] > -20).all()
+    assert (energies[50:] < -100).all()
+
+
+def test_frame_energies_by_block(mocker):
+    samples = _speech("x-x-")
+    energies = frame_energies(samples, SAMPLE_RATE)
+
+    mocker.patch("utils.vad.BLOCK_FRAMES", 7)
+    assert np.allclose(frame_energies(samples, SAMPLE_RATE), energies)
+
+
+def test_find_pauses():
+    energies = frame_energies(_speech("xxxx-xxxxx--xxx"), SAMPLE_RATE)
+    min_frames = 1_000 // FRAME_MS
+
+    [cut] = find_pauses(energies, 1, min_frames)
+    assert 10_000 <= cut * FRAME_MS <= 12_000
+
+    first, second = find_pauses(energies, 2, min_frames)
+    assert 4_000 <= first * FRAME_MS <= 5_000
+    assert 10_000 <= second * FRAME_MS <= 12_000
+
+
+def test_find_pauses_keeps_pieces_long_enough():
+    energies = frame_energies(_speech("xxxx-xxxx"), SAMPLE_RATE)
+    cuts = find_pauses(energies, 3, min_frames=4_000 // FRAME_MS)
+    assert len(cuts) == 1
+
+
+def test_split_annotation_by_line():
+    annotation = Annotation(audio_file_name="test.wav", transcript="a b\nc d\n\ne f")
+    samples = _speech("xxxx-xxxx--xxxx")
+
+    chunks = split_annotation(annotation, samples, SAMPLE_RATE, 2_000, 6_000)
+    assert [chunk.transcript for chunk in chunks] == ["a b", "c d", "e f"]
+    assert chunks[0].start_ms == 0
+    assert chunks[-1].stop_ms == 15_000
+    assert 4_000 <= chunks[0].stop_ms <= 5_000  # type: ignore
+    assert 9_000 <= chunks[1].stop_ms <= 11_000  # type: ignore
+
+
+def test_split_annotation_drops_long_chunks():
+    annotation = Annotation(audio_file_name="test.wav", transcript="a b\nc d")
+    samples = _speech("xx-xxxxxxxxx")
+
+    chunks = split_annotation(annotation, samples, SAMPLE_RATE, 1_000, 6_000)
+    assert [chunk.transcript for chunk in chunks] == ["a b"]
+
+
+def test_split_annotation_without_line_breaks_is_dropped():
+    annotation = Annotation(audio_file_name="test.wav", transcript="a b c d e f")
+    samples = _speech("xxxx-xxxx-xxxx")
+    assert split_annotation(annotation, samples, SAMPLE_RATE, 2_000, 6_000) == []
+
+
+def test_split_annotation_without_room_is_dropped():
+    annotation = Annotation(audio_file_name="test.wav", transcript="a\nb\nc\nd")
+    samples = _speech("xxxx-xxxx")
+    assert split_annotation(annotation, samples, SAMPLE_RATE, 4_000, 6_000) == []
+
+
+def test_split_short_annotation_is_unchanged():
+    annotation = Annotation(audio_file_name="test.wav", transcript="a\nb")
+    samples = _speech("xx")
+    assert split_annotation(annotation, samples, SAMPLE_RATE, 1_000, 5_000) == [
+        annotation
+    ]
@@ -0,0 +1,99 @@
+import struct
+from pathlib import Path
+
+from utils.wav import (
+    WAVE_FORMAT_PCM,
+    is_consistent,
+    pack_header,
+    parse_header,
+    read_header,
+    rewrite_header,
+)
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+
+
+def _wav_bytes(frames: int, extra_chunk: bytes = b"") -> bytes:
+    fmt = struct.pack("<HHIIHH", WAVE_FORMAT_PCM, 2, 8000, 32000, 4, 16)
+    data = b"\0" * frames * 4
+    body = (
+        b"WAVE"
+        + extra_chunk
+        + b"fmt "
+        + struct.pack("<I", len(fmt))
+        + fmt
+        + b"data"
+        + struct.pack("<I", len(data))
+        + data
+    )
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def test_parse_header():
+    header = parse_header(_wav_bytes(frames=8000))
+    assert header is not None
+    assert header.num_channels == 2
+    assert header.sample_rate == 8000
+    assert header.frames == 8000
+    assert header.duration_ms == 1000
+    assert header.dtype == "<i2"
+    assert header.data_offset == 44
+
+
+def test_parse_header_skips_unknown_chunks():
+    extra_chunk = b"LIST" + struct.pack("<I", 3) + b"abc\0"
+    header = parse_header(_wav_bytes(frames=10, extra_chunk=extra_chunk))
+    assert header is not None
+    assert header.data_offset == 44 + 12
+
+
+def test_parse_header_with_invalid_data():
+    assert parse_header(b"not a wav file") is None
+    assert parse_header(_wav_bytes(frames=10)[:30]) is None
+
+
+def test_read_header():
+    header = read_header(DATA_DIR / "test.wav")
+    assert header is not None
+    assert header.sample_rate == 16_000
+    assert header.num_channels == 1
+    assert header.frames == 42087
+
+
+def test_is_consistent():
+    data = _wav_bytes(frames=10)
+    header = parse_header(data)
+    assert header is not None
+    assert is_consistent(header, len(data))
+
+    # Streaming recorders may leave the sizes at their maximum
+    broken = bytearray(data)
+    broken[4:8] = struct.pack("<I", 0xFFFFFFFF)
+    broken[40:44] = struct.pack("<I", 0xFFFFFFFF)
+    header = parse_header(bytes(broken))
+    assert header is not None
+    assert not is_consistent(header, len(broken))
+
+
+def test_rewrite_header(tmp_path: Path):
+    broken = bytearray(_wav_bytes(frames=10))
+    broken[4:8] = struct.pack("<I", 0)
+    broken[40:44] = struct.pack("<I", 0xFFFFFFFF)
+    audio = tmp_path / "test.wav"
+    audio.write_bytes(bytes(broken))
+
+    rewrite_header(audio, audio)
+    data = audio.read_bytes()
+    header = parse_header(data)
+    assert header is not None
+    assert is_consistent(header, len(data))
+    assert header.frames == 10
+    assert data[44:] == broken[44:]
+
+
+def test_pack_header():
+    header = parse_header(pack_header(2, 8000, 16, data_size=400) + b"\0" * 400)
+    assert header is not None
+    assert header.num_channels == 2
+    assert header.sample_rate == 8000
+    assert header.frames == 100
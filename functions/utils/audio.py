@@ -1,38 +1,261 @@
+import os
+import shutil
+from dataclasses import dataclass
+from enum import Enum
+from io import BytesIO
 from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
 
+import numpy as np
+import utils.wav as wav
+from pedalboard import Resample
 from pedalboard.io import ReadableAudioFile, WriteableAudioFile
 
+T = TypeVar("T")
 
-def get_sample_rate(audio_path: Path) -> int:
+# Audio can be read from a file on disk, or from a file held in memory.
+AudioSource = Union[Path, BytesIO]
+
+# The number of frames to hold in memory at once when resampling.
+RESAMPLE_CHUNK_FRAMES = 2**16
+
+# Extra audio to resample either side of a segment, so that the resampling
+# filter has settled by the time the segment itself starts.
+RESAMPLE_MARGIN_MS = 50
+
+# The longest run of neighbouring segments to resample in a single read.
+MAX_RESAMPLED_RANGE_MS = 60_000
+
+
+class ResampleQuality(Enum):
+    """Tiers of resampling quality, trading accuracy for speed."""
+
+    LOW = "low"
+    MEDIUM = "medium"
+    HIGH = "high"
+
+
+RESAMPLERS = {
+    ResampleQuality.LOW: Resample.Quality.Linear,
+    ResampleQuality.MEDIUM: Resample.Quality.Lagrange,
+    ResampleQuality.HIGH: Resample.Quality.WindowedSinc,
+}
+
+
+class NormalizationAction(Enum):
+    """The ways in which an audio file can be brought to a target format,
+    from cheapest to most expensive.
+    """
+
+    PASS_THROUGH = "pass_through"
+    REWRITE_HEADER = "rewrite_header"
+    RESAMPLE = "resample"
+
+
+@dataclass
+class NormalizationPlan:
+    """A class describing an audio file, and the cheapest action that will
+    bring it to a target sample rate as 16 bit PCM wav.
+    """
+
+    action: NormalizationAction
+    sample_rate: int
+    source_sample_rate: int
+    num_channels: int
+    sample_format: str
+    duration_ms: int
+
+
+def get_sample_rate(audio_path: AudioSource) -> int:
     """Gets the current sample rate of the given audio file.
 
     Parameters:
-        audio_path: The path to the audio file.
+        audio_path: The path to the audio file, or the file in memory.
 
     Returns:
         The sample rate of the given file.
     """
-    with ReadableAudioFile(str(audio_path)) as audio_file:
+    with _open(audio_path) as audio_file:
         return int(audio_file.samplerate)
 
 
-def resample(audio_path: Path, destination: Path, sample_rate: int) -> None:
+def plan_normalization(audio_path: AudioSource, sample_rate: int) -> NormalizationPlan:
+    """Inspects the header of an audio file to find the cheapest way of
+    bringing it to the given sample rate as 16 bit PCM wav.
+
+    Parameters:
+        audio_path: The path to the audio file, or the file in memory.
+        sample_rate: The target sample rate.
+
+    Returns:
+        A plan describing the file and the action to take.
+    """
+    if isinstance(audio_path, Path):
+        with open(audio_path, "rb") as audio_file:
+            header = wav.parse_header(audio_file.read(wav.HEADER_PROBE_SIZE))
+        file_size = audio_path.stat().st_size
+    else:
+        with audio_path.getbuffer() as view:
+            header = wav.parse_header(bytes(view[: wav.HEADER_PROBE_SIZE]))
+            file_size = view.nbytes
+
+    if header is None or header.block_align == 0:
+        # Not a wav file, so it must be decoded either way.
+        with _open(audio_path) as audio_file:
+            return NormalizationPlan(
+                action=NormalizationAction.RESAMPLE,
+                sample_rate=sample_rate,
+                source_sample_rate=int(audio_file.samplerate),
+                num_channels=audio_file.num_channels,
+                sample_format=str(audio_file.file_dtype),
+                duration_ms=int(audio_file.duration * 1000),
+            )
+
+    if header.sample_rate != sample_rate or header.dtype != "<i2":
+        action = NormalizationAction.RESAMPLE
+    elif not wav.is_consistent(header, file_size):
+        action = NormalizationAction.REWRITE_HEADER
+    else:
+        action = NormalizationAction.PASS_THROUGH
+
+    available = file_size - header.data_offset
+    header.data_size = max(0, min(header.data_size, available))
+    return NormalizationPlan(
+        action=action,
+        sample_rate=sample_rate,
+        source_sample_rate=header.sample_rate,
+        num_channels=header.num_channels,
+        sample_format=header.dtype or f"format {header.audio_format}",
+        duration_ms=header.duration_ms,
+    )
+
+
+def normalize(
+    audio_path: Path,
+    destination: Path,
+    plan: NormalizationPlan,
+    quality: Optional[ResampleQuality] = None,
+) -> None:
+    """Brings an audio file to the sample rate and format of a normalization
+    plan, using the action chosen by the plan.
+
+    Parameters:
+        audio_path (Path): The path of the file to normalize.
+        destination (Path): The destination at which to create the normalized
+            file. May be the same as the audio path.
+        plan (NormalizationPlan): The plan for the file, from
+            plan_normalization.
+        quality (Optional[ResampleQuality]): The quality of resampling to use,
+            if the file needs resampling.
+    """
+    if plan.action == NormalizationAction.RESAMPLE:
+        resample(audio_path, destination, plan.sample_rate, quality=quality)
+    elif plan.action == NormalizationAction.REWRITE_HEADER:
+        wav.rewrite_header(audio_path, destination)
+    elif audio_path != destination:
+        shutil.copyfile(audio_path, destination)
+
+
+def normalize_in_memory(
+    audio_file: BytesIO,
+    plan: NormalizationPlan,
+    quality: Optional[ResampleQuality] = None,
+) -> BytesIO:
+    """Brings an audio file held in memory to the sample rate and format of a
+    normalization plan, using the action chosen by the plan.
+
+    Parameters:
+        audio_file (BytesIO): The contents of the file to normalize.
+        plan (NormalizationPlan): The plan for the file, from
+            plan_normalization.
+        quality (Optional[ResampleQuality]): The quality of resampling to use,
+            if the file needs resampling.
+
+    Returns:
+        The contents of the normalized file. This is the given file itself if
+        it needed no changes.
+    """
+    if plan.action == NormalizationAction.RESAMPLE:
+        with _open_resampled(audio_file, plan.sample_rate, quality) as resampled:
+            destination = BytesIO()
+            with WriteableAudioFile(
+                destination,
+                samplerate=plan.sample_rate,
+                num_channels=resampled.num_channels,
+                format="wav",
+            ) as destination_file:
+                while True:
+                    data = resampled.read(RESAMPLE_CHUNK_FRAMES)
+                    if data.shape[1] == 0:
+                        break
+                    destination_file.write(data)
+        destination.seek(0)
+        return destination
+
+    if plan.action == NormalizationAction.REWRITE_HEADER:
+        with audio_file.getbuffer() as view:
+            header = wav.parse_header(bytes(view[: wav.HEADER_PROBE_SIZE]))
+            assert header is not None
+            frames = (view.nbytes - header.data_offset) // header.block_align
+            data_size = min(header.frames, frames) * header.block_align
+            destination = BytesIO()
+            destination.write(
+                wav.pack_header(
+                    num_channels=header.num_channels,
+                    sample_rate=header.sample_rate,
+                    bits_per_sample=header.bits_per_sample,
+                    data_size=data_size,
+                    audio_format=header.audio_format,
+                )
+            )
+            destination.write(view[header.data_offset : header.data_offset + data_size])
+        destination.seek(0)
+        return destination
+
+    return audio_file
+
+
+def resample(
+    audio_path: Path,
+    destination: Path,
+    sample_rate: int,
+    chunk_frames: Optional[int] = RESAMPLE_CHUNK_FRAMES,
+    quality: Optional[ResampleQuality] = None,
+) -> None:
     """Copies a wav file to the destination, with the given
     sample rate.
 
+    The audio is streamed through the resampler in fixed-size chunks, so
+    memory use doesn't grow with the length of the recording. The output is
+    identical to resampling the whole file at once.
+
     Parameters:
         audio_path (Path): The path of the file to resample
         destination (Path): The destination at which to create the resampled file
         sample_rate (int): The sample rate for the resampled audio.
+        chunk_frames (Optional[int]): The number of resampled frames to read
+            and write at a time. If None, the whole file is read at once.
+        quality (Optional[ResampleQuality]): The quality of resampling to use.
+            If None, the resampler's default is used.
     """
-    with ReadableAudioFile(str(audio_path)).resampled_to(sample_rate) as audio_file:
-        data = audio_file.read(audio_file.frames)
-        num_channels = audio_file.num_channels
+    # The destination may be the file we're reading from, so write alongside it
+    # and only replace it once finished.
+    partial_destination = destination.with_suffix(f".partial{destination.suffix}")
 
-    with WriteableAudioFile(
-        str(destination), samplerate=sample_rate, num_channels=num_channels
-    ) as destination_file:
-        destination_file.write(data)
+    with _open_resampled(audio_path, sample_rate, quality) as audio_file:
+        chunk_size = chunk_frames or audio_file.frames
+        with WriteableAudioFile(
+            str(partial_destination),
+            samplerate=sample_rate,
+            num_channels=audio_file.num_channels,
+        ) as destination_file:
+            while True:
+                data = audio_file.read(chunk_size)
+                if data.shape[1] == 0:
+                    break
+                destination_file.write(data)
+
+    os.replace(partial_destination, destination)
 
 
 def cut(audio_path: Path, destination: Path, start_ms: int, stop_ms: int) -> None:
@@ -59,3 +282,258 @@ def cut(audio_path: Path, destination: Path, start_ms: int, stop_ms: int) -> Non
         str(destination), samplerate=sample_rate, num_channels=num_channels
     ) as destination_file:
         destination_file.write(data)
+
+
+def read_samples(audio_path: AudioSource) -> Tuple[np.ndarray, int]:
+    """Gets all the samples of an audio file, along with its sample rate.
+
+    Uncompressed wav files are memory-mapped rather than decoded, so the
+    samples are only paged in from disk as they're used. Files in memory are
+    viewed in place. Other files are decoded into memory in full.
+
+    Parameters:
+        audio_path: The path to the audio file, or the file in memory.
+
+    Returns:
+        A tuple of the samples, with shape (channels, frames), and the
+        sample rate of the file.
+    """
+    header = wav.read_header(audio_path)
+    if header is not None and header.dtype is not None and isinstance(audio_path, Path):
+        samples = np.memmap(
+            audio_path,
+            dtype=header.dtype,
+            mode="r",
+            offset=header.data_offset,
+            shape=(header.frames, header.num_channels),
+        )
+        return samples.T, header.sample_rate
+
+    if header is not None and header.dtype is not None:
+        samples = np.frombuffer(
+            audio_path.getvalue(),
+            dtype=header.dtype,
+            count=header.frames * header.num_channels,
+            offset=header.data_offset,
+        )
+        return samples.reshape(header.frames, header.num_channels).T, header.sample_rate
+
+    with _open(audio_path) as audio_file:
+        return audio_file.read(audio_file.frames), int(audio_file.samplerate)
+
+
+def read_segments(
+    audio_path: AudioSource, segments: Iterable[Tuple[T, int, int]]
+) -> Iterator[Tuple[T, np.ndarray, int]]:
+    """Reads the samples for each of the given segments of an audio file.
+
+    The audio file is only opened and decoded once, and each segment's
+    samples are a view of that single read.
+
+    Parameters:
+        audio_path (AudioSource): The path of the file to read, or the file
+            in memory.
+        segments: An iterable of (key, start_ms, stop_ms) tuples, describing
+            the times each segment spans.
+
+    Returns:
+        An iterator over (key, samples, sample_rate) tuples for each segment.
+    """
+    samples, sample_rate = read_samples(audio_path)
+
+    for key, start_ms, stop_ms in segments:
+        start = int(start_ms * sample_rate / 1000)
+        stop = int(stop_ms * sample_rate / 1000)
+        yield key, samples[:, start:stop], sample_rate
+
+
+def read_segments_resampled(
+    audio_path: AudioSource,
+    segments: Iterable[Tuple[T, int, int]],
+    sample_rate: int,
+    margin_ms: int = RESAMPLE_MARGIN_MS,
+    quality: Optional[ResampleQuality] = None,
+) -> Iterator[Tuple[T, np.ndarray, int]]:
+    """Reads the samples for each of the given segments of an audio file,
+    resampled to the given sample rate.
+
+    Only the audio covered by the segments (plus a small margin either side)
+    is decoded and resampled, rather than the whole file. Segments which are
+    close together are resampled in a single read, so segments are returned
+    in order of their start times.
+
+    Parameters:
+        audio_path (AudioSource): The path of the file to read, or the file
+            in memory.
+        segments: An iterable of (key, start_ms, stop_ms) tuples, describing
+            the times each segment spans.
+        sample_rate (int): The sample rate to resample to.
+        margin_ms (int): The amount of extra audio to resample either side of
+            each range of segments.
+        quality (Optional[ResampleQuality]): The quality of resampling to use.
+            If None, the resampler's default is used.
+
+    Returns:
+        An iterator over (key, samples, sample_rate) tuples for each segment.
+    """
+    to_frame = lambda ms: int(ms * sample_rate / 1000)
+    margin = to_frame(margin_ms)
+
+    with _open_resampled(audio_path, sample_rate, quality) as audio_file:
+        for group in group_segments(segments, max_gap_ms=2 * margin_ms):
+            range_start = max(0, to_frame(group[0][1]) - margin)
+            range_stop = to_frame(max(stop_ms for _, _, stop_ms in group)) + margin
+
+            audio_file.seek(range_start)
+            data = audio_file.read(range_stop - range_start)
+
+            for key, start_ms, stop_ms in group:
+                start = to_frame(start_ms) - range_start
+                stop = to_frame(stop_ms) - range_start
+                yield key, data[:, start:stop], sample_rate
+
+
+def write_samples(destination: Path, samples: np.ndarray, sample_rate: int) -> None:
+    """Writes some samples to a new wav file.
+
+    Parameters:
+        destination (Path): The destination at which to create the file.
+        samples (np.ndarray): The samples to write, with shape (channels, frames).
+        sample_rate (int): The sample rate of the samples.
+    """
+    with WriteableAudioFile(
+        str(destination), samplerate=sample_rate, num_channels=samples.shape[0]
+    ) as destination_file:
+        destination_file.write(np.ascontiguousarray(samples))
+
+
+def encode_samples(samples: np.ndarray, sample_rate: int) -> BytesIO:
+    """Encodes some samples as a wav file in memory.
+
+    Parameters:
+        samples (np.ndarray): The samples to encode, with shape (channels, frames).
+        sample_rate (int): The sample rate of the samples.
+
+    Returns:
+        The contents of the wav file, positioned at its start.
+    """
+    destination = BytesIO()
+    with WriteableAudioFile(
+        destination,
+        samplerate=sample_rate,
+        num_channels=samples.shape[0],
+        format="wav",
+    ) as destination_file:
+        destination_file.write(np.ascontiguousarray(samples))
+    destination.seek(0)
+    return destination
+
+
+def cut_many(
+    audio_path: Path, segments: Iterable[Tuple[Path, int, int]]
+) -> Iterator[Path]:
+    """Creates a new wav file for each of the given segments of an audio
+    file.
+
+    Unlike calling cut for each segment, the audio file is only opened and
+    decoded once, and every segment is written from a view of those samples.
+
+    Parameters:
+        audio_path (Path): The path of the file to cut.
+        segments: An iterable of (destination, start_ms, stop_ms) tuples,
+            describing where to write each segment and the times it spans.
+
+    Returns:
+        An iterator over the segment destinations, each yielded once its file
+        has been written.
+    """
+    for destination, samples, sample_rate in read_segments(audio_path, segments):
+        write_samples(destination, samples, sample_rate)
+        yield destination
+
+
+def cut_many_resampled(
+    audio_path: Path,
+    segments: Iterable[Tuple[Path, int, int]],
+    sample_rate: int,
+    margin_ms: int = RESAMPLE_MARGIN_MS,
+    quality: Optional[ResampleQuality] = None,
+) -> Iterator[Path]:
+    """Creates a new wav file for each of the given segments of an audio
+    file, resampled to the given sample rate.
+
+    Only the annotated audio is resampled; see read_segments_resampled.
+
+    Parameters:
+        audio_path (Path): The path of the file to cut.
+        segments: An iterable of (destination, start_ms, stop_ms) tuples,
+            describing where to write each segment and the times it spans.
+        sample_rate (int): The sample rate for the cut audio.
+        margin_ms (int): The amount of extra audio to resample either side of
+            each range of segments.
+        quality (Optional[ResampleQuality]): The quality of resampling to use.
+            If None, the resampler's default is used.
+
+    Returns:
+        An iterator over the segment destinations, each yielded once its file
+        has been written.
+    """
+    resampled_segments = read_segments_resampled(
+        audio_path, segments, sample_rate, margin_ms, quality
+    )
+    for destination, samples, sample_rate in resampled_segments:
+        write_samples(destination, samples, sample_rate)
+        yield destination
+
+
+def _open(audio_path: AudioSource) -> ReadableAudioFile:
+    """Opens an audio file on disk or in memory for reading."""
+    if isinstance(audio_path, Path):
+        return ReadableAudioFile(str(audio_path))
+    # Readers share the position of the buffer, so give each its own.
+    return ReadableAudioFile(BytesIO(audio_path.getvalue()))
+
+
+def _open_resampled(
+    audio_path: AudioSource, sample_rate: int, quality: Optional[ResampleQuality]
+):
+    """Opens an audio file for reading at the given sample rate."""
+    audio_file = _open(audio_path)
+    if quality is None:
+        return audio_file.resampled_to(sample_rate)
+    return audio_file.resampled_to(sample_rate, quality=RESAMPLERS[quality])
+
+
+def group_segments(
+    segments: Iterable[Tuple[T, int, int]],
+    max_gap_ms: int,
+    max_range_ms: int = MAX_RESAMPLED_RANGE_MS,
+) -> Iterator[List[Tuple[T, int, int]]]:
+    """Groups segments, ordered by start time, into runs which are separated
+    by short gaps and which are short enough to read at once.
+
+    Parameters:
+        segments: An iterable of (key, start_ms, stop_ms) tuples.
+        max_gap_ms: The longest gap between neighbouring segments in a group.
+        max_range_ms: The longest time a group may span.
+
+    Returns:
+        An iterator over the groups of segments.
+    """
+    group: List[Tuple[T, int, int]] = []
+    group_stop_ms = 0
+
+    for segment in sorted(segments, key=lambda segment: segment[1]):
+        _, start_ms, stop_ms = segment
+        if len(group) > 0 and (
+            start_ms - group_stop_ms > max_gap_ms
+            or max(stop_ms, group_stop_ms) - group[0][1] > max_range_ms
+        ):
+            yield group
+            group = []
+
+        group_stop_ms = max(stop_ms, group_stop_ms) if len(group) > 0 else stop_ms
+        group.append(segment)
+
+    if len(group) > 0:
+        yield group
@@ -1,11 +1,73 @@
 import re
+from typing import Dict, Iterable, List, Optional
 
-from models import DatasetOptions
+from models import AnnotationBatch, DatasetOptions
+
+
+class TextCleaner:
+    """A class which cleans text based on some dataset options, built once so
+    that it can be reused for each of a dataset's transcripts.
+
+    Punctuation to explode and remove is applied through a single translation
+    table, and the text to remove is held in a set.
+    """
+
+    def __init__(self, options: DatasetOptions) -> None:
+        self.text_to_remove = frozenset(options.text_to_remove)
+
+        # Removal applies after exploding, so exploded punctuation becomes a
+        # space unless spaces are themselves removed.
+        table: Dict[int, Optional[str]] = {
+            ord(char): None for char in options.punctuation_to_remove
+        }
+        space = None if " " in options.punctuation_to_remove else " "
+        table.update((ord(char), space) for char in options.punctuation_to_explode)
+        self.table = table
+        self.per_word = ord(" ") in table
+
+    def clean(self, text: str) -> str:
+        """Cleans the given text.
+
+        Parameters:
+            text: The text to clean.
+
+        Returns:
+            The cleaned text.
+        """
+        words = text.lower().split()
+        if self.text_to_remove:
+            words = [word for word in words if word not in self.text_to_remove]
+
+        # Unless spaces are removed, the words can be translated all at once.
+        if not self.table:
+            result = " ".join(words)
+        elif self.per_word:
+            result = " ".join(word.translate(self.table) for word in words)
+        else:
+            result = " ".join(words).translate(self.table)
+
+        # The only whitespace left is spaces, so this strips the text and
+        # collapses consecutive spaces in one pass.
+        return " ".join(result.split())
+
+    def clean_many(self, texts: Iterable[str]) -> List[str]:
+        """Cleans each of the given texts.
+
+        Parameters:
+            texts: The texts to clean.
+
+        Returns:
+            The cleaned texts, in order.
+        """
+        return [self.clean(text) for text in texts]
 
 
 def clean_text(text: str, options: DatasetOptions) -> str:
     """Cleans the text based on the supplied options.
 
+    To clean many texts with the same options, build a TextCleaner once
+    instead.
+
     Parameters:
         text: The text to clean.
         options: The cleaning options.
@@ -13,17 +75,22 @@ def clean_text(text: str, options: DatasetOptions) -> str:
     Returns:
         The cleaned text
     """
-    words = text.lower().split()
-    words = filter(lambda word: word not in options.text_to_remove, words)
+    return TextCleaner(options).clean(text)
 
-    if options.punctuation_to_explode != "":
-        words = map(lambda word: explode(word, options.punctuation_to_explode), words)
 
-    if options.punctuation_to_remove != "":
-        words = map(lambda word: collapse(word, options.punctuation_to_remove), words)
+def clean_batch(batch: AnnotationBatch, options: DatasetOptions) -> AnnotationBatch:
+    """Cleans the transcripts of a batch of annotations based on the supplied
+    options.
 
-    result = " ".join(words).strip()
-    return remove_consecutive_spaces(result)
+    Parameters:
+        batch: The annotations to clean.
+        options: The cleaning options.
+
+    Returns:
+        A batch sharing the other columns of the given batch, with cleaned
+        transcripts.
+    """
+    return batch.with_transcripts(TextCleaner(options).clean_many(batch.transcripts))
 
 
 def explode(text: str, pattern: str) -> str:
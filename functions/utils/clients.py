@@ -0,0 +1,95 @@
+import os
+import threading
+from typing import Any, Callable, Dict, TypeVar
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+from google.cloud import storage
+from requests.adapters import HTTPAdapter
+
+PROJECT_ID = "elpiscloud"
+
+# The number of pooled connections to keep open per host for cloud storage,
+# which should cover the concurrency of parallel transfers.
+STORAGE_POOL_SIZE = int(os.environ.get("STORAGE_POOL_SIZE", "32"))
+
+Client = TypeVar("Client")
+
+# Clients are created once per process and shared across warm invocations and
+# threads. A forked child discards its parent's clients, as their connections
+# (and gRPC channels) can't be shared across processes.
+_clients: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def get_client(name: str, factory: Callable[[], Client]) -> Client:
+    """Returns the process' shared client of the given name, creating it with
+    the factory on first use.
+
+    Parameters:
+        name: The name of the client within the registry.
+        factory: A function creating the client.
+
+    Returns:
+        The shared client.
+    """
+    with _lock:
+        if name not in _clients:
+            _clients[name] = factory()
+        return _clients[name]
+
+
+def reset() -> None:
+    """Discards every shared client, so that they're recreated on next use."""
+    with _lock:
+        _clients.clear()
+
+
+def get_storage_client() -> storage.Client:
+    """Returns the process' shared cloud storage client."""
+    return get_client("storage", create_storage_client)
+
+
+def get_firestore_client() -> firestore.firestore.Client:
+    """Returns the process' shared firestore client."""
+    return get_client("firestore", _create_firestore_client)
+
+
+def create_storage_client() -> storage.Client:
+    """Creates a cloud storage client whose connection pool is sized for
+    parallel transfers. Prefer the shared client unless one of its own is
+    needed, e.g. to collect a batch of requests.
+    """
+    client = storage.Client()
+    adapter = HTTPAdapter(
+        pool_connections=STORAGE_POOL_SIZE, pool_maxsize=STORAGE_POOL_SIZE
+    )
+    client._http.mount("https://", adapter)
+    return client
+
+
+def _create_firestore_client() -> firestore.firestore.Client:
+    """Creates a firestore client, initializing the firebase app if another
+    client hasn't already.
+    """
+    try:
+        app = firebase_admin.get_app()
+    except ValueError:
+        app = firebase_admin.initialize_app(
+            credentials.ApplicationDefault(), {"projectId": PROJECT_ID}
+        )
+    return firestore.client(app)
+
+
+def _reset_after_fork() -> None:
+    """Discards the parent's clients in a forked child. The lock is replaced
+    rather than acquired, as another of the parent's threads may have held it
+    when forking.
+    """
+    global _lock
+    _lock = threading.Lock()
+    _clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
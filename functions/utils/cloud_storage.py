@@ -1,9 +1,38 @@
+import threading
+import time
+from dataclasses import dataclass
+from itertools import islice
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import BinaryIO, Iterable, Iterator, List, Optional
 
+from google.api_core.exceptions import NotFound, from_http_response
 from google.cloud import storage
+from google.cloud.storage.batch import Batch
 from google.cloud.storage.blob import Blob
 from loguru import logger
+from utils.clients import create_storage_client, get_storage_client
+from utils.pipeline import consume
+
+# The most deletions the storage batch API accepts in a single request.
+MAX_BATCH_DELETES = 100
+
+# The number of batch deletion requests to make concurrently.
+DELETE_WORKERS = 8
+
+
+@dataclass
+class DeletionReport:
+    """A class describing a run of deleting a folder's objects."""
+
+    deleted: int
+    seconds: float
+    # Whether the run deleted everything, rather than stopping at a deadline.
+    complete: bool
+
+    @property
+    def rate(self) -> float:
+        """The number of objects deleted per second."""
+        return self.deleted / self.seconds if self.seconds > 0 else 0.0
 
 
 def delete_blob(bucket_name: str, target_blob_name: str) -> None:
@@ -13,7 +42,7 @@ def delete_blob(bucket_name: str, target_blob_name: str) -> None:
         bucket_name: The ID of the GCS bucket
         target_blob_name: The path to the file within the GCS bucket"""
 
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
 
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(target_blob_name)
@@ -22,23 +51,110 @@ def delete_blob(bucket_name: str, target_blob_name: str) -> None:
     logger.info(f"Blob {target_blob_name} deleted.")
 
 
-def delete_folder_blob(bucket_name: str, target_blob_prefix: str) -> None:
+def delete_folder_blob(
+    bucket_name: str,
+    target_blob_prefix: str,
+    workers: int = DELETE_WORKERS,
+    deadline_s: Optional[float] = None,
+) -> DeletionReport:
     """Deletes a blob representing a folder from the given bucket.
 
-    This recursively deletes all objects within a folder.
+    This recursively deletes all objects within a folder. Objects are listed a
+    page at a time, and deleted in batch requests of up to MAX_BATCH_DELETES
+    objects by a pool of workers.
+
+    As only the objects remaining under the prefix are listed, an interrupted
+    deletion resumes where it left off when run again.
 
     Parameters:
         bucket_name: The ID of the GCS bucket
         target_blob_prefix: Prefix of the folder that needs to be recursively deleted
                             ('some/directory' for example)
+        workers: The number of batch requests to make concurrently.
+        deadline_s: If given, the number of seconds after which no more batches
+            are started, leaving the rest of the folder for another run.
+
+    Returns:
+        A report of how many objects were deleted, and how quickly.
     """
     logger.info(f"Deleting prefix: {target_blob_prefix}")
+    start = time.monotonic()
 
-    blobs = list_blobs_with_prefix(bucket_name, target_blob_prefix)
-    for blob in blobs:
-        blob.delete()
+    blobs = get_storage_client().list_blobs(
+        bucket_name, prefix=target_blob_prefix, fields="items(name),nextPageToken"
+    )
+    report = DeletionReport(deleted=0, seconds=0, complete=True)
+
+    def batches() -> Iterator[List[str]]:
+        names = (str(blob.name) for blob in blobs)
+        while batch := list(islice(names, MAX_BATCH_DELETES)):
+            if deadline_s is not None and time.monotonic() - start > deadline_s:
+                report.complete = False
+                return
+            yield batch
+
+    # Batches are collected on a client's own stack, so each worker needs a
+    # client of its own.
+    local = threading.local()
+    lock = threading.Lock()
+
+    def delete(names: List[str]) -> None:
+        if not hasattr(local, "client"):
+            local.client = create_storage_client()
+        deleted = _delete_batch(local.client, bucket_name, names)
+        with lock:
+            report.deleted += deleted
+
+    consume(batches(), delete, workers=workers)
+
+    report.seconds = time.monotonic() - start
+    logger.info(
+        f"Deleted {report.deleted} objects under prefix: {target_blob_prefix} in "
+        f"{report.seconds:.1f}s ({report.rate:.0f} objects/s), "
+        f"complete: {report.complete}"
+    )
+    return report
 
-    logger.info(f"Deleted prefix: {target_blob_prefix}")
+
+def _delete_batch(client: storage.Client, bucket_name: str, names: List[str]) -> int:
+    """Deletes some objects in a single batch request. Objects which have
+    already been deleted are skipped.
+
+    Returns:
+        The number of objects the request deleted.
+    """
+    bucket = client.bucket(bucket_name)
+    with _DeletionBatch(client) as batch:
+        for name in names:
+            bucket.delete_blob(name)
+    return batch.deleted
+
+
+class _DeletionBatch(Batch):
+    """A batch of deletions, which counts the objects each of its requests
+    deleted rather than failing when some of them no longer exist.
+    """
+
+    def __init__(self, client: storage.Client):
+        super().__init__(client)
+        self.deleted = 0
+
+    def _finish_futures(self, responses, raise_exception=True):
+        # Overrides the handling of the batch's responses in the release of
+        # google-cloud-storage pinned in pyproject.toml (later releases also
+        # pass raise_exception). Objects which no longer exist are skipped,
+        # and any other failure is raised once every response is counted.
+        if len(self._target_objects) != len(responses):
+            raise ValueError("Expected a response for every request.")
+
+        failure = None
+        for response in responses:
+            if 200 <= response.status_code < 300:
+                self.deleted += 1
+            elif response.status_code != 404 and failure is None:
+                failure = response
+        if failure is not None and raise_exception:
+            raise from_http_response(failure)
 
 
 def download_blob(
@@ -52,7 +168,7 @@ def download_blob(
         destination_file_name: The local path referring to where the blob will be
             downloaded.
     """
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
 
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(source_blob_name)
@@ -73,7 +189,7 @@ def upload_blob(
         source_file_name: The path to your file to upload
         destination_blob_name: The ID of your GCS object
     """
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(destination_blob_name)
 
@@ -82,6 +198,194 @@ def upload_blob(
     logger.info(f"File {source_file_name} uploaded to {destination_blob_name}.")
 
 
+def download_blob_to_file(
+    bucket_name: str, source_blob_name: str, destination_file: BinaryIO
+) -> None:
+    """Streams the contents of a blob into a file object, such as an
+    in-memory buffer.
+
+    Parameters:
+        bucket_name: The ID of your GCS bucket
+        source_blob_name: The path to your file within the GCS bucket.
+        destination_file: The file object to write the blob's contents to.
+    """
+    storage_client = get_storage_client()
+
+    bucket = storage_client.bucket(bucket_name)
+    blob = bucket.blob(source_blob_name)
+    blob.download_to_file(destination_file)
+
+    logger.info(
+        f"Downloaded storage object {source_blob_name} from bucket {bucket_name} to file object."
+    )
+
+
+def upload_blob_from_file(
+    bucket_name: str, source_file: BinaryIO, destination_blob_name: str
+) -> None:
+    """Uploads the contents of a file object, such as an in-memory buffer,
+    to the bucket.
+
+    The file object is rewound first, so its whole contents are uploaded.
+
+    Parameters:
+        bucket_name: The ID of your GCS bucket
+        source_file: The file object to upload
+        destination_blob_name: The ID of your GCS object
+    """
+    storage_client = get_storage_client()
+    bucket = storage_client.bucket(bucket_name)
+    blob = bucket.blob(destination_blob_name)
+
+    blob.upload_from_file(source_file, rewind=True)
+
+    logger.info(f"File object uploaded to {destination_blob_name}.")
+
+
+def download_blob_as_bytes(bucket_name: str, source_blob_name: str) -> Optional[bytes]:
+    """Downloads the contents of a blob into memory.
+
+    Parameters:
+        bucket_name: The ID of your GCS bucket
+        source_blob_name: The path to your file within the GCS bucket.
+
+    Returns:
+        The contents of the blob, or None if it doesn't exist.
+    """
+    storage_client = get_storage_client()
+    bucket = storage_client.bucket(bucket_name)
+    blob = bucket.blob(source_blob_name)
+
+    try:
+        return blob.download_as_bytes()
+    except NotFound:
+        return None
+
+
+def upload_blob_from_string(
+    bucket_name: str, data: str, destination_blob_name: str
+) -> None:
+    """Uploads some text to the bucket.
+
+    Parameters:
+        bucket_name: The ID of your GCS bucket
+        data: The contents of the blob to create
+        destination_blob_name: The ID of your GCS object
+    """
+    storage_client = get_storage_client()
+    bucket = storage_client.bucket(bucket_name)
+    blob = bucket.blob(destination_blob_name)
+
+    blob.upload_from_string(data)
+
+    logger.info(f"Text uploaded to {destination_blob_name}.")
+
+
+def copy_blob(
+    bucket_name: str,
+    source_blob_name: str,
+    destination_bucket_name: str,
+    destination_blob_name: str,
+) -> None:
+    """Copies a blob to another location, without downloading it.
+
+    Parameters:
+        bucket_name: The ID of the GCS bucket containing the blob
+        source_blob_name: The path to the blob to copy
+        destination_bucket_name: The ID of the GCS bucket to copy to
+        destination_blob_name: The path of the copy within its bucket
+    """
+    storage_client = get_storage_client()
+    source_bucket = storage_client.bucket(bucket_name)
+    source_blob = source_bucket.blob(source_blob_name)
+    destination_bucket = storage_client.bucket(destination_bucket_name)
+
+    source_bucket.copy_blob(source_blob, destination_bucket, destination_blob_name)
+
+    logger.info(f"Blob {source_blob_name} copied to {destination_blob_name}.")
+
+
+def download_blob_range(
+    bucket_name: str, source_blob_name: str, start: int, end: int
+) -> bytes:
+    """Downloads a range of bytes from a blob into memory.
+
+    Parameters:
+        bucket_name: The ID of your GCS bucket
+        source_blob_name: The path to your file within the GCS bucket.
+        start: The offset of the first byte to download.
+        end: The offset of the last byte to download (inclusive).
+
+    Returns:
+        The bytes within the range. This is shorter than requested if the
+        range extends past the end of the blob.
+    """
+    storage_client = get_storage_client()
+    bucket = storage_client.bucket(bucket_name)
+    blob = bucket.blob(source_blob_name)
+
+    return blob.download_as_bytes(start=start, end=end)
+
+
+def open_blob(bucket_name: str, blob_name: str, chunk_size: int) -> BinaryIO:
+    """Opens a blob as a file-like object, which downloads its contents in
+    ranged requests of chunk_size bytes as it's read.
+
+    Parameters:
+        bucket_name: The ID of your GCS bucket
+        blob_name: The path to your file within the GCS bucket.
+        chunk_size: The number of bytes to fetch with each request.
+
+    Returns:
+        A readable binary stream of the blob's contents.
+    """
+    storage_client = get_storage_client()
+    bucket = storage_client.bucket(bucket_name)
+    blob = bucket.blob(blob_name)
+
+    return blob.open("rb", chunk_size=chunk_size)
+
+
+def get_blob_size(bucket_name: str, blob_name: str) -> Optional[int]:
+    """Gets the size of a blob from its metadata, without downloading it.
+
+    Parameters:
+        bucket_name: The ID of your GCS bucket
+        blob_name: The path to your file within the GCS bucket.
+
+    Returns:
+        The size of the blob in bytes, or None if it doesn't exist.
+    """
+    storage_client = get_storage_client()
+    bucket = storage_client.bucket(bucket_name)
+    blob = bucket.get_blob(blob_name)
+
+    if blob is None:
+        return None
+    return blob.size
+
+
+def get_blob_checksum(bucket_name: str, blob_name: str) -> Optional[str]:
+    """Gets a checksum of a blob's contents from its metadata, without
+    downloading it.
+
+    Parameters:
+        bucket_name: The ID of your GCS bucket
+        blob_name: The path to your file within the GCS bucket.
+
+    Returns:
+        The blob's MD5 hash, or its CRC32C checksum for objects without one
+        (e.g. composite objects). None if the blob doesn't exist.
+    """
+    storage_client = get_storage_client()
+    bucket = storage_client.bucket(bucket_name)
+    blob = bucket.get_blob(blob_name)
+
+    if blob is None:
+        return None
+    return blob.md5_hash or blob.crc32c
+
+
 def list_blobs_with_prefix(
     bucket_name: str, prefix: str, delimiter: Optional[str] = None
 ) -> Iterable[Blob]:
@@ -94,7 +398,7 @@ def list_blobs_with_prefix(
         delimiter: Used together with prefix to emulate hierachy.
     """
 
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
 
     # Note: Client.list_blobs requires at least package version 1.17.0.
     blobs = storage_client.list_blobs(bucket_name, prefix=prefix, delimiter=delimiter)
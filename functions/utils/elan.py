@@ -0,0 +1,201 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+from xml.etree.ElementTree import iterparse
+
+from loguru import logger
+
+
+@dataclass
+class TierInfo:
+    """A class representing the attributes of a tier within an eaf file."""
+
+    tier_id: str
+    linguistic_type: Optional[str]
+    participant: Optional[str]
+    order: int  # The position of the tier in the file, starting at 1
+
+
+@dataclass
+class ElanAnnotation:
+    """A class representing a time-resolved annotation from an eaf file."""
+
+    tier_id: str
+    start_ms: int
+    stop_ms: int
+    value: str
+    participant: Optional[str]
+
+
+@dataclass
+class ElanReadResult:
+    """A class holding the annotations of the selected tiers of an eaf file,
+    along with every tier that was seen in the file.
+    """
+
+    annotations: List[ElanAnnotation]
+    tiers: List[TierInfo]
+
+
+@dataclass
+class ElanTierTable:
+    """A class holding the tiers of an eaf file, and the linguistic types it
+    declares, without any of its annotations.
+    """
+
+    tiers: List[TierInfo]
+    linguistic_types: List[str]
+
+
+def read_tiers(source: Union[Path, BinaryIO]) -> ElanTierTable:
+    """Reads the tiers and linguistic types of an eaf file in a single pass,
+    discarding its annotations and time slots as they're parsed.
+
+    Parameters:
+        source: The path to the eaf file, or a binary file-like object to
+            read it from (e.g. a stream of a file in cloud storage).
+
+    Returns:
+        The attributes of every tier in the file, in order, along with the
+        IDs of its linguistic types.
+    """
+    tiers: List[TierInfo] = []
+    linguistic_types: List[str] = []
+
+    path_or_file = str(source) if isinstance(source, Path) else source
+    for event, element in iterparse(path_or_file, events=("start", "end")):
+        tag = element.tag
+        if event == "start":
+            if tag == "TIER":
+                tiers.append(
+                    TierInfo(
+                        tier_id=element.get("TIER_ID", ""),
+                        linguistic_type=element.get("LINGUISTIC_TYPE_REF"),
+                        participant=element.get("PARTICIPANT"),
+                        order=len(tiers) + 1,
+                    )
+                )
+            continue
+
+        if tag == "LINGUISTIC_TYPE":
+            linguistic_types.append(element.get("LINGUISTIC_TYPE_ID", ""))
+        elif tag in ("TIER", "TIME_ORDER"):
+            element.clear()
+    return ElanTierTable(tiers=tiers, linguistic_types=linguistic_types)
+
+
+def read_annotations(
+    elan_file_path: Path, select_tier: Callable[[TierInfo], bool]
+) -> ElanReadResult:
+    """Reads the annotations of some tiers of an eaf file in a single pass.
+
+    The file is parsed incrementally, and each annotation's element is
+    discarded once read. Only the values of annotations within the selected
+    tiers are kept, along with the time slot references needed to resolve
+    the times of reference annotations.
+
+    Parameters:
+        elan_file_path: The path to the eaf file.
+        select_tier: A predicate deciding which tiers to read annotations
+            from, given each tier's attributes.
+
+    Returns:
+        The annotations within the selected tiers, in document order, along
+        with the attributes of every tier in the file.
+    """
+    time_slots: Dict[str, Optional[int]] = {}
+    # Annotation ID -> (first time slot ID, second time slot ID)
+    aligned: Dict[str, Tuple[str, str]] = {}
+    # Reference annotation ID -> ID of the annotation it refers to
+    references: Dict[str, str] = {}
+    # (annotation ID, tier, value) for each annotation in a selected tier
+    selected: List[Tuple[str, TierInfo, str]] = []
+
+    tiers: List[TierInfo] = []
+    tier: Optional[TierInfo] = None
+    is_selected = False
+
+    for event, element in iterparse(str(elan_file_path), events=("start", "end")):
+        tag = element.tag
+        if event == "start":
+            if tag == "TIER":
+                tier = TierInfo(
+                    tier_id=element.get("TIER_ID", ""),
+                    linguistic_type=element.get("LINGUISTIC_TYPE_REF"),
+                    participant=element.get("PARTICIPANT"),
+                    order=len(tiers) + 1,
+                )
+                tiers.append(tier)
+                is_selected = select_tier(tier)
+            continue
+
+        if tag == "TIME_SLOT":
+            value = element.get("TIME_VALUE")
+            time_slots[element.get("TIME_SLOT_ID", "")] = (
+                int(value) if value is not None else None
+            )
+        elif tag == "ALIGNABLE_ANNOTATION":
+            annotation_id = element.get("ANNOTATION_ID", "")
+            aligned[annotation_id] = (
+                element.get("TIME_SLOT_REF1", ""),
+                element.get("TIME_SLOT_REF2", ""),
+            )
+            if is_selected and tier is not None:
+                value = element.findtext("ANNOTATION_VALUE") or ""
+                selected.append((annotation_id, tier, value))
+        elif tag == "REF_ANNOTATION":
+            annotation_id = element.get("ANNOTATION_ID", "")
+            references[annotation_id] = element.get("ANNOTATION_REF", "")
+            if is_selected and tier is not None:
+                value = element.findtext("ANNOTATION_VALUE") or ""
+                selected.append((annotation_id, tier, value))
+        elif tag == "ANNOTATION":
+            element.clear()
+        elif tag == "TIER":
+            element.clear()
+            is_selected = False
+
+    annotations: List[ElanAnnotation] = []
+    for annotation_id, annotation_tier, value in selected:
+        times = _resolve_times(annotation_id, aligned, references, time_slots)
+        if times is None:
+            logger.warning(
+                f"Skipping annotation {annotation_id} without a resolvable time"
+            )
+            continue
+
+        start_ms, stop_ms = times
+        annotations.append(
+            ElanAnnotation(
+                tier_id=annotation_tier.tier_id,
+                start_ms=start_ms,
+                stop_ms=stop_ms,
+                value=value,
+                participant=annotation_tier.participant,
+            )
+        )
+    return ElanReadResult(annotations=annotations, tiers=tiers)
+
+
+def _resolve_times(
+    annotation_id: str,
+    aligned: Dict[str, Tuple[str, str]],
+    references: Dict[str, str],
+    time_slots: Dict[str, Optional[int]],
+) -> Optional[Tuple[int, int]]:
+    """Finds the start and stop times of an annotation, following reference
+    annotations to the aligned annotation they depend on.
+    """
+    seen = set()
+    while annotation_id in references and annotation_id not in seen:
+        seen.add(annotation_id)
+        annotation_id = references[annotation_id]
+
+    if annotation_id not in aligned:
+        return None
+
+    first, second = aligned[annotation_id]
+    start_ms, stop_ms = time_slots.get(first), time_slots.get(second)
+    if start_ms is None or stop_ms is None:
+        return None
+    return start_ms, stop_ms
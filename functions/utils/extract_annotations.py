@@ -1,16 +1,15 @@
-from itertools import chain
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import List, Optional
 
 from loguru import logger
-from models import Annotation, TierSelector
+from models import AnnotationBatch, TierSelector
 from models.dataset import ElanOptions
-from pympi.Elan import Eaf
+from utils.elan import ElanAnnotation, read_annotations
 
 
 def extract_annotations(
     transcription_file: Path, elan_options: Optional[ElanOptions] = None
-) -> List[Annotation]:
+) -> AnnotationBatch:
     """Extracts annotations from the supplied transcription file.
 
     If the transcription file is an elan file, elan_options is required.
@@ -21,19 +20,19 @@ def extract_annotations(
                 from elan data.
 
     Returns:
-        A list of found annotations.
-        Returns an empty list if there was a problem.
+        A batch of the found annotations.
+        Returns an empty batch if there was a problem.
     """
     if transcription_file.suffix == ".txt":
         return extract_text_annotations(transcription_file)
 
     if transcription_file.suffix != ".eaf":
         logger.error(f"Unrecognised file format: {transcription_file}")
-        return []
+        return AnnotationBatch.empty()
 
     if elan_options is None:
         logger.error(f"Missing elan options for extraction job.")
-        return []
+        return AnnotationBatch.empty()
 
     return extract_elan_annotations(
         transcription_file,
@@ -42,29 +41,27 @@ def extract_annotations(
     )
 
 
-def extract_text_annotations(file: Path) -> List[Annotation]:
+def extract_text_annotations(file: Path) -> AnnotationBatch:
     """Extract transcription information from a text file.
 
     Parameters:
         file_name: The name of the downloaded file.
 
     Returns:
-        A list of utterance information for the given file.
+        A batch of utterance information for the given file.
     """
     with open(file) as transcription_file:
         transcription = transcription_file.read()
 
-    return [
-        Annotation(
-            audio_file_name=file.stem + ".wav",
-            transcript=transcription,
-        )
-    ]
+    return AnnotationBatch.from_columns(
+        audio_file_names=[file.stem + ".wav"],
+        transcripts=[transcription],
+    )
 
 
 def extract_elan_annotations(
     elan_file_path: Path, selection_type: TierSelector, selection_data: str
-) -> List[Annotation]:
+) -> AnnotationBatch:
     """Extracts annotations from a particular tier in an eaf file (ELAN
     Annotation Format).
 
@@ -78,8 +75,8 @@ def extract_elan_annotations(
         selection_data: The data corresponding to the selection_type.
 
     Returns:
-        A list of the annotations contained for the supplied data. Returns an
-        empty list if the given selection isn't found.
+        A batch of the annotations contained for the supplied data. Returns an
+        empty batch if the given selection isn't found.
     """
     logger.info(
         f"processing eaf {elan_file_path} using {selection_type}: {selection_data}"
@@ -100,7 +97,7 @@ def extract_elan_annotations(
 
 def get_annotations_by_tier_order(
     elan_file_path: Path, tier_order: int
-) -> List[Annotation]:
+) -> AnnotationBatch:
     """Retrieves all annotations for a given tier order within an eaf file.
 
     Parameters:
@@ -108,28 +105,24 @@ def get_annotations_by_tier_order(
         tier_order: The tier order to extract from (starts at 1)
 
     Returns:
-        A list of the annotations contained for the supplied tier order.
-        Returns an empty list if the given tier order exceeds the nesting of
+        A batch of the annotations contained for the supplied tier order.
+        Returns an empty batch if the given tier order exceeds the nesting of
         the file.
     """
-    elan = Eaf(elan_file_path)
+    result = read_annotations(elan_file_path, lambda tier: tier.order == tier_order)
 
-    tier_names: List[str] = list(elan.get_tier_names())
-    if tier_order > len(tier_names):
+    if tier_order > len(result.tiers):
         logger.error(
             f"tier_order: {tier_order} exceeds tier length for {elan_file_path}"
         )
-        return []
+        return AnnotationBatch.empty()
 
-    tier_name = tier_names[tier_order - 1]
-    return get_annotations_by_tier_name(
-        elan_file_path=elan_file_path, tier_name=tier_name
-    )
+    return _create_batch(elan_file_path, result.annotations)
 
 
 def get_annotations_by_tier_type(
     elan_file_path: Path, tier_type: str
-) -> List[Annotation]:
+) -> AnnotationBatch:
     """Retrieves all annotations for a given linguistic tier type in an eaf file.
 
     Parameters:
@@ -137,26 +130,23 @@ def get_annotations_by_tier_type(
         tier_type: The linguistic type from which to extract Annotation data.
 
     Returns:
-        A list of the annotations contained for the supplied linguistic type.
-        Returns an empty list if the type is not found.
+        A batch of the annotations contained for the supplied linguistic type.
+        Returns an empty batch if the type is not found.
     """
-    elan = Eaf(elan_file_path)
+    result = read_annotations(
+        elan_file_path, lambda tier: tier.linguistic_type == tier_type
+    )
 
-    if tier_type not in list(elan.get_linguistic_type_names()):
+    if not any(tier.linguistic_type == tier_type for tier in result.tiers):
         logger.error(f"tier_type: {tier_type} not found in file: {elan_file_path}")
-        return []
+        return AnnotationBatch.empty()
 
-    tier_names = elan.get_tier_ids_for_linguistic_type(tier_type)
-    annotations = (
-        get_annotations_by_tier_name(elan_file_path, name) for name in tier_names
-    )
-    # Flatten list of annotations
-    return list(chain(*annotations))
+    return _create_batch(elan_file_path, result.annotations)
 
 
 def get_annotations_by_tier_name(
     elan_file_path: Path, tier_name: str
-) -> List[Annotation]:
+) -> AnnotationBatch:
     """Retrieves all annotations for a given tier name in an eaf file.
 
     Parameters:
@@ -164,26 +154,26 @@ def get_annotations_by_tier_name(
         tier_name: The tier name from which to extract Annotation data.
 
     Returns:
-        A list of the annotations contained for the supplied tier name.
-        Returns an empty list if the name is not found.
+        A batch of the annotations contained for the supplied tier name.
+        Returns an empty batch if the name is not found.
     """
-    elan = Eaf(elan_file_path)
+    result = read_annotations(elan_file_path, lambda tier: tier.tier_id == tier_name)
 
-    if tier_name not in list(elan.get_tier_names()):
+    if not any(tier.tier_id == tier_name for tier in result.tiers):
         logger.error(f"tier_name: {tier_name} not found in file {elan_file_path}")
-        return []
-
-    parameters: Dict[str, str] = elan.get_parameters_for_tier(tier_name)
-    speaker_id = parameters.get("PARTICIPANT", None)
-
-    def create_annotation(elan_annotation: Tuple[str, str, str]) -> Annotation:
-        start, end, transcript = elan_annotation
-        return Annotation(
-            audio_file_name=f"{elan_file_path.stem}.wav",
-            transcript=transcript,
-            start_ms=int(start),
-            stop_ms=int(end),
-            speaker_id=speaker_id,
-        )
+        return AnnotationBatch.empty()
+
+    return _create_batch(elan_file_path, result.annotations)
 
-    return list(map(create_annotation, elan.get_annotation_data_for_tier(tier_name)))
+
+def _create_batch(
+    elan_file_path: Path, elan_annotations: List[ElanAnnotation]
+) -> AnnotationBatch:
+    """Collects the annotations read from an eaf file into a batch."""
+    return AnnotationBatch.from_columns(
+        audio_file_names=[f"{elan_file_path.stem}.wav"] * len(elan_annotations),
+        transcripts=[annotation.value for annotation in elan_annotations],
+        speakers=[annotation.participant for annotation in elan_annotations],
+        start_ms=[annotation.start_ms for annotation in elan_annotations],
+        stop_ms=[annotation.stop_ms for annotation in elan_annotations],
+    )
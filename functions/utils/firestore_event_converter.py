@@ -1,35 +1,104 @@
-from typing import Any, Dict
+import base64
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Tuple, Union
 
-ACTIONS = {
+from humps.main import decamelize
+
+SCALARS: Dict[str, Callable[[Any], Any]] = {
     "stringValue": (lambda x: str(x)),
-    "arrayValue": (
-        lambda x: [_parse_value(value_dict) for value_dict in x.get("values", [])]
-    ),
     "booleanValue": (lambda x: bool(x)),
     "nullValue": (lambda _: None),
-    "mapValue": (
-        lambda x: {key: _parse_value(value) for key, value in x["fields"].items()}
-    ),
     "integerValue": (lambda x: int(x)),
     "doubleValue": (lambda x: float(x)),
+    "timestampValue": (lambda x: parse_timestamp(x)),
+    "referenceValue": (lambda x: str(x)),
+    "bytesValue": (lambda x: base64.b64decode(x)),
+    "geoPointValue": (lambda x: dict(x)),
 }
 
+# Timestamps are RFC 3339 strings, with up to nanosecond precision.
+TIMESTAMP_PATTERN = re.compile(
+    r"^(?P<seconds>[^.Z+]+)(?:\.(?P<fraction>\d+))?(?P<offset>Z|[+-]\d\d:\d\d)$"
+)
+
+Container = Union[Dict[str, Any], List[Any]]
 
-def unpack(data: Dict[str, Any]) -> Dict[str, Any]:
+
+def unpack(data: Dict[str, Any], snake_case: bool = False) -> Dict[str, Any]:
     """Unpacks a firestore event value dictionary into its base types.
 
+    Values are decoded iteratively, so deeply nested documents don't recurse,
+    and the event dictionary is left unchanged.
+
     Parameters:
         data: The incoming firestore event value dictionary
+        snake_case: Whether to convert the keys of the document (and of any
+            maps within it) from camel case to snake case as they're decoded.
 
     Returns:
         A dictionary without the intermediary value sections.
     """
-    if "fields" in data:
-        return {k: _parse_value(v) for k, v in data["fields"].items()}
-    return {k: _parse_value(v) for k, v in data.items()}
+    convert_key = _snake_case if snake_case else _same_key
+    result: Dict[str, Any] = {}
+
+    # (typed values to decode, container to decode them into). Containers are
+    # placed in their parents before they're filled, so order doesn't matter.
+    pending: List[Tuple[Any, Container]] = [(data.get("fields", data), result)]
+    while pending:
+        values, target = pending.pop()
+        if isinstance(target, dict):
+            for key, value_dict in values.items():
+                target[convert_key(key)] = _decode(value_dict, pending)
+        else:
+            target.extend(_decode(value_dict, pending) for value_dict in values)
+    return result
+
+
+def _decode(value_dict: Dict[str, Any], pending: List[Tuple[Any, Container]]) -> Any:
+    """Decodes a single typed value. Maps and arrays are returned empty, and
+    their contents queued to be decoded into them.
+    """
+    # Strings are by far the most common values (e.g. a dataset's files), so
+    # they skip the lookup of their action.
+    string = value_dict.get("stringValue")
+    if string is not None:
+        return string
 
+    data_type, value = next(iter(value_dict.items()), ("nullValue", None))
+    if data_type == "mapValue":
+        container: Container = {}
+        pending.append((value.get("fields", {}), container))
+        return container
+    if data_type == "arrayValue":
+        container = []
+        pending.append((value.get("values", []), container))
+        return container
 
-def _parse_value(value_dict: Dict[str, Any]) -> Any:
-    data_type, value = value_dict.popitem()
-    action = ACTIONS.get(data_type, ACTIONS["nullValue"])
+    action = SCALARS.get(data_type, SCALARS["nullValue"])
     return action(value)
+
+
+@lru_cache(maxsize=4096)
+def _snake_case(key: str) -> str:
+    """Converts a key to snake case. Documents repeat the same few keys, so
+    conversions are cached.
+    """
+    return decamelize(key)
+
+
+def _same_key(key: str) -> str:
+    return key
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parses an RFC 3339 timestamp, truncating it to microseconds."""
+    match = TIMESTAMP_PATTERN.match(value)
+    if match is None:
+        raise ValueError(f"Invalid timestamp: {value}")
+
+    fraction = (match["fraction"] or "0")[:6].ljust(6, "0")
+    offset = "+00:00" if match["offset"] == "Z" else match["offset"]
+    timestamp = datetime.fromisoformat(f"{match['seconds']}.{fraction}{offset}")
+    return timestamp.astimezone(timezone.utc)
@@ -0,0 +1,213 @@
+import base64
+import json
+from dataclasses import dataclass, fields, replace
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import google_crc32c
+import utils.wav as wav
+from models import Annotation
+from utils.cloud_storage import (
+    download_blob_as_bytes,
+    list_blobs_with_prefix,
+    upload_blob_from_string,
+)
+from utils.shards import AUDIO_NAME, SHARD_EXTENSION, open_shard, read_shard_index
+
+# Note: Must be in sync with the manifest reader in the trainer service
+MANIFEST_NAME = "_manifest.jsonl"
+
+# Each processed file's entries are uploaded alongside its training files
+# under this suffix, and merged into the manifest once the dataset is done.
+PART_SUFFIX = ".manifest.jsonl"
+
+# The number of bytes to checksum at a time when reading from disk.
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class ManifestEntry:
+    """A class describing a single training example within a processed
+    dataset.
+
+    Examples in a shard share its path, and their audio starts offset frames
+    into the shard's audio.
+    """
+
+    path: str
+    transcript: str
+    duration_ms: int
+    samples: int
+    sample_rate: int
+    transcript_length: int
+    speaker: Optional[str]
+    crc32c: str
+    offset: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ManifestEntry":
+        return cls(**{field.name: data.get(field.name) for field in fields(cls)})
+
+
+@dataclass
+class FileDescription:
+    """A class holding what a manifest needs to know about a single uploaded
+    training file, so the file itself needn't be kept around.
+    """
+
+    name: str
+    crc32c: str
+    annotation: Optional[Annotation] = None
+    header: Optional[wav.WavHeader] = None
+    shard_index: Optional[List[Dict[str, Any]]] = None
+
+
+def checksum(file: Union[Path, BytesIO]) -> str:
+    """Computes the CRC32C checksum of a file, in the same encoding that cloud
+    storage uses (base64 of the big-endian value).
+
+    Parameters:
+        file: The path to the file, or the file in memory.
+
+    Returns:
+        The encoded checksum.
+    """
+    crc = google_crc32c.Checksum()
+    if isinstance(file, Path):
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(CHECKSUM_CHUNK_SIZE), b""):
+                crc.update(chunk)
+    else:
+        crc.update(file.getvalue())
+    return base64.b64encode(crc.digest()).decode("utf-8")
+
+
+def describe_file(name: str, file: Union[Path, BytesIO]) -> FileDescription:
+    """Describes a training file for the manifest.
+
+    Parameters:
+        name: The name of the file within the dataset.
+        file: The path to the file, or the file in memory.
+
+    Returns:
+        A description of the file.
+    """
+    description = FileDescription(name=name, crc32c=checksum(file))
+
+    suffix = Path(name).suffix
+    if suffix == ".json":
+        data = file.read_bytes() if isinstance(file, Path) else file.getvalue()
+        description.annotation = Annotation.from_dict(json.loads(data))
+    elif suffix == ".wav":
+        description.header = wav.read_header(file)
+    elif suffix == SHARD_EXTENSION:
+        description.shard_index = read_shard_index(file)
+        if isinstance(file, BytesIO):
+            file.seek(0)
+        with open_shard(file) as shard:
+            audio_file = shard.extractfile(AUDIO_NAME)
+            if audio_file is not None:
+                description.header = wav.parse_header(
+                    audio_file.read(wav.HEADER_PROBE_SIZE)
+                )
+    return description
+
+
+def build_entries(descriptions: Iterable[FileDescription]) -> List[ManifestEntry]:
+    """Pairs up the descriptions of a processed file's training files into
+    manifest entries.
+
+    Each transcript file is paired with the audio file of the same name, or
+    with the annotation's own audio file if it's untimed.
+
+    Parameters:
+        descriptions: The descriptions of the uploaded training files.
+
+    Returns:
+        The manifest entries for the training examples among the files.
+    """
+    files = {description.name: description for description in descriptions}
+    entries: List[ManifestEntry] = []
+
+    for description in files.values():
+        if description.annotation is not None:
+            annotation = description.annotation
+            audio_name = f"{Path(description.name).stem}.wav"
+            audio = files.get(audio_name) or files.get(annotation.audio_file_name)
+            if audio is None or audio.header is None:
+                continue
+            entries.append(_entry(audio.name, annotation, audio.header, audio.crc32c))
+
+        if description.shard_index is not None and description.header is not None:
+            for item in description.shard_index:
+                header = description.header
+                header = replace(header, data_size=item["frames"] * header.block_align)
+                entries.append(
+                    _entry(
+                        description.name,
+                        Annotation.from_dict(item),
+                        header,
+                        description.crc32c,
+                        offset=item["offset"],
+                    )
+                )
+
+    return entries
+
+
+def serialize(entries: Iterable[ManifestEntry]) -> str:
+    """Serializes some manifest entries as JSON lines."""
+    return "".join(json.dumps(entry.to_dict()) + "\n" for entry in entries)
+
+
+def merge(bucket_name: str, dataset_prefix: str) -> int:
+    """Merges the manifest parts of every processed file in a dataset into a
+    single manifest.
+
+    Parameters:
+        bucket_name: The ID of the GCS bucket holding the dataset.
+        dataset_prefix: The prefix of the processed dataset's files.
+
+    Returns:
+        The number of entries in the merged manifest.
+    """
+    part_names = sorted(
+        str(blob.name)
+        for blob in list_blobs_with_prefix(bucket_name, f"{dataset_prefix}/")
+        if str(blob.name).endswith(PART_SUFFIX)
+    )
+
+    lines: List[str] = []
+    for name in part_names:
+        data = download_blob_as_bytes(bucket_name, name)
+        if data is not None:
+            lines.extend(line for line in data.decode("utf-8").splitlines() if line)
+
+    manifest = "".join(line + "\n" for line in lines)
+    upload_blob_from_string(bucket_name, manifest, f"{dataset_prefix}/{MANIFEST_NAME}")
+    return len(lines)
+
+
+def _entry(
+    path: str,
+    annotation: Annotation,
+    header: wav.WavHeader,
+    crc32c: str,
+    offset: Optional[int] = None,
+) -> ManifestEntry:
+    """Builds the manifest entry for an annotation and its audio."""
+    return ManifestEntry(
+        path=path,
+        transcript=annotation.transcript,
+        duration_ms=header.duration_ms,
+        samples=header.frames,
+        sample_rate=header.sample_rate,
+        transcript_length=len(annotation.transcript),
+        speaker=annotation.speaker_id,
+        crc32c=crc32c,
+        offset=offset,
+    )
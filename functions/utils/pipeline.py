@@ -0,0 +1,67 @@
+from queue import Queue
+from threading import Thread
+from typing import Any, Callable, Iterable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Sentinel telling a worker that there are no more items to consume.
+_DONE: Any = object()
+
+
+def consume(
+    items: Iterable[T],
+    consumer: Callable[[T], Any],
+    workers: int = 4,
+    max_pending: Optional[int] = None,
+) -> None:
+    """Runs the consumer over each item in a pool of worker threads.
+
+    Items are produced lazily in the calling thread, so producing the next
+    item overlaps with consuming the previous ones. A bounded queue between
+    the two stops the producer from getting too far ahead of the workers.
+
+    If the consumer raises an error, no more items are produced and the first
+    error is re-raised once the workers have stopped.
+
+    Parameters:
+        items: The items to consume.
+        consumer: The function to call on each item.
+        workers: The number of worker threads to consume items with.
+        max_pending: The number of produced items which can be waiting for a
+            worker. Defaults to twice the number of workers.
+    """
+    pending: "Queue[T]" = Queue(maxsize=max_pending or 2 * workers)
+    errors: List[BaseException] = []
+
+    def work() -> None:
+        while True:
+            item = pending.get()
+            if item is _DONE:
+                return
+
+            # Drain remaining items without consuming them after a failure.
+            if len(errors) > 0:
+                continue
+
+            try:
+                consumer(item)
+            except BaseException as error:
+                errors.append(error)
+
+    threads = [Thread(target=work, daemon=True) for _ in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for item in items:
+            if len(errors) > 0:
+                break
+            pending.put(item)
+    finally:
+        for _ in threads:
+            pending.put(_DONE)
+        for thread in threads:
+            thread.join()
+
+    if len(errors) > 0:
+        raise errors[0]
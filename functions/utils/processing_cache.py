@@ -0,0 +1,124 @@
+import hashlib
+import json
+from typing import Any, Iterable, List
+
+from google.api_core.exceptions import NotFound
+from loguru import logger
+from utils.cloud_storage import (
+    copy_blob,
+    delete_folder_blob,
+    download_blob_as_bytes,
+    upload_blob_from_string,
+)
+from utils.pipeline import consume
+
+# Bump this whenever a change to processing would alter its outputs, so that
+# previously cached outputs are no longer reused.
+PROCESSING_VERSION = 1
+
+# Lists the cached outputs. Only written once every output has been cached.
+INDEX_NAME = "_index.json"
+
+
+def get_cache_key(*parts: Any) -> str:
+    """Builds a content-addressed cache key from everything which affects the
+    outputs of processing.
+
+    Parameters:
+        parts: JSON serializable values to include in the key, such as
+            checksums of the inputs and the processing options.
+
+    Returns:
+        A hex digest identifying the given parts.
+    """
+    serialized = json.dumps([PROCESSING_VERSION, *parts], sort_keys=True)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def restore(
+    bucket_name: str, cache_prefix: str, destination_prefix: str, workers: int = 8
+) -> bool:
+    """Copies cached outputs to a destination, if they exist.
+
+    Parameters:
+        bucket_name: The ID of the GCS bucket holding the cache.
+        cache_prefix: The prefix of the cached outputs.
+        destination_prefix: The prefix to copy the outputs to.
+        workers: The number of copies to make concurrently.
+
+    Returns:
+        True iff the outputs were found in the cache and restored.
+    """
+    index = download_blob_as_bytes(bucket_name, f"{cache_prefix}/{INDEX_NAME}")
+    if index is None:
+        return False
+
+    names: List[str] = json.loads(index)
+    try:
+        consume(
+            names,
+            lambda name: copy_blob(
+                bucket_name,
+                f"{cache_prefix}/{name}",
+                bucket_name,
+                f"{destination_prefix}/{name}",
+            ),
+            workers=workers,
+        )
+    except NotFound:
+        # The bucket's lifecycle rules may expire an entry's outputs before
+        # its index. Any outputs already restored are overwritten by processing.
+        logger.info(f"Cached outputs at {cache_prefix} have expired")
+        return False
+
+    logger.info(f"Restored {len(names)} cached outputs from {cache_prefix}")
+    return True
+
+
+def store(
+    bucket_name: str,
+    source_prefix: str,
+    names: List[str],
+    cache_prefix: str,
+    workers: int = 8,
+) -> None:
+    """Copies some processed outputs into the cache.
+
+    Parameters:
+        bucket_name: The ID of the GCS bucket holding the outputs and cache.
+        source_prefix: The prefix of the outputs to cache.
+        names: The names of the outputs, relative to the source prefix.
+        cache_prefix: The prefix to cache the outputs under.
+        workers: The number of copies to make concurrently.
+    """
+    consume(
+        names,
+        lambda name: copy_blob(
+            bucket_name,
+            f"{source_prefix}/{name}",
+            bucket_name,
+            f"{cache_prefix}/{name}",
+        ),
+        workers=workers,
+    )
+    upload_blob_from_string(
+        bucket_name, json.dumps(names), f"{cache_prefix}/{INDEX_NAME}"
+    )
+    logger.info(f"Cached {len(names)} outputs at {cache_prefix}")
+
+
+def evict(bucket_name: str, cache_prefixes: Iterable[str], workers: int = 8) -> None:
+    """Deletes cached outputs, e.g. those of a deleted dataset's files.
+
+    Parameters:
+        bucket_name: The ID of the GCS bucket holding the cache.
+        cache_prefixes: The prefixes of the cached outputs to delete.
+        workers: The number of entries to delete concurrently.
+    """
+    consume(
+        cache_prefixes,
+        lambda cache_prefix: delete_folder_blob(
+            bucket_name, f"{cache_prefix}/", workers=1
+        ),
+        workers=workers,
+    )
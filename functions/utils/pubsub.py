@@ -1,41 +1,88 @@
 import json
+import os
 from concurrent import futures
-from typing import Any, Callable, Iterable
+from typing import Any, Iterable
 
 from google.cloud import pubsub_v1
-from google.cloud.pubsub_v1.futures import Future
+from google.cloud.pubsub_v1.types import (
+    BatchSettings,
+    LimitExceededBehavior,
+    PublisherOptions,
+    PublishFlowControl,
+)
 from loguru import logger
+from utils.clients import get_client
 
+# How messages are batched into publish requests. Messages are sent once any
+# of these limits are reached.
+PUBLISH_BATCH_MAX_MESSAGES = int(os.environ.get("PUBLISH_BATCH_MAX_MESSAGES", "100"))
+PUBLISH_BATCH_MAX_BYTES = int(os.environ.get("PUBLISH_BATCH_MAX_BYTES", "1000000"))
+PUBLISH_BATCH_MAX_LATENCY = float(os.environ.get("PUBLISH_BATCH_MAX_LATENCY", "0.05"))
 
-def publish_to_topic(topic_name: str, data: Iterable[Any], timeout: int = 60) -> None:
+# How many messages (and bytes) may be waiting to be published before
+# publishing blocks, so large fan-outs don't buffer unboundedly.
+PUBLISH_MAX_PENDING_MESSAGES = int(
+    os.environ.get("PUBLISH_MAX_PENDING_MESSAGES", "1000")
+)
+PUBLISH_MAX_PENDING_BYTES = int(os.environ.get("PUBLISH_MAX_PENDING_BYTES", "10000000"))
+
+
+def get_publisher() -> pubsub_v1.PublisherClient:
+    """Returns the process' shared publisher client, so that its connection
+    and batching threads outlive each invocation.
+    """
+    return get_client("publisher", _create_publisher)
+
+
+def _create_publisher() -> pubsub_v1.PublisherClient:
+    """Creates a publisher client with the configured batching and flow
+    control.
+    """
+    return pubsub_v1.PublisherClient(
+        batch_settings=BatchSettings(
+            max_messages=PUBLISH_BATCH_MAX_MESSAGES,
+            max_bytes=PUBLISH_BATCH_MAX_BYTES,
+            max_latency=PUBLISH_BATCH_MAX_LATENCY,
+        ),
+        publisher_options=PublisherOptions(
+            flow_control=PublishFlowControl(
+                message_limit=PUBLISH_MAX_PENDING_MESSAGES,
+                byte_limit=PUBLISH_MAX_PENDING_BYTES,
+                limit_exceeded_behavior=LimitExceededBehavior.BLOCK,
+            )
+        ),
+    )
+
+
+def publish_to_topic(topic_name: str, data: Iterable[Any], timeout: int = 60) -> int:
     """Publish each object in the provided data list as a separate pubsub message
     to the given topic.
 
+    Messages are batched into publish requests by the instance's publisher,
+    and publishing blocks while too many are waiting to be sent.
+
     Parameters:
         topic_name: The name of the topic to publish to
         data: A list of objects to serialize, encode and publish as separate messages
         timeout: How long the publishing should wait until erroring.
+
+    Returns:
+        The number of messages published.
     """
-    publisher = pubsub_v1.PublisherClient()
-    publish_futures = []
-
-    def get_callback(publish_future: Future, data: str) -> Callable[[Future], None]:
-        def callback(publish_future: Future) -> None:
-            try:
-                # Wait 60 seconds for the publish call to succeed.
-                logger.info(publish_future.result(timeout=timeout))
-            except futures.TimeoutError:
-                logger.error(f"Publishing {data} timed out.")
-
-        return callback
-
-    for obj in data:
-        serialized = json.dumps(obj)
-        publish_future: Future = publisher.publish(
-            topic_name, serialized.encode("utf-8")
-        )
-        publish_future.add_done_callback(get_callback(publish_future, serialized))
-        publish_futures.append(publish_future)
-
-    futures.wait(publish_futures, return_when=futures.ALL_COMPLETED)
-    logger.info(f"Published messages with error handler to {topic_name}.")
+    publisher = get_publisher()
+    publish_futures = [
+        publisher.publish(topic_name, json.dumps(obj).encode("utf-8")) for obj in data
+    ]
+
+    done, not_done = futures.wait(publish_futures, timeout=timeout)
+    failures = [future for future in done if future.exception() is not None]
+    for future in failures:
+        logger.error(f"Publishing to {topic_name} failed: {future.exception()}")
+    if len(not_done) > 0:
+        logger.error(f"Publishing {len(not_done)} messages to {topic_name} timed out.")
+
+    published = len(done) - len(failures)
+    logger.info(
+        f"Published {published} of {len(publish_futures)} messages to {topic_name}."
+    )
+    return published
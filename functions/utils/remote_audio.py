@@ -0,0 +1,127 @@
+from io import BytesIO
+from typing import Iterable, Iterator, Optional, Tuple, TypeVar
+
+import numpy as np
+import utils.audio as audio
+import utils.wav as wav
+from loguru import logger
+from utils.cloud_storage import download_blob_range, get_blob_size
+
+T = TypeVar("T")
+
+# Neighbouring segments closer than this are fetched with a single request,
+# as reading the audio between them is cheaper than another round trip.
+MAX_GAP_MS = 2_000
+
+
+def read_header(bucket_name: str, blob_name: str) -> Optional[wav.WavHeader]:
+    """Reads the header of a wav file in cloud storage with a single ranged
+    request, without downloading any of its audio.
+
+    Parameters:
+        bucket_name: The ID of the GCS bucket holding the file.
+        blob_name: The path to the file within the bucket.
+
+    Returns:
+        The parsed header, with its data size clamped to the size of the
+        file, or None if the file isn't a wav file whose samples can be read
+        directly.
+    """
+    size = get_blob_size(bucket_name, blob_name)
+    if size is None:
+        return None
+
+    data = download_blob_range(bucket_name, blob_name, 0, wav.HEADER_PROBE_SIZE - 1)
+    header = wav.parse_header(data)
+    if header is None or header.dtype is None:
+        return None
+
+    available = size - header.data_offset
+    header.data_size = max(0, min(header.data_size, available))
+    return header
+
+
+def read_segments(
+    bucket_name: str,
+    blob_name: str,
+    header: wav.WavHeader,
+    segments: Iterable[Tuple[T, int, int]],
+    sample_rate: Optional[int] = None,
+    quality: Optional[audio.ResampleQuality] = None,
+    max_gap_ms: int = MAX_GAP_MS,
+) -> Iterator[Tuple[T, np.ndarray, int]]:
+    """Reads the samples for each of the given segments of a wav file in
+    cloud storage, fetching only the byte ranges the segments cover.
+
+    Segments separated by short gaps are fetched with a single request, so
+    segments are returned in order of their start times.
+
+    Parameters:
+        bucket_name: The ID of the GCS bucket holding the file.
+        blob_name: The path to the file within the bucket.
+        header: The header of the file, from read_header.
+        segments: An iterable of (key, start_ms, stop_ms) tuples, describing
+            the times each segment spans.
+        sample_rate: The sample rate to resample segments to. If None,
+            segments keep the sample rate of the file.
+        quality: The quality of resampling to use, if resampling.
+        max_gap_ms: The longest gap between segments fetched together.
+
+    Returns:
+        An iterator over (key, samples, sample_rate) tuples for each segment.
+    """
+    resampling = sample_rate is not None and sample_rate != header.sample_rate
+    margin_ms = audio.RESAMPLE_MARGIN_MS if resampling else 0
+    to_frame = lambda ms: int(ms * header.sample_rate / 1000)
+
+    requests = 0
+    fetched = 0
+    for group in audio.group_segments(segments, max_gap_ms):
+        range_start = max(0, to_frame(group[0][1] - margin_ms))
+        range_stop = to_frame(max(stop_ms for _, _, stop_ms in group) + margin_ms)
+        range_stop = max(range_start, min(range_stop, header.frames))
+
+        data = b""
+        if range_stop > range_start:
+            data = download_blob_range(
+                bucket_name,
+                blob_name,
+                header.frame_offset(range_start),
+                header.frame_offset(range_stop) - 1,
+            )
+            requests += 1
+            fetched += len(data)
+
+        # Wrap the range in a header of its own, so it reads as a wav file.
+        range_file = BytesIO(
+            wav.pack_header(
+                num_channels=header.num_channels,
+                sample_rate=header.sample_rate,
+                bits_per_sample=header.bits_per_sample,
+                data_size=len(data),
+                audio_format=header.audio_format,
+            )
+            + data
+        )
+
+        if resampling:
+            offset_ms = range_start * 1000 / header.sample_rate
+            shifted = [
+                (key, start_ms - offset_ms, stop_ms - offset_ms)
+                for key, start_ms, stop_ms in group
+            ]
+            yield from audio.read_segments_resampled(
+                range_file, shifted, sample_rate, margin_ms, quality  # type: ignore
+            )
+            continue
+
+        samples, _ = audio.read_samples(range_file)
+        for key, start_ms, stop_ms in group:
+            start = to_frame(start_ms) - range_start
+            stop = to_frame(stop_ms) - range_start
+            yield key, samples[:, start:stop], header.sample_rate
+
+    logger.info(
+        f"Fetched {fetched} of {header.data_size} audio bytes from {blob_name} "
+        f"in {requests} ranged requests"
+    )
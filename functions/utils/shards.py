@@ -0,0 +1,125 @@
+import json
+import tarfile
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, TypeVar, Union
+
+import numpy as np
+from pedalboard.io import WriteableAudioFile
+
+# Note: Must be in sync with the shard reader in the trainer service
+SHARD_EXTENSION = ".tar"
+INDEX_NAME = "index.jsonl"
+AUDIO_NAME = "audio.wav"
+
+Destination = TypeVar("Destination", Path, BytesIO)
+
+
+def write_shard(
+    destination: Destination,
+    entries: Iterable[Tuple[Dict[str, Any], np.ndarray, int]],
+) -> Destination:
+    """Packs some annotations and their audio into a single shard file.
+
+    A shard is an uncompressed tar archive containing:
+        - index.jsonl: One line per annotation, holding the annotation's
+          dictionary along with the offset and number of frames of its
+          audio within audio.wav.
+        - audio.wav: The audio for every annotation, concatenated.
+
+    Parameters:
+        destination: The path at which to create the shard, or a buffer to
+            create it in memory. Shards created in memory don't use any
+            scratch files.
+        entries: An iterable of (annotation dictionary, samples, sample_rate)
+            tuples, where the dictionary is in the shape of Annotation.to_dict
+            and samples has shape (channels, frames).
+
+    Returns:
+        The destination of the created shard.
+    """
+    scratch_audio: Union[Path, BytesIO] = (
+        destination.with_suffix(".shard.wav")
+        if isinstance(destination, Path)
+        else BytesIO()
+    )
+    index: List[Dict[str, Any]] = []
+    audio_file: Optional[WriteableAudioFile] = None
+    offset = 0
+
+    try:
+        for row, samples, sample_rate in entries:
+            if audio_file is None:
+                audio_file = _open_audio(scratch_audio, sample_rate, samples.shape[0])
+
+            frames = samples.shape[1]
+            audio_file.write(np.ascontiguousarray(samples))
+            index.append(row | {"offset": offset, "frames": frames})
+            offset += frames
+    finally:
+        if audio_file is not None:
+            audio_file.close()
+
+    index_data = "".join(json.dumps(entry) + "\n" for entry in index).encode("utf-8")
+    with open_shard(destination, "w") as shard:
+        index_info = tarfile.TarInfo(INDEX_NAME)
+        index_info.size = len(index_data)
+        shard.addfile(index_info, BytesIO(index_data))
+
+        if audio_file is not None and isinstance(scratch_audio, Path):
+            shard.add(scratch_audio, arcname=AUDIO_NAME)
+        elif audio_file is not None:
+            audio_info = tarfile.TarInfo(AUDIO_NAME)
+            audio_info.size = len(scratch_audio.getvalue())
+            scratch_audio.seek(0)
+            shard.addfile(audio_info, scratch_audio)
+
+    if isinstance(scratch_audio, Path):
+        scratch_audio.unlink(missing_ok=True)
+    if isinstance(destination, BytesIO):
+        destination.seek(0)
+    return destination
+
+
+def read_shard_index(shard_path: Union[Path, BytesIO]) -> List[Dict[str, Any]]:
+    """Reads the index of annotations within a shard.
+
+    Parameters:
+        shard_path: The path to the shard, or the shard in memory.
+
+    Returns:
+        A list of the index entries in the shard.
+    """
+    with open_shard(shard_path, "r") as shard:
+        index_file = shard.extractfile(INDEX_NAME)
+        if index_file is None:
+            return []
+        return [json.loads(line) for line in index_file if line.strip()]
+
+
+def _open_audio(
+    scratch_audio: Union[Path, BytesIO], sample_rate: int, num_channels: int
+) -> WriteableAudioFile:
+    """Opens a shard's scratch audio on disk or in memory for writing."""
+    if isinstance(scratch_audio, Path):
+        return WriteableAudioFile(
+            str(scratch_audio), samplerate=sample_rate, num_channels=num_channels
+        )
+    return WriteableAudioFile(
+        scratch_audio, samplerate=sample_rate, num_channels=num_channels, format="wav"
+    )
+
+
+def open_shard(shard: Union[Path, BytesIO], mode: str = "r") -> tarfile.TarFile:
+    """Opens a shard archive on disk or in memory.
+
+    Parameters:
+        shard: The path to the shard, or the shard in memory.
+        mode: The mode to open the archive with.
+
+    Returns:
+        The opened archive.
+    """
+    if isinstance(shard, Path):
+        return tarfile.open(shard, mode)
+    return tarfile.open(fileobj=shard, mode=mode)
@@ -0,0 +1,174 @@
+from bisect import bisect_left
+from copy import copy
+from typing import List
+
+import numpy as np
+from loguru import logger
+from models import Annotation
+
+# The length of the frames whose energy is measured.
+FRAME_MS = 20
+
+# The number of frames converted to floating point at once when measuring
+# energy, so that long recordings aren't copied in full.
+BLOCK_FRAMES = 3_000
+
+# The number of frames over which energy is averaged when looking for a pause,
+# so that a single quiet frame mid-word isn't mistaken for one.
+SMOOTHING_FRAMES = 10
+
+# Frames quieter than this, relative to the loudest frame, count as silence.
+SILENCE_THRESHOLD_DB = -35.0
+
+
+def frame_energies(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Measures the energy of consecutive frames of some audio.
+
+    The audio is read a block of frames at a time, so memory-mapped samples
+    are only paged in as they're measured.
+
+    Parameters:
+        samples: The samples of the audio, with shape (channels, frames).
+        sample_rate: The sample rate of the audio.
+
+    Returns:
+        The RMS energy of each frame in decibels, relative to full scale for
+        integer samples.
+    """
+    frame_length = max(1, sample_rate * FRAME_MS // 1000)
+    num_frames = samples.shape[1] // frame_length
+    scale = 1.0
+    if np.issubdtype(samples.dtype, np.integer):
+        scale = float(np.iinfo(samples.dtype).max)
+
+    rms = np.empty(num_frames, dtype=np.float32)
+    for first in range(0, num_frames, BLOCK_FRAMES):
+        last = min(first + BLOCK_FRAMES, num_frames)
+        block = samples[:, first * frame_length : last * frame_length]
+        mono = block.astype(np.float32).mean(axis=0) / scale
+        frames = mono.reshape(last - first, frame_length)
+        rms[first:last] = np.sqrt(np.mean(frames**2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def find_pauses(energies: np.ndarray, count: int, min_frames: int) -> List[int]:
+    """Finds the points in some audio at which to cut it, keeping the pieces
+    between cuts at least a minimum length.
+
+    The middles of the longest silences are preferred, then the quietest
+    points, so that continuous speech is still cut where it dips.
+
+    Parameters:
+        energies: The energy of each frame of the audio, from frame_energies.
+        count: The number of cuts to find.
+        min_frames: The fewest frames allowed between cuts, and between a cut
+            and either end of the audio.
+
+    Returns:
+        The frames at which to cut, in order. There are fewer than count of
+        them if the audio is too short to fit them all.
+    """
+    window = np.ones(SMOOTHING_FRAMES) / SMOOTHING_FRAMES
+    smoothed = np.convolve(energies, window, mode="same")
+    silence = _silence_lengths(energies)
+
+    total = len(energies)
+    cuts: List[int] = []
+    for frame in np.lexsort((smoothed, -silence)).tolist():
+        if len(cuts) == count:
+            break
+        if frame < min_frames or total - frame < min_frames:
+            continue
+
+        # Keep away from the cuts already on either side of this frame
+        position = bisect_left(cuts, frame)
+        if position > 0 and frame - cuts[position - 1] < min_frames:
+            continue
+        if position < len(cuts) and cuts[position] - frame < min_frames:
+            continue
+        cuts.insert(position, frame)
+    return cuts
+
+
+def split_annotation(
+    annotation: Annotation,
+    samples: np.ndarray,
+    sample_rate: int,
+    min_chunk_ms: int,
+    max_chunk_ms: int,
+) -> List[Annotation]:
+    """Splits an untimed annotation spanning some long audio into a timed
+    annotation per line of its transcript.
+
+    Lines are assumed to be spoken in order, with the longest pauses in the
+    audio falling between them, so the audio is cut at as many of its
+    pauses as are needed. Transcripts without line breaks aren't split, as
+    there's no telling which of their words fall in which chunk.
+
+    Chunks longer than max_chunk_ms are dropped, along with the whole
+    annotation if it can't be split, so that no example is too long to train
+    on.
+
+    Parameters:
+        annotation: The untimed annotation to split, before its transcript is
+            cleaned.
+        samples: The samples of the audio, with shape (channels, frames).
+        sample_rate: The sample rate of the audio.
+        min_chunk_ms: The shortest a chunk may be.
+        max_chunk_ms: The longest a chunk may be.
+
+    Returns:
+        A list of timed annotations, or the given annotation unchanged if its
+        audio is no longer than max_chunk_ms.
+    """
+    duration_ms = samples.shape[1] * 1000 // sample_rate
+    if duration_ms <= max_chunk_ms:
+        return [annotation]
+
+    lines = [line.strip() for line in annotation.transcript.splitlines()]
+    lines = [line for line in lines if line]
+    cuts: List[int] = []
+    if len(lines) > 1:
+        energies = frame_energies(samples, sample_rate)
+        min_frames = max(1, min_chunk_ms // FRAME_MS)
+        cuts = find_pauses(energies, len(lines) - 1, min_frames)
+
+    if len(cuts) < len(lines) - 1 or len(lines) < 2:
+        logger.warning(
+            f"Dropping {annotation.audio_file_name}, as its {duration_ms}ms of audio "
+            f"can't be split into a chunk for each of its {len(lines)} lines"
+        )
+        return []
+
+    bounds = [0] + [cut * FRAME_MS for cut in cuts] + [duration_ms]
+    result = []
+    for line, start_ms, stop_ms in zip(lines, bounds[:-1], bounds[1:]):
+        if stop_ms - start_ms > max_chunk_ms:
+            logger.warning(
+                f"Dropping {start_ms}-{stop_ms}ms of {annotation.audio_file_name}, "
+                f"as it's longer than {max_chunk_ms}ms"
+            )
+            continue
+
+        chunk = copy(annotation)
+        chunk.transcript = line
+        chunk.start_ms = start_ms
+        chunk.stop_ms = stop_ms
+        result.append(chunk)
+    return result
+
+
+def _silence_lengths(energies: np.ndarray) -> np.ndarray:
+    """Measures how far each frame of some audio is from the nearest voiced
+    frame, which is greatest in the middle of the longest silences.
+    """
+    total = len(energies)
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    voiced = np.flatnonzero(energies > energies.max() + SILENCE_THRESHOLD_DB)
+    frames = np.arange(total)
+    # Pad with voiced frames just beyond either end of the audio
+    voiced = np.concatenate([[-1], voiced, [total]])
+    following = np.searchsorted(voiced, frames)
+    return np.minimum(frames - voiced[following - 1], voiced[following] - frames)
@@ -0,0 +1,236 @@
+import os
+import struct
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import Optional, Union
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Enough to find the data chunk in wav files with reasonably sized metadata.
+HEADER_PROBE_SIZE = 64 * 1024
+
+
+@dataclass
+class WavHeader:
+    """A class representing the parsed RIFF header of a wav file."""
+
+    audio_format: int
+    num_channels: int
+    sample_rate: int
+    bits_per_sample: int
+    data_offset: int
+    data_size: int
+    riff_size: int = 0
+
+    @property
+    def block_align(self) -> int:
+        """The number of bytes in a single frame (one sample per channel)."""
+        return self.num_channels * self.bits_per_sample // 8
+
+    @property
+    def frames(self) -> int:
+        """The number of frames in the data chunk."""
+        return self.data_size // self.block_align
+
+    @property
+    def duration_ms(self) -> int:
+        """The duration of the audio in milliseconds."""
+        return self.frames * 1000 // self.sample_rate
+
+    @property
+    def dtype(self) -> Optional[str]:
+        """The numpy dtype of the samples in the data chunk, or None if the
+        sample format can't be read directly.
+        """
+        if self.audio_format == WAVE_FORMAT_PCM and self.bits_per_sample == 16:
+            return "<i2"
+        if self.audio_format == WAVE_FORMAT_PCM and self.bits_per_sample == 32:
+            return "<i4"
+        if self.audio_format == WAVE_FORMAT_IEEE_FLOAT and self.bits_per_sample == 32:
+            return "<f4"
+        return None
+
+    def frame_offset(self, frame: int) -> int:
+        """Returns the byte offset within the file of the given frame."""
+        return self.data_offset + frame * self.block_align
+
+
+def parse_header(data: bytes) -> Optional[WavHeader]:
+    """Parses the RIFF header at the start of a wav file.
+
+    Parameters:
+        data: The leading bytes of the file. These must extend at least as
+            far as the start of the data chunk.
+
+    Returns:
+        The parsed header, or None if the data isn't the start of a valid wav
+        file.
+    """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    (riff_size,) = struct.unpack("<I", data[4:8])
+
+    fmt = None
+    position = 12
+    while position + 8 <= len(data):
+        chunk_id = data[position : position + 4]
+        (chunk_size,) = struct.unpack("<I", data[position + 4 : position + 8])
+        body = position + 8
+
+        if chunk_id == b"fmt ":
+            if body + 16 > len(data):
+                return None
+            fmt = struct.unpack("<HHIIHH", data[body : body + 16])
+            audio_format = fmt[0]
+            if audio_format == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 26:
+                # The real format is the first field of the sub-format GUID.
+                (audio_format,) = struct.unpack("<H", data[body + 24 : body + 26])
+            fmt = (audio_format, *fmt[1:])
+
+        elif chunk_id == b"data":
+            if fmt is None:
+                return None
+            audio_format, num_channels, sample_rate, _, _, bits_per_sample = fmt
+            return WavHeader(
+                audio_format=audio_format,
+                num_channels=num_channels,
+                sample_rate=sample_rate,
+                bits_per_sample=bits_per_sample,
+                data_offset=body,
+                data_size=chunk_size,
+                riff_size=riff_size,
+            )
+
+        # Chunks are padded to an even number of bytes.
+        position = body + chunk_size + (chunk_size % 2)
+
+    return None
+
+
+def read_header(audio_path: Union[Path, BytesIO]) -> Optional[WavHeader]:
+    """Reads the RIFF header of a wav file on disk or in memory.
+
+    The data size is clamped to the size of the file, as some recorders
+    leave it unset when streaming.
+
+    Parameters:
+        audio_path: The path to the wav file, or the file in memory.
+
+    Returns:
+        The parsed header, or None if the file isn't a valid wav file.
+    """
+    if isinstance(audio_path, Path):
+        with open(audio_path, "rb") as audio_file:
+            header = parse_header(audio_file.read(HEADER_PROBE_SIZE))
+        file_size = audio_path.stat().st_size
+    else:
+        data = audio_path.getvalue()
+        header = parse_header(data[:HEADER_PROBE_SIZE])
+        file_size = len(data)
+
+    if header is not None:
+        available = file_size - header.data_offset
+        header.data_size = max(0, min(header.data_size, available))
+    return header
+
+
+def is_consistent(header: WavHeader, file_size: int) -> bool:
+    """Checks whether the chunk sizes in a header agree with the file size.
+
+    Recorders which stream to disk often leave these unset, or set to their
+    maximum values, which not every reader copes with.
+
+    Parameters:
+        header: The unclamped header of the file, from parse_header.
+        file_size: The size of the file in bytes.
+
+    Returns:
+        True iff the header's sizes are consistent with the file.
+    """
+    data_end = header.data_offset + header.data_size
+    return (
+        data_end <= file_size
+        and data_end <= header.riff_size + 8 <= file_size
+        and header.data_size % header.block_align == 0
+    )
+
+
+def pack_header(
+    num_channels: int,
+    sample_rate: int,
+    bits_per_sample: int,
+    data_size: int,
+    audio_format: int = WAVE_FORMAT_PCM,
+) -> bytes:
+    """Builds a canonical 44 byte wav header.
+
+    Parameters:
+        num_channels: The number of channels in the audio.
+        sample_rate: The sample rate of the audio.
+        bits_per_sample: The number of bits in each sample.
+        data_size: The number of bytes of audio data following the header.
+        audio_format: The format code of the audio data.
+
+    Returns:
+        The header bytes.
+    """
+    block_align = num_channels * bits_per_sample // 8
+    return (
+        b"RIFF"
+        + struct.pack("<I", 36 + data_size)
+        + b"WAVE"
+        + b"fmt "
+        + struct.pack(
+            "<IHHIIHH",
+            16,
+            audio_format,
+            num_channels,
+            sample_rate,
+            sample_rate * block_align,
+            block_align,
+            bits_per_sample,
+        )
+        + b"data"
+        + struct.pack("<I", data_size)
+    )
+
+
+def rewrite_header(audio_path: Path, destination: Path) -> None:
+    """Copies a wav file to the destination with a canonical header, whose
+    sizes match the audio data actually present. The audio data is copied
+    as is, without decoding.
+
+    Parameters:
+        audio_path: The path of the wav file to repair.
+        destination: The destination at which to create the repaired file.
+    """
+    header = read_header(audio_path)
+    if header is None:
+        raise ValueError(f"Not a wav file: {audio_path}")
+
+    data_size = header.frames * header.block_align
+    partial_destination = destination.with_suffix(f".partial{destination.suffix}")
+
+    with open(audio_path, "rb") as source, open(partial_destination, "wb") as target:
+        target.write(
+            pack_header(
+                num_channels=header.num_channels,
+                sample_rate=header.sample_rate,
+                bits_per_sample=header.bits_per_sample,
+                data_size=data_size,
+                audio_format=header.audio_format,
+            )
+        )
+        source.seek(header.data_offset)
+        remaining = data_size
+        while remaining > 0:
+            chunk = source.read(min(remaining, HEADER_PROBE_SIZE))
+            if len(chunk) == 0:
+                break
+            target.write(chunk)
+            remaining -= len(chunk)
+
+    os.replace(partial_destination, destination)
@@ -0,0 +1,36 @@
+from unittest.mock import Mock
+
+import pytest
+import trainer.clients as clients
+
+
+@pytest.fixture(autouse=True)
+def reset_clients():
+    clients.reset()
+    yield
+    clients.reset()
+
+
+def test_get_client_creates_once():
+    factory = Mock(side_effect=object)
+    assert clients.get_client("test", factory) is clients.get_client("test", factory)
+    factory.assert_called_once()
+
+
+def test_reset():
+    factory = Mock(side_effect=object)
+    first = clients.get_client("test", factory)
+    clients.reset()
+    assert clients.get_client("test", factory) is not first
+
+
+def test_firestore_app_is_initialized_once(mocker):
+    mocker.patch("trainer.clients.firebase_admin.get_app", side_effect=ValueError)
+    initialize_mock: Mock = mocker.patch(
+        "trainer.clients.firebase_admin.initialize_app"
+    )
+    mocker.patch("trainer.clients.credentials.ApplicationDefault")
+    mocker.patch("trainer.clients.firestore.client")
+
+    assert clients.get_firestore_client() is clients.get_firestore_client()
+    initialize_mock.assert_called_once()
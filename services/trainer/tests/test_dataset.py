@@ -1,8 +1,19 @@
+import json
 import os
 import shutil
+import tarfile
 from pathlib import Path
 
-from trainer.dataset import create_dataset
+import numpy as np
+import soundfile
+from datasets import Audio
+from trainer.dataset import (
+    MANIFEST_NAME,
+    SHARD_AUDIO_NAME,
+    SHARD_INDEX_NAME,
+    create_dataset,
+    unpack_shard_audio,
+)
 from trainer.model_metadata import ModelMetadata, TrainingOptions
 
 DATA_PATH = (Path(__file__).parent / "data").resolve()
@@ -16,6 +27,32 @@ METADATA = ModelMetadata(
 )
 
 
+def _write_shard(destination: Path, stems: list[str]) -> None:
+    index = []
+    audio = []
+    offset = 0
+    for stem in stems:
+        with open(DATASET_PATH / f"{stem}.json") as f:
+            annotation = json.load(f)
+        samples, sampling_rate = soundfile.read(
+            DATASET_PATH / f"{stem}.wav", dtype="int16"
+        )
+        index.append(annotation | {"offset": offset, "frames": len(samples)})
+        audio.append(samples)
+        offset += len(samples)
+
+    audio_path = destination.with_suffix(".wav")
+    soundfile.write(audio_path, np.concatenate(audio), sampling_rate)
+    index_path = destination.with_suffix(".jsonl")
+    index_path.write_text("".join(json.dumps(entry) + "\n" for entry in index))
+
+    with tarfile.open(destination, "w") as shard:
+        shard.add(index_path, arcname=SHARD_INDEX_NAME)
+        shard.add(audio_path, arcname=SHARD_AUDIO_NAME)
+    audio_path.unlink()
+    index_path.unlink()
+
+
 def test_create_dataset(tmp_path: Path):
     for file in os.listdir(DATASET_PATH):
         shutil.copy(DATASET_PATH / file, tmp_path)
@@ -23,3 +60,99 @@ def test_create_dataset(tmp_path: Path):
     result = create_dataset(METADATA, tmp_path, tmp_path / "cache")
     assert "test" in result
     assert "train" in result
+
+    # The split is seeded, so it's the same every time.
+    again = create_dataset(METADATA, tmp_path, tmp_path / "cache")
+    assert again["test"]["transcript"] == result["test"]["transcript"]
+
+
+def test_create_dataset_from_shards(tmp_path: Path):
+    dataset_path = tmp_path / "dataset"
+    dataset_path.mkdir()
+    _write_shard(dataset_path / "abui.tar", ["abui_1", "abui_2", "abui_3"])
+
+    result = create_dataset(METADATA, dataset_path, tmp_path / "cache")
+    assert len(result["train"]) + len(result["test"]) == 3
+
+    # Examples reference their unpacked audio, rather than holding it
+    row = result["train"].cast_column("audio", Audio(decode=False))[0]
+    assert row["audio"]["bytes"] is None
+    assert Path(row["audio"]["path"]).is_relative_to(tmp_path / "cache")
+    assert soundfile.info(row["audio"]["path"]).frames > 0
+    assert row["transcript"] != ""
+
+
+def test_create_dataset_from_shards_and_files(tmp_path: Path):
+    dataset_path = tmp_path / "dataset"
+    dataset_path.mkdir()
+    _write_shard(dataset_path / "abui.tar", ["abui_1", "abui_2"])
+    for file in ("abui_3.json", "abui_3.wav"):
+        shutil.copy(DATASET_PATH / file, dataset_path)
+
+    result = create_dataset(METADATA, dataset_path, tmp_path / "cache")
+    assert len(result["train"]) + len(result["test"]) == 3
+
+
+def _manifest_entry(stem: str, path: str, offset=None) -> dict:
+    with open(DATASET_PATH / f"{stem}.json") as f:
+        annotation = json.load(f)
+    info = soundfile.info(DATASET_PATH / f"{stem}.wav")
+    return {
+        "path": path,
+        "transcript": annotation["transcript"],
+        "duration_ms": int(info.duration * 1000),
+        "samples": info.frames,
+        "sample_rate": info.samplerate,
+        "transcript_length": len(annotation["transcript"]),
+        "speaker": annotation.get("speaker_id"),
+        "crc32c": "",
+        "offset": offset,
+    }
+
+
+def test_create_dataset_from_manifest(tmp_path: Path):
+    dataset_path = tmp_path / "dataset"
+    dataset_path.mkdir()
+    _write_shard(dataset_path / "abui.tar", ["abui_1", "abui_2"])
+    shutil.copy(DATASET_PATH / "abui_3.wav", dataset_path)
+
+    frames = soundfile.info(DATASET_PATH / "abui_1.wav").frames
+    entries = [
+        _manifest_entry("abui_1", "abui.tar", offset=0),
+        _manifest_entry("abui_2", "abui.tar", offset=frames),
+        _manifest_entry("abui_3", "abui_3.wav"),
+    ]
+    (dataset_path / MANIFEST_NAME).write_text(
+        "".join(json.dumps(entry) + "\n" for entry in entries)
+    )
+
+    result = create_dataset(METADATA, dataset_path, tmp_path / "cache")
+    rows = [
+        row
+        for split in ("train", "test")
+        for row in result[split].cast_column("audio", Audio(decode=False))
+    ]
+    assert sorted(row["transcript"] for row in rows) == sorted(
+        entry["transcript"] for entry in entries
+    )
+
+    # Shard examples are sliced from the shard's audio at their offsets
+    [second] = [row for row in rows if row["transcript"] == entries[1]["transcript"]]
+    samples, _ = soundfile.read(second["audio"]["path"], dtype="int16")
+    expected, _ = soundfile.read(DATASET_PATH / "abui_2.wav", dtype="int16")
+    assert np.array_equal(samples, expected)
+
+
+def test_unpack_shard_audio_reuses_files(tmp_path: Path):
+    shard_file = tmp_path / "abui.tar"
+    _write_shard(shard_file, ["abui_1", "abui_2"])
+    frames = soundfile.info(DATASET_PATH / "abui_1.wav").frames
+
+    paths = unpack_shard_audio(shard_file, [(0, frames)], tmp_path / "cache")
+    modified = Path(paths[0]).stat().st_mtime_ns
+    assert unpack_shard_audio(shard_file, [(0, frames)], tmp_path / "cache") == paths
+    assert Path(paths[0]).stat().st_mtime_ns == modified
+
+    samples, _ = soundfile.read(paths[0], dtype="int16")
+    expected, _ = soundfile.read(DATASET_PATH / "abui_1.wav", dtype="int16")
+    assert np.array_equal(samples, expected)
@@ -0,0 +1,117 @@
+import json
+from pathlib import Path
+from typing import List
+
+import pytest
+from trainer.dataset import MANIFEST_NAME
+from trainer.dataset_cache import get_dataset_path, sync_dataset
+
+PREFIX = "user/dataset/"
+
+
+class FakeBlob:
+    def __init__(self, name: str, contents: str, generation: int, crc32c: str):
+        self.name = PREFIX + name
+        self.contents = contents
+        self.generation = generation
+        self.crc32c = crc32c
+        self.size = len(contents)
+        self.downloads = 0
+
+    def download_to_filename(self, path: Path) -> None:
+        self.downloads += 1
+        Path(path).write_text(self.contents)
+
+
+def _manifest(*paths: str) -> str:
+    return "".join(json.dumps({"path": path}) + "\n" for path in paths)
+
+
+@pytest.fixture()
+def listing(mocker) -> List[FakeBlob]:
+    blobs: List[FakeBlob] = []
+    mocker.patch(
+        "trainer.dataset_cache.list_blobs_with_prefix",
+        side_effect=lambda *args, **kwargs: list(blobs),
+    )
+    return blobs
+
+
+def _sync(tmp_path: Path) -> Path:
+    return sync_dataset("bucket", "user", "dataset", tmp_path, workers=4)
+
+
+def test_sync_dataset_downloads_by_relative_name(tmp_path: Path, listing):
+    listing.extend([FakeBlob("a.json", "a", 1, "x"), FakeBlob("a.wav", "b", 1, "y")])
+
+    dataset_path = _sync(tmp_path)
+    assert dataset_path == get_dataset_path(tmp_path, "user", "dataset")
+    assert sorted(file.name for file in dataset_path.iterdir()) == ["a.json", "a.wav"]
+    assert (dataset_path / "a.wav").read_text() == "b"
+
+
+def test_sync_dataset_reuses_unchanged_files(tmp_path: Path, listing):
+    listing.extend([FakeBlob("a.json", "a", 1, "x"), FakeBlob("a.wav", "b", 1, "y")])
+    _sync(tmp_path)
+    _sync(tmp_path)
+    assert [blob.downloads for blob in listing] == [1, 1]
+
+
+def test_sync_dataset_fetches_changed_files(tmp_path: Path, listing):
+    listing.extend([FakeBlob("a.json", "a", 1, "x"), FakeBlob("a.wav", "b", 1, "y")])
+    dataset_path = _sync(tmp_path)
+
+    # A rewrite with new contents is fetched, but one with the same contents
+    # (and so the same checksum) isn't.
+    listing[0] = FakeBlob("a.json", "c", 2, "z")
+    listing[1] = FakeBlob("a.wav", "b", 2, "y")
+    _sync(tmp_path)
+    assert [blob.downloads for blob in listing] == [1, 0]
+    assert (dataset_path / "a.json").read_text() == "c"
+
+
+def test_sync_dataset_refetches_missing_files(tmp_path: Path, listing):
+    listing.append(FakeBlob("a.wav", "b", 1, "y"))
+    dataset_path = _sync(tmp_path)
+    (dataset_path / "a.wav").unlink()
+
+    _sync(tmp_path)
+    assert listing[0].downloads == 2
+
+
+def test_sync_dataset_with_manifest(tmp_path: Path, listing):
+    listing.extend(
+        [
+            FakeBlob(MANIFEST_NAME, _manifest("b.tar", "b.tar"), 1, "m"),
+            FakeBlob("a.wav", "a", 1, "x"),
+            FakeBlob("b.tar", "b", 1, "y"),
+        ]
+    )
+
+    dataset_path = _sync(tmp_path)
+    assert sorted(file.name for file in dataset_path.iterdir()) == [
+        MANIFEST_NAME,
+        "b.tar",
+    ]
+
+
+def test_sync_dataset_removes_files_no_longer_in_manifest(tmp_path: Path, listing):
+    listing.extend(
+        [
+            FakeBlob(MANIFEST_NAME, _manifest("a.tar", "b.tar"), 1, "m"),
+            FakeBlob("a.tar", "a", 1, "x"),
+            FakeBlob("b.tar", "b", 1, "y"),
+        ]
+    )
+    dataset_path = _sync(tmp_path)
+
+    listing[0] = FakeBlob(MANIFEST_NAME, _manifest("b.tar"), 2, "n")
+    _sync(tmp_path)
+    assert not (dataset_path / "a.tar").exists()
+    assert listing[2].downloads == 1
+
+
+def test_sync_dataset_with_missing_manifest_files(tmp_path: Path, listing):
+    listing.append(FakeBlob(MANIFEST_NAME, _manifest("a.tar"), 1, "m"))
+    with pytest.raises(FileNotFoundError):
+        _sync(tmp_path)
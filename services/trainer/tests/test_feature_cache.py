@@ -0,0 +1,68 @@
+import shutil
+from dataclasses import replace
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+from datasets import Dataset
+from tests.test_dataset import DATASET_PATH, METADATA
+from trainer.dataset import MANIFEST_NAME
+from trainer.feature_cache import feature_cache_key, load_features
+
+
+@pytest.fixture()
+def dataset_path(tmp_path: Path) -> Path:
+    path = tmp_path / "dataset"
+    shutil.copytree(DATASET_PATH, path)
+    return path
+
+
+@pytest.fixture()
+def prepare_mocks(mocker):
+    dataset = Dataset.from_dict({"input_values": [[0.0, 1.0]] * 4, "labels": [[1]] * 4})
+    create_mock: Mock = mocker.patch(
+        "trainer.feature_cache.create_dataset",
+        return_value=dataset.train_test_split(test_size=0.5, seed=0),
+    )
+    prepare_mock: Mock = mocker.patch(
+        "trainer.feature_cache.prepare_dataset", side_effect=lambda dataset, _: dataset
+    )
+    return create_mock, prepare_mock
+
+
+def test_load_features_reuses_prepared_features(
+    tmp_path: Path, dataset_path: Path, prepare_mocks
+):
+    create_mock, prepare_mock = prepare_mocks
+
+    first = load_features(METADATA, dataset_path, Mock(), tmp_path)
+    second = load_features(METADATA, dataset_path, Mock(), tmp_path)
+    create_mock.assert_called_once()
+    prepare_mock.assert_called_once()
+    assert second["train"].to_dict() == first["train"].to_dict()
+    assert len(list((tmp_path / "features").iterdir())) == 1
+
+
+def test_feature_cache_key_depends_on_options(dataset_path: Path):
+    key = feature_cache_key(METADATA, dataset_path)
+    assert feature_cache_key(METADATA, dataset_path) == key
+
+    assert (
+        feature_cache_key(replace(METADATA, sampling_rate=8_000), dataset_path) != key
+    )
+    assert feature_cache_key(replace(METADATA, base_model="other"), dataset_path) != key
+    options = replace(METADATA.options, seed=1)
+    assert feature_cache_key(replace(METADATA, options=options), dataset_path) != key
+    options = replace(METADATA.options, test_size=0.5)
+    assert feature_cache_key(replace(METADATA, options=options), dataset_path) != key
+
+
+def test_feature_cache_key_depends_on_dataset(dataset_path: Path):
+    key = feature_cache_key(METADATA, dataset_path)
+    (dataset_path / "abui_1.json").write_text('{"transcript": "changed"}')
+    assert feature_cache_key(METADATA, dataset_path) != key
+
+    (dataset_path / MANIFEST_NAME).write_text('{"path": "a.wav"}\n')
+    key = feature_cache_key(METADATA, dataset_path)
+    (dataset_path / MANIFEST_NAME).write_text('{"path": "b.wav"}\n')
+    assert feature_cache_key(METADATA, dataset_path) != key
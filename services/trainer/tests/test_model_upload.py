@@ -0,0 +1,221 @@
+import base64
+import json
+import os
+from pathlib import Path
+from typing import List, Optional
+from unittest.mock import Mock
+
+import google_crc32c
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+from trainer.model_upload import (
+    CHUNK_ALIGNMENT,
+    Artifacts,
+    _crc32c,
+    _session_name,
+    select_artifacts,
+    upload_model_files,
+)
+
+PREFIX = "user/model/"
+MODEL_FILES = [
+    "config.json",
+    "preprocessor_config.json",
+    "pytorch_model.bin",
+    "trainer_state.json",
+    "training_args.bin",
+    "checkpoint-10/optimizer.pt",
+    "checkpoint-10/pytorch_model.bin",
+    "runs/events.out",
+]
+
+
+class FakeSession:
+    """A resumable upload session, which can fail the request of a chunk."""
+
+    def __init__(self, size: int, fail_at: Optional[int] = None, status: int = 0):
+        self.size = size
+        self.data = bytearray()
+        self.chunks: List[int] = []
+        self.expired = False
+        # The offset of the chunk to fail, and the status to fail it with (or
+        # a dropped connection if 0).
+        self.fail_at = fail_at
+        self.status = status
+
+    def request(self, method, url, data=None, headers=None, timeout=None):
+        if self.expired:
+            return self._response(404)
+
+        content_range = CaseInsensitiveDict(headers)["Content-Range"]
+        if not content_range.startswith("bytes */"):
+            start = int(content_range.split()[1].split("-")[0])
+            if start == self.fail_at:
+                self.fail_at = None
+                if self.status == 0:
+                    raise requests.ConnectionError("reset")
+                return self._response(self.status)
+            assert start == len(self.data)
+            self.chunks.append(start)
+            self.data.extend(data)
+
+        if len(self.data) == self.size:
+            return self._response(200, {"crc32c": self.checksum()})
+        headers = {"Range": f"bytes=0-{len(self.data) - 1}"} if self.data else {}
+        return self._response(308, headers=headers)
+
+    def checksum(self) -> str:
+        digest = google_crc32c.Checksum(bytes(self.data)).digest()
+        return base64.b64encode(digest).decode("utf-8")
+
+    @staticmethod
+    def _response(status: int, body=None, headers=None) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers or {})
+        response._content = json.dumps(body or {}).encode("utf-8")
+        return response
+
+
+@pytest.fixture()
+def model_path(tmp_path: Path) -> Path:
+    path = tmp_path / "output"
+    for name in MODEL_FILES:
+        (path / name).parent.mkdir(parents=True, exist_ok=True)
+        (path / name).write_text(name)
+    return path
+
+
+@pytest.fixture()
+def client_mock(mocker) -> Mock:
+    mocker.patch("google.resumable_media.requests._request_helpers.time.sleep")
+    mocker.patch("trainer.model_upload.list_blobs_with_prefix", return_value=[])
+    client = mocker.patch("trainer.model_upload.get_storage_client").return_value
+    blob = client.bucket.return_value.blob.return_value
+    blob.create_resumable_upload_session.return_value = "url"
+    return client
+
+
+def test_select_inference_artifacts(model_path: Path):
+    files = select_artifacts(model_path, Artifacts.INFERENCE)
+    assert files == [
+        Path("config.json"),
+        Path("preprocessor_config.json"),
+        Path("pytorch_model.bin"),
+    ]
+
+
+def test_select_full_artifacts(model_path: Path):
+    files = select_artifacts(model_path, Artifacts.FULL)
+    assert sorted(file.as_posix() for file in files) == sorted(MODEL_FILES)
+
+
+def test_upload_model_files_skips_unchanged_files(
+    model_path: Path, tmp_path: Path, client_mock: Mock, mocker
+):
+    unchanged = Mock(crc32c=_crc32c(model_path / "config.json"))
+    unchanged.name = PREFIX + "config.json"
+    mocker.patch(
+        "trainer.model_upload.list_blobs_with_prefix", return_value=[unchanged]
+    )
+    blob_mock = client_mock.bucket.return_value.blob
+
+    report = upload_model_files(
+        "bucket", model_path, PREFIX, tmp_path / "sessions", Artifacts.INFERENCE
+    )
+    assert (report.uploaded, report.skipped) == (2, 1)
+    uploaded = {call.args[0] for call in blob_mock.call_args_list}
+    assert uploaded == {
+        PREFIX + "preprocessor_config.json",
+        PREFIX + "pytorch_model.bin",
+    }
+
+
+def _large_model(tmp_path: Path, size: int) -> Path:
+    model_path = tmp_path / "large"
+    model_path.mkdir()
+    (model_path / "pytorch_model.bin").write_bytes(os.urandom(size))
+    return model_path
+
+
+def test_chunked_upload_resumes_after_failed_chunk(tmp_path: Path, client_mock: Mock):
+    size = CHUNK_ALIGNMENT * 2 + 100
+    model_path = _large_model(tmp_path, size)
+    session = FakeSession(size, fail_at=CHUNK_ALIGNMENT)
+    client_mock._http = session
+
+    report = upload_model_files(
+        "bucket", model_path, PREFIX, tmp_path / "sessions", chunk_size=CHUNK_ALIGNMENT
+    )
+    assert report.uploaded == 1
+    assert session.chunks == [0, CHUNK_ALIGNMENT, CHUNK_ALIGNMENT * 2]
+    assert bytes(session.data) == (model_path / "pytorch_model.bin").read_bytes()
+    assert list((tmp_path / "sessions").iterdir()) == []
+
+
+def test_chunked_upload_recovers_after_rejected_chunk(
+    tmp_path: Path, client_mock: Mock
+):
+    size = CHUNK_ALIGNMENT * 2 + 100
+    model_path = _large_model(tmp_path, size)
+    session = FakeSession(size, fail_at=CHUNK_ALIGNMENT, status=400)
+    client_mock._http = session
+
+    upload_model_files(
+        "bucket", model_path, PREFIX, tmp_path / "sessions", chunk_size=CHUNK_ALIGNMENT
+    )
+    assert session.chunks == [0, CHUNK_ALIGNMENT, CHUNK_ALIGNMENT * 2]
+    assert bytes(session.data) == (model_path / "pytorch_model.bin").read_bytes()
+
+
+def test_chunked_upload_resumes_recorded_session(tmp_path: Path, client_mock: Mock):
+    size = CHUNK_ALIGNMENT * 2 + 100
+    model_path = _large_model(tmp_path, size)
+    contents = (model_path / "pytorch_model.bin").read_bytes()
+
+    # A previous run committed the first chunk before being interrupted.
+    session = FakeSession(size)
+    session.data.extend(contents[:CHUNK_ALIGNMENT])
+    client_mock._http = session
+    sessions_path = tmp_path / "sessions"
+    sessions_path.mkdir()
+    session_name = _session_name(
+        PREFIX + "pytorch_model.bin", _crc32c(model_path / "pytorch_model.bin")
+    )
+    (sessions_path / session_name).write_text("url")
+
+    upload_model_files(
+        "bucket", model_path, PREFIX, sessions_path, chunk_size=CHUNK_ALIGNMENT
+    )
+    assert session.chunks == [CHUNK_ALIGNMENT, CHUNK_ALIGNMENT * 2]
+    assert bytes(session.data) == contents
+    blob = client_mock.bucket.return_value.blob.return_value
+    blob.create_resumable_upload_session.assert_not_called()
+
+
+def test_chunked_upload_restarts_expired_session(tmp_path: Path, client_mock: Mock):
+    size = CHUNK_ALIGNMENT * 2 + 100
+    model_path = _large_model(tmp_path, size)
+    sessions_path = tmp_path / "sessions"
+    sessions_path.mkdir()
+    session_name = _session_name(
+        PREFIX + "pytorch_model.bin", _crc32c(model_path / "pytorch_model.bin")
+    )
+    (sessions_path / session_name).write_text("expired")
+
+    session = FakeSession(size)
+    expired = FakeSession(size)
+    expired.expired = True
+    client_mock._http = Mock(
+        request=lambda method, url, **kwargs: (
+            expired if url == "expired" else session
+        ).request(method, url, **kwargs)
+    )
+
+    upload_model_files(
+        "bucket", model_path, PREFIX, sessions_path, chunk_size=CHUNK_ALIGNMENT
+    )
+    assert bytes(session.data) == (model_path / "pytorch_model.bin").read_bytes()
+    blob = client_mock.bucket.return_value.blob.return_value
+    blob.create_resumable_upload_session.assert_called_once()
@@ -1,4 +1,5 @@
 import base64
+import json
 from http import HTTPStatus
 from pathlib import Path
 from typing import Any, Dict
@@ -13,7 +14,9 @@ from trainer.main import (
     MISSING_PUBSUB_DATA,
     NO_ENVELOPE,
     app,
+    download_dataset,
 )
+from trainer.model_metadata import ModelMetadata
 
 DATA_PATH = (Path(__file__).parent / "data").resolve()
 VALID_METADATA = Path(DATA_PATH, "valid_model_metadata.json")
@@ -100,3 +103,13 @@ def test_index_with_invalid_model_metadata_returns_error(
     assert_bad_request(
         client, hook_mock, expected_response=BAD_MODEL_METADATA_FORMAT, json=data
     )
+
+
+def test_download_dataset_uses_cache_by_dataset(mocker):
+    metadata = ModelMetadata.from_dict(json.loads(VALID_METADATA.read_text()))
+    sync_mock = mocker.patch("trainer.main.sync_dataset")
+
+    assert download_dataset(metadata) == sync_mock.return_value
+    kwargs = sync_mock.call_args.kwargs
+    assert kwargs["user_id"] == metadata.user_id
+    assert kwargs["dataset_name"] == metadata.dataset_name
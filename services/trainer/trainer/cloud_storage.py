@@ -1,9 +1,9 @@
 from pathlib import Path
 from typing import Iterable, Optional
 
-from google.cloud import storage
 from google.cloud.storage.blob import Blob
 from loguru import logger
+from trainer.clients import get_storage_client
 
 
 def download_blob(
@@ -17,7 +17,7 @@ def download_blob(
         destination_path: The local path referring to where the blob will be
             downloaded.
     """
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
 
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(source_blob_name)
@@ -38,7 +38,7 @@ def upload_blob(
         source_file_name: The path to your file to upload
         destination_blob_name: The ID of your GCS object
     """
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(destination_blob_name)
 
@@ -48,7 +48,10 @@ def upload_blob(
 
 
 def list_blobs_with_prefix(
-    bucket_name: str, prefix: str, delimiter: Optional[str] = None
+    bucket_name: str,
+    prefix: str,
+    delimiter: Optional[str] = None,
+    fields: Optional[str] = None,
 ) -> Iterable[Blob]:
     """Lists all the blobs in the bucket that begin with the prefix.
     This can be used to list all blobs in a "folder", e.g. "public/".
@@ -57,10 +60,14 @@ def list_blobs_with_prefix(
         bucket_name: The ID of your GCS bucket
         prefix: The prefix used to filter blobs
         delimiter: Used together with prefix to emulate hierachy.
+        fields: A selector of the metadata to list, e.g.
+            "items(name,generation),nextPageToken". Defaults to all of it.
     """
 
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
 
     # Note: Client.list_blobs requires at least package version 1.17.0.
-    blobs = storage_client.list_blobs(bucket_name, prefix=prefix, delimiter=delimiter)
+    blobs = storage_client.list_blobs(
+        bucket_name, prefix=prefix, delimiter=delimiter, fields=fields
+    )
     return blobs
@@ -1,8 +1,11 @@
+import json
 import os
+import tarfile
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
-from datasets import Audio, load_dataset
+import soundfile
+from datasets import Audio, Dataset, concatenate_datasets, load_dataset
 from datasets.dataset_dict import DatasetDict
 from trainer.model_metadata import ModelMetadata
 from transformers import Wav2Vec2Processor
@@ -10,6 +13,14 @@ from transformers import Wav2Vec2Processor
 PROCESSOR_COUNT = 4
 AUDIO_COLUMN = "audio"
 
+# Note: Must be in sync with the shard writer in the cloud functions
+SHARD_EXTENSION = ".tar"
+SHARD_INDEX_NAME = "index.jsonl"
+SHARD_AUDIO_NAME = "audio.wav"
+
+# Note: Must be in sync with the manifest writer in the cloud functions
+MANIFEST_NAME = "_manifest.jsonl"
+
 
 def create_dataset(
     metadata: ModelMetadata, dataset_path: Path, cache_dir: Path
@@ -17,6 +28,10 @@ def create_dataset(
     """Creates a dataset with test/train splits from the data within a given
     directory.
 
+    If the directory contains the dataset's manifest, the dataset is loaded
+    from it (see load_manifest). Otherwise, the directory may contain
+    transcript and audio file pairs, packed shards (see load_shards), or both.
+
     Parameters:
         metadata: The metadata for the model training job.
         dataset_path: The path to the unprocessed dataset files.
@@ -25,14 +40,61 @@ def create_dataset(
     Returns:
         A dataset dictionary with test and train splits.
     """
+    manifest_file = dataset_path / MANIFEST_NAME
+    if manifest_file.exists():
+        dataset = load_manifest(metadata, manifest_file, dataset_path, cache_dir)
+        return split_dataset(metadata, dataset)
+
+    files = sorted(dataset_path / file for file in os.listdir(dataset_path))
+    transcript_files = [file for file in files if file.suffix == ".json"]
+    shard_files = [file for file in files if file.suffix == SHARD_EXTENSION]
+
+    datasets: List[Dataset] = []
+    if len(transcript_files) > 0:
+        datasets.append(
+            load_transcript_files(metadata, transcript_files, dataset_path, cache_dir)
+        )
+    if len(shard_files) > 0:
+        datasets.append(load_shards(metadata, shard_files, cache_dir))
+
+    # Align column types (e.g. all null speakers in one source) before merging.
+    dataset = concatenate_datasets(
+        [datasets[0]] + [other.cast(datasets[0].features) for other in datasets[1:]]
+    )
+    return split_dataset(metadata, dataset)
+
+
+def split_dataset(metadata: ModelMetadata, dataset: Dataset) -> DatasetDict:
+    """Splits a dataset into train and test sets, seeded so that the same
+    options always give the same split.
+    """
+    return dataset.train_test_split(
+        test_size=metadata.options.test_size, seed=metadata.options.seed
+    )  # type: ignore
+
+
+def load_transcript_files(
+    metadata: ModelMetadata,
+    transcript_files: List[Path],
+    dataset_path: Path,
+    cache_dir: Path,
+) -> Dataset:
+    """Loads a dataset from transcript files, each of which references an
+    audio file in the same directory.
+
+    Parameters:
+        metadata: The metadata for the model training job.
+        transcript_files: The paths of the transcript files to load.
+        dataset_path: The path to the directory containing the audio files.
+        cache_dir: The path to save the processed dataset.
 
-    transcript_files = [
-        str(dataset_path / file)
-        for file in os.listdir(dataset_path)
-        if (dataset_path / file).suffix == ".json"
-    ]
+    Returns:
+        The loaded dataset.
+    """
     dataset = load_dataset(
-        "json", cache_dir=str(cache_dir), data_files=transcript_files
+        "json",
+        cache_dir=str(cache_dir),
+        data_files=[str(file) for file in transcript_files],
     )
 
     # Convert the audio file name column into the matching audio data
@@ -46,8 +108,162 @@ def create_dataset(
     dataset = dataset.cast_column(
         AUDIO_COLUMN, Audio(sampling_rate=metadata.sampling_rate)
     )
+    return dataset["train"]  # type: ignore
+
+
+def load_shards(
+    metadata: ModelMetadata, shard_files: List[Path], cache_dir: Path
+) -> Dataset:
+    """Loads a dataset from packed shards.
+
+    Each shard is a tar archive containing an index.jsonl file, with one
+    annotation per line along with the offset and number of frames of its
+    audio, and an audio.wav file holding all of the annotations' audio.
+
+    Parameters:
+        metadata: The metadata for the model training job.
+        shard_files: The paths of the shards to load.
+        cache_dir: The path in which to unpack the shards' audio.
+
+    Returns:
+        The loaded dataset.
+    """
+    rows: List[Dict[str, Any]] = []
+    for shard_file in shard_files:
+        with tarfile.open(shard_file) as shard:
+            index_file = shard.extractfile(SHARD_INDEX_NAME)
+            index = [json.loads(line) for line in index_file or [] if line.strip()]
+        if len(index) == 0:
+            continue
+
+        segments = [(entry.pop("offset"), entry.pop("frames")) for entry in index]
+        audio_paths = unpack_shard_audio(shard_file, segments, cache_dir)
+        for entry, audio_path in zip(index, audio_paths):
+            entry.pop("audio_file_name")
+            entry[AUDIO_COLUMN] = audio_path
+            rows.append(entry)
+
+    if len(rows) == 0:
+        raise ValueError(f"No annotations found in shards: {shard_files}")
+
+    columns = {key: [row[key] for row in rows] for key in rows[0]}
+    dataset = Dataset.from_dict(columns)
+    return dataset.cast_column(
+        AUDIO_COLUMN, Audio(sampling_rate=metadata.sampling_rate)
+    )
+
+
+def unpack_shard_audio(
+    shard_file: Path, segments: List[Tuple[int, int]], cache_dir: Path
+) -> List[str]:
+    """Writes the audio of each segment of a shard to its own wav file, so
+    that datasets can reference it by path and decode it lazily.
+
+    Segments are read from the shard one at a time, so only a single
+    segment's audio is held in memory. Files unpacked from the same version
+    of the shard are reused.
+
+    Parameters:
+        shard_file: The path to the shard.
+        segments: The (offset, frames) of each segment within the shard's
+            audio.
+        cache_dir: The path in which to unpack the audio.
+
+    Returns:
+        The path of each segment's audio file, in the order of the segments.
+    """
+    stat = shard_file.stat()
+    directory = cache_dir / "shards" / f"{shard_file.stem}-{stat.st_mtime_ns}"
+    directory.mkdir(parents=True, exist_ok=True)
+
+    paths: List[str] = []
+    with tarfile.open(shard_file) as shard:
+        audio_file = shard.extractfile(SHARD_AUDIO_NAME)
+        with soundfile.SoundFile(audio_file) as audio:
+            for offset, frames in segments:
+                path = directory / f"{offset}_{frames}.wav"
+                if not path.exists():
+                    audio.seek(offset)
+                    partial = path.with_suffix(".partial")
+                    soundfile.write(
+                        partial,
+                        audio.read(frames, dtype="int16"),
+                        audio.samplerate,
+                        format="WAV",
+                    )
+                    partial.replace(path)
+                paths.append(str(path))
+    return paths
+
+
+def read_manifest(manifest_file: Path) -> List[Dict[str, Any]]:
+    """Reads the entries of a dataset's manifest.
 
-    return dataset["train"].train_test_split(test_size=metadata.options.test_size)  # type: ignore
+    Each entry describes one training example, with the path of its audio
+    (relative to the dataset), its transcript, speaker, duration in
+    milliseconds, number of samples, sample rate and the CRC32C of its audio
+    file. Examples within a shard also have the offset of their audio within
+    the shard's audio.
+
+    Parameters:
+        manifest_file: The path to the manifest.
+
+    Returns:
+        A list of the entries in the manifest.
+    """
+    with open(manifest_file) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_manifest(
+    metadata: ModelMetadata, manifest_file: Path, dataset_path: Path, cache_dir: Path
+) -> Dataset:
+    """Loads a dataset from its manifest, without listing or scanning the
+    transcript files.
+
+    Parameters:
+        metadata: The metadata for the model training job.
+        manifest_file: The path to the dataset's manifest.
+        dataset_path: The path to the directory containing the audio files
+            and shards which the manifest references.
+        cache_dir: The path in which to unpack the shards' audio.
+
+    Returns:
+        The loaded dataset.
+    """
+    entries = read_manifest(manifest_file)
+    if len(entries) == 0:
+        raise ValueError(f"No entries found in manifest: {manifest_file}")
+
+    # Examples within shards are unpacked a shard at a time, and every
+    # example's audio is referenced by path.
+    audio: List[Optional[str]] = [None] * len(entries)
+    shard_examples: Dict[str, List[int]] = {}
+    for position, entry in enumerate(entries):
+        if entry.get("offset") is None:
+            audio[position] = str(dataset_path / entry["path"])
+        else:
+            shard_examples.setdefault(entry["path"], []).append(position)
+
+    for shard_name, positions in shard_examples.items():
+        segments = [
+            (entries[position]["offset"], entries[position]["samples"])
+            for position in positions
+        ]
+        paths = unpack_shard_audio(dataset_path / shard_name, segments, cache_dir)
+        for position, path in zip(positions, paths):
+            audio[position] = path
+
+    dataset = Dataset.from_dict(
+        {
+            AUDIO_COLUMN: audio,
+            "transcript": [entry["transcript"] for entry in entries],
+            "speaker_id": [entry.get("speaker") for entry in entries],
+        }
+    )
+    return dataset.cast_column(
+        AUDIO_COLUMN, Audio(sampling_rate=metadata.sampling_rate)
+    )
 
 
 def prepare_dataset(dataset: DatasetDict, processor: Wav2Vec2Processor) -> DatasetDict:
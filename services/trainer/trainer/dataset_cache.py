@@ -0,0 +1,203 @@
+import fcntl
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from google.cloud.storage.blob import Blob
+from loguru import logger
+from trainer.cloud_storage import list_blobs_with_prefix
+from trainer.dataset import MANIFEST_NAME, read_manifest
+
+# The number of dataset files to download concurrently.
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", "16"))
+
+# Only the metadata the cache needs to decide which objects have changed.
+LISTING_FIELDS = "items(name,generation,crc32c,size),nextPageToken"
+
+INDEX_SUFFIX = ".index.json"
+LOCK_SUFFIX = ".lock"
+
+
+@dataclass
+class SyncReport:
+    """A class describing a run of bringing a cached dataset up to date."""
+
+    downloaded: int
+    reused: int
+    removed: int
+    bytes: int
+    seconds: float
+
+    @property
+    def throughput(self) -> float:
+        """The download throughput in megabytes per second."""
+        return self.bytes / 1_000_000 / self.seconds if self.seconds > 0 else 0.0
+
+
+def get_dataset_path(cache_path: Path, user_id: str, dataset_name: str) -> Path:
+    """Returns the local directory a user's dataset is cached in.
+
+    Datasets are cached by user and dataset name rather than by model, so
+    models trained on the same dataset share its files. Each directory has a
+    sibling index (of the generation and checksum of each cached object) and
+    lock file, so that the directory only holds the dataset's files.
+    """
+    return cache_path / user_id / dataset_name
+
+
+def sync_dataset(
+    bucket_name: str,
+    user_id: str,
+    dataset_name: str,
+    cache_path: Path,
+    workers: int = DOWNLOAD_WORKERS,
+) -> Path:
+    """Brings the local copy of a processed dataset up to date, downloading
+    only the objects which aren't already cached.
+
+    If the dataset has a manifest, only the manifest and the files it
+    references are kept. Otherwise, every file in the dataset is.
+
+    Parameters:
+        bucket_name: The ID of the GCS bucket holding processed datasets.
+        user_id: The ID of the user who owns the dataset.
+        dataset_name: The name of the dataset.
+        cache_path: The directory in which datasets are cached.
+        workers: The number of files to download concurrently.
+
+    Returns:
+        The path to the directory holding the dataset's files.
+    """
+    dataset_path = get_dataset_path(cache_path, user_id, dataset_name)
+    dataset_path.mkdir(parents=True, exist_ok=True)
+
+    with _locked(dataset_path.with_name(dataset_path.name + LOCK_SUFFIX)):
+        report = _sync(bucket_name, f"{user_id}/{dataset_name}/", dataset_path, workers)
+
+    logger.info(
+        f"Synced dataset {user_id}/{dataset_name}: downloaded {report.downloaded} "
+        f"files ({report.bytes / 1_000_000:.1f} MB) in {report.seconds:.1f}s "
+        f"({report.throughput:.1f} MB/s), reused {report.reused} and removed "
+        f"{report.removed} cached files."
+    )
+    return dataset_path
+
+
+def _sync(
+    bucket_name: str, prefix: str, dataset_path: Path, workers: int
+) -> SyncReport:
+    """Syncs the dataset with the given prefix into its directory, while the
+    caller holds its lock.
+    """
+    start = time.perf_counter()
+    index_file = dataset_path.with_name(dataset_path.name + INDEX_SUFFIX)
+    index = _read_index(index_file)
+
+    blobs: Dict[str, Blob] = {
+        str(blob.name)[len(prefix) :]: blob
+        for blob in list_blobs_with_prefix(bucket_name, prefix, fields=LISTING_FIELDS)
+    }
+    logger.info(f"Found {len(blobs)} objects at {bucket_name}/{prefix}")
+
+    # The manifest decides which of the other objects are needed, so it's
+    # brought up to date first.
+    wanted: Set[str] = set(blobs)
+    downloads: List[str] = []
+    if MANIFEST_NAME in blobs:
+        manifest = blobs[MANIFEST_NAME]
+        if _is_stale(manifest, dataset_path / MANIFEST_NAME, index.get(MANIFEST_NAME)):
+            _download(manifest, dataset_path / MANIFEST_NAME)
+            downloads.append(MANIFEST_NAME)
+        entries = read_manifest(dataset_path / MANIFEST_NAME)
+        wanted = {MANIFEST_NAME} | {entry["path"] for entry in entries}
+        missing = wanted - blobs.keys()
+        if len(missing) > 0:
+            raise FileNotFoundError(f"Dataset {prefix} is missing files: {missing}")
+
+    stale = sorted(
+        name
+        for name in wanted.difference(downloads)
+        if _is_stale(blobs[name], dataset_path / name, index.get(name))
+    )
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # Consuming the results re-raises the first failed download.
+        list(
+            executor.map(
+                lambda name: _download(blobs[name], dataset_path / name), stale
+            )
+        )
+    downloads.extend(stale)
+
+    removed = 0
+    for name in set(index) - wanted:
+        (dataset_path / name).unlink(missing_ok=True)
+        removed += 1
+
+    _write_index(index_file, {name: _entry(blobs[name]) for name in wanted})
+    return SyncReport(
+        downloaded=len(downloads),
+        reused=len(wanted) - len(downloads),
+        removed=removed,
+        bytes=sum(blobs[name].size or 0 for name in downloads),
+        seconds=time.perf_counter() - start,
+    )
+
+
+def _is_stale(blob: Blob, path: Path, entry: Optional[Dict[str, Any]]) -> bool:
+    """Checks whether a cached file differs from its object in storage.
+
+    Files are matched by the object's generation, which changes whenever it's
+    rewritten. Objects rewritten with the same contents (e.g. by reprocessing
+    a dataset) are matched by their checksum instead.
+    """
+    if entry is None or not path.exists():
+        return True
+    if entry["generation"] == blob.generation:
+        return False
+    return blob.crc32c is None or entry["crc32c"] != blob.crc32c
+
+
+def _download(blob: Blob, path: Path) -> None:
+    """Downloads the listed generation of an object, replacing the file at
+    the path only once the download has finished.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + ".partial")
+    blob.download_to_filename(partial)
+    partial.replace(path)
+
+
+def _entry(blob: Blob) -> Dict[str, Any]:
+    return {"generation": blob.generation, "crc32c": blob.crc32c}
+
+
+def _read_index(index_file: Path) -> Dict[str, Dict[str, Any]]:
+    """Reads the generation and checksum of each cached object."""
+    try:
+        return json.loads(index_file.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _write_index(index_file: Path, index: Dict[str, Dict[str, Any]]) -> None:
+    partial = index_file.with_name(index_file.name + ".partial")
+    partial.write_text(json.dumps(index))
+    partial.replace(index_file)
+
+
+@contextmanager
+def _locked(lock_file: Path) -> Iterator[None]:
+    """Holds an exclusive lock on the given file, so that processes training
+    on the same dataset don't sync it at the same time.
+    """
+    with open(lock_file, "w") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import datasets
+import transformers
+from datasets import load_from_disk
+from datasets.dataset_dict import DatasetDict
+from loguru import logger
+from trainer.dataset import MANIFEST_NAME, create_dataset, prepare_dataset
+from trainer.model_metadata import ModelMetadata
+from transformers import Wav2Vec2Processor
+
+# Bump when the preparation of features changes, so that features prepared
+# by older code aren't reused.
+FEATURE_CACHE_VERSION = 1
+
+
+def feature_cache_key(metadata: ModelMetadata, dataset_path: Path) -> str:
+    """Builds the key of a dataset's prepared features, from everything the
+    features depend on: the dataset's contents, the processor, the sampling
+    rate and the seeded train/test split.
+
+    Parameters:
+        metadata: The metadata for the model training job.
+        dataset_path: The path to the downloaded dataset.
+
+    Returns:
+        A hex digest identifying the prepared features.
+    """
+    key = {
+        "version": FEATURE_CACHE_VERSION,
+        "dataset": dataset_fingerprint(dataset_path),
+        "base_model": metadata.base_model,
+        "sampling_rate": metadata.sampling_rate,
+        "test_size": metadata.options.test_size,
+        "seed": metadata.options.seed,
+        "datasets": datasets.__version__,
+        "transformers": transformers.__version__,
+    }
+    encoded = json.dumps(key, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def dataset_fingerprint(dataset_path: Path) -> str:
+    """Hashes the contents of a downloaded dataset.
+
+    A dataset's manifest records the checksum of every example's audio, so
+    it's hashed alone. Datasets without one are hashed by the name, size and
+    modification time of each file, which change whenever a sync replaces a
+    file.
+    """
+    digest = hashlib.sha256()
+    manifest_file = dataset_path / MANIFEST_NAME
+    if manifest_file.exists():
+        digest.update(manifest_file.read_bytes())
+        return digest.hexdigest()
+
+    for file in sorted(dataset_path.iterdir()):
+        stat = file.stat()
+        digest.update(f"{file.name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def load_features(
+    metadata: ModelMetadata,
+    dataset_path: Path,
+    processor: Wav2Vec2Processor,
+    data_path: Path,
+) -> DatasetDict:
+    """Loads the prepared train and test features of a dataset, preparing
+    and caching them on the data volume if they haven't been already.
+
+    Parameters:
+        metadata: The metadata for the model training job.
+        dataset_path: The path to the downloaded dataset.
+        processor: The processor of the base model.
+        data_path: The directory holding the feature cache.
+
+    Returns:
+        A dataset dictionary of prepared features, with test and train splits.
+    """
+    features_path = data_path / "features" / feature_cache_key(metadata, dataset_path)
+    if features_path.exists():
+        logger.info(f"Loading cached features from {features_path}")
+        return load_from_disk(str(features_path))  # type: ignore
+
+    dataset = create_dataset(metadata, dataset_path, data_path / "cache")
+    dataset = prepare_dataset(dataset, processor)
+
+    # Features are saved beside their final path and moved into place once
+    # complete, so an interrupted run never leaves partial features behind.
+    partial_path = features_path.with_name(f"{features_path.name}.{os.getpid()}")
+    features_path.parent.mkdir(parents=True, exist_ok=True)
+    dataset.save_to_disk(str(partial_path))
+    try:
+        partial_path.rename(features_path)
+        logger.info(f"Cached features at {features_path}")
+    except OSError:
+        # Another run cached the same features first.
+        shutil.rmtree(partial_path, ignore_errors=True)
+    return load_from_disk(str(features_path))  # type: ignore
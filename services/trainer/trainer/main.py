@@ -8,9 +8,10 @@ from typing import Optional
 from flask import Flask, Response, request
 from google.cloud.firestore import DocumentReference
 from loguru import logger
-from trainer.cloud_storage import download_blob, list_blobs_with_prefix, upload_blob
-from trainer.firebase import get_firestore_client
+from trainer.clients import get_firestore_client
+from trainer.dataset_cache import sync_dataset
 from trainer.model_metadata import ModelMetadata, TrainingStatus
+from trainer.model_upload import upload_model_files
 from trainer.trainer import train
 
 app = Flask(__name__)
@@ -90,8 +91,7 @@ def process_training_request(metadata: ModelMetadata):
     set_model_status(metadata, TrainingStatus.TRAINING)
 
     try:
-        dataset_path = DATA_PATH / "datasets" / metadata.user_id / metadata.model_name
-        download_dataset(metadata=metadata, dataset_path=dataset_path)
+        dataset_path = download_dataset(metadata)
         model_path = train(
             metadata=metadata, data_path=DATA_PATH, dataset_path=dataset_path
         )
@@ -105,27 +105,26 @@ def process_training_request(metadata: ModelMetadata):
         set_model_status(metadata, TrainingStatus.ERROR)
 
 
-def download_dataset(metadata: ModelMetadata, dataset_path: Path) -> None:
-    """Downloads the processed dataset to the provided path
+def download_dataset(metadata: ModelMetadata) -> Path:
+    """Downloads the processed dataset into the local dataset cache, fetching
+    only the files which have changed since it was last downloaded.
 
     Parameters:
         metadata: The metadata of the model training job to use.
-        data_path: A path in which to store the dataset
-    """
-    dataset_path.mkdir(parents=True, exist_ok=True)
-
-    dataset_prefix = f"{metadata.user_id}/{metadata.dataset_name}/"
-    logger.info(f"Downloading dataset at: {DATASET_BUCKET}/{dataset_prefix}")
-
-    blobs = list_blobs_with_prefix(DATASET_BUCKET, dataset_prefix)
-    names = [str(blob.name) for blob in blobs]
-    logger.info(f"Found blobs: {names}")
 
-    for name in names:
-        local_path = dataset_path / name
-        download_blob(DATASET_BUCKET, name, local_path)
-
-    logger.info("Finished downloading dataset.")
+    Returns:
+        The path to the directory holding the dataset.
+    """
+    logger.info(
+        f"Downloading dataset at: {DATASET_BUCKET}/"
+        f"{metadata.user_id}/{metadata.dataset_name}/"
+    )
+    return sync_dataset(
+        bucket_name=DATASET_BUCKET,
+        user_id=metadata.user_id,
+        dataset_name=metadata.dataset_name,
+        cache_path=DATA_PATH / "datasets",
+    )
 
 
 def upload_model(metadata: ModelMetadata, model_path: Path) -> None:
@@ -135,14 +134,20 @@ def upload_model(metadata: ModelMetadata, model_path: Path) -> None:
         metadata: The metadata of the model training job.
         model_path: The path of the trained model.
     """
-    model_prefix = f"{metadata.user_id}/{metadata.model_name}"
+    model_prefix = f"{metadata.user_id}/{metadata.model_name}/"
     logger.info(f"Uploading model files to {MODEL_BUCKET}/{model_prefix}")
 
-    for file in os.listdir(model_path):
-        blob_name = f"{model_prefix}/{file}"
-        upload_blob(MODEL_BUCKET, model_path / file, blob_name)
-
-    logger.info("Finished uploading model.")
+    report = upload_model_files(
+        bucket_name=MODEL_BUCKET,
+        model_path=model_path,
+        prefix=model_prefix,
+        sessions_path=DATA_PATH / "upload_sessions",
+    )
+    logger.info(
+        f"Finished uploading model: uploaded {report.uploaded} files "
+        f"({report.bytes / 1_000_000:.1f} MB) in {report.seconds:.1f}s "
+        f"({report.throughput:.1f} MB/s), skipped {report.skipped} unchanged files."
+    )
 
 
 def get_model_status(metadata: ModelMetadata) -> Optional[TrainingStatus]:
@@ -27,6 +27,8 @@ class TrainingOptions:
     max_duration: int = 60
     word_delimiter_token: str = " "
     test_size: float = 0.2
+    # Seeds the train/test split and training, so runs are reproducible.
+    seed: int = 42
 
     @staticmethod
     def from_dict(data: Dict[str, Any]) -> "TrainingOptions":
@@ -57,6 +59,7 @@ class ModelMetadata:
             learning_rate=self.options.learning_rate,
             weight_decay=0.005,
             save_total_limit=2,
+            seed=self.options.seed,
         )
 
     @staticmethod
@@ -0,0 +1,265 @@
+import base64
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Tuple
+
+import google_crc32c
+from google.cloud.storage.retry import DEFAULT_RETRY
+from google.resumable_media import InvalidResponse
+from google.resumable_media.requests import ResumableUpload
+from loguru import logger
+from trainer.clients import get_storage_client
+from trainer.cloud_storage import list_blobs_with_prefix
+
+
+class Artifacts(Enum):
+    """Which of a training run's output files are uploaded."""
+
+    INFERENCE = "inference"  # Weights, config and processor files
+    FULL = "full"  # Everything, including checkpoints and optimizer state
+
+
+# The output files uploaded after training.
+UPLOAD_ARTIFACTS = Artifacts(os.environ.get("UPLOAD_ARTIFACTS", "inference"))
+
+# The number of files to upload concurrently.
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", "8"))
+
+# The size of each request of a chunked upload. Chunks must be a multiple of
+# 256 KiB, and files no larger than a chunk are uploaded in a single request.
+CHUNK_ALIGNMENT = 256 * 1024
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(32 * 1024 * 1024)))
+
+# Requests which fail transiently are retried by the upload itself. Other
+# failures leave the upload invalid, and it's recovered from the session's
+# committed bytes at most this many times.
+MAX_UPLOAD_RECOVERIES = int(os.environ.get("MAX_UPLOAD_RECOVERIES", "5"))
+UPLOAD_TIMEOUT = 120
+
+# Files written by the trainer to resume training, which aren't needed to
+# serve the model.
+TRAINING_STATE_FILES = {
+    "optimizer.pt",
+    "scheduler.pt",
+    "scaler.pt",
+    "rng_state.pth",
+    "trainer_state.json",
+    "training_args.bin",
+}
+
+
+@dataclass
+class UploadReport:
+    """A class describing a run of uploading a trained model's files."""
+
+    uploaded: int
+    skipped: int
+    bytes: int
+    seconds: float
+
+    @property
+    def throughput(self) -> float:
+        """The upload throughput in megabytes per second."""
+        return self.bytes / 1_000_000 / self.seconds if self.seconds > 0 else 0.0
+
+
+def select_artifacts(model_path: Path, artifacts: Artifacts) -> List[Path]:
+    """Finds the files within a training run's output to upload.
+
+    Parameters:
+        model_path: The output directory of the training run.
+        artifacts: Which of the output files to upload.
+
+    Returns:
+        The paths of the files to upload, relative to the output directory.
+    """
+    if artifacts == Artifacts.FULL:
+        files = (path for path in model_path.rglob("*") if path.is_file())
+    else:
+        # Checkpoints (and logs) are kept in subdirectories, so only the
+        # files at the top of the output are needed for inference.
+        files = (
+            path
+            for path in model_path.iterdir()
+            if path.is_file() and path.name not in TRAINING_STATE_FILES
+        )
+    return sorted(path.relative_to(model_path) for path in files)
+
+
+def upload_model_files(
+    bucket_name: str,
+    model_path: Path,
+    prefix: str,
+    sessions_path: Path,
+    artifacts: Artifacts = UPLOAD_ARTIFACTS,
+    workers: int = UPLOAD_WORKERS,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> UploadReport:
+    """Uploads a training run's output to cloud storage, in parallel.
+
+    Files already in storage with the same contents are skipped, and large
+    files are uploaded in chunks through a resumable session. The session of
+    each upload is recorded, so an interrupted upload resumes from its last
+    committed chunk rather than starting over.
+
+    Parameters:
+        bucket_name: The ID of the GCS bucket to upload the model to.
+        model_path: The output directory of the training run.
+        prefix: The prefix of the model's objects within the bucket.
+        sessions_path: A directory in which to record upload sessions.
+        artifacts: Which of the output files to upload.
+        workers: The number of files to upload concurrently.
+        chunk_size: The size of each request of a chunked upload.
+
+    Returns:
+        A report of the files uploaded.
+    """
+    start = time.perf_counter()
+    sessions_path.mkdir(parents=True, exist_ok=True)
+    chunk_size = max(CHUNK_ALIGNMENT, chunk_size // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT)
+
+    existing = {
+        str(blob.name): blob.crc32c
+        for blob in list_blobs_with_prefix(
+            bucket_name, prefix, fields="items(name,crc32c),nextPageToken"
+        )
+    }
+
+    # Each file is hashed once, to compare it with storage and then to
+    # validate its chunked upload.
+    uploads: Dict[str, Tuple[Path, str]] = {}
+    skipped = 0
+    for name in select_artifacts(model_path, artifacts):
+        blob_name = f"{prefix}{name.as_posix()}"
+        checksum = _crc32c(model_path / name)
+        if existing.get(blob_name) == checksum:
+            skipped += 1
+        else:
+            uploads[blob_name] = (model_path / name, checksum)
+
+    def upload(blob_name: str) -> None:
+        path, checksum = uploads[blob_name]
+        _upload_file(bucket_name, path, blob_name, checksum, sessions_path, chunk_size)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # Consuming the results re-raises the first failed upload.
+        list(executor.map(upload, uploads))
+
+    return UploadReport(
+        uploaded=len(uploads),
+        skipped=skipped,
+        bytes=sum(path.stat().st_size for path, _ in uploads.values()),
+        seconds=time.perf_counter() - start,
+    )
+
+
+def _upload_file(
+    bucket_name: str,
+    path: Path,
+    blob_name: str,
+    checksum: str,
+    sessions_path: Path,
+    chunk_size: int,
+) -> None:
+    """Uploads a single file, whose crc32c checksum is given, resuming a
+    recorded session if it has one.
+    """
+    client = get_storage_client()
+    blob = client.bucket(bucket_name).blob(blob_name)
+    size = path.stat().st_size
+    if size <= chunk_size:
+        blob.upload_from_filename(path, retry=DEFAULT_RETRY)
+        logger.info(f"Uploaded {path} to {blob_name}.")
+        return
+
+    session_file = sessions_path / _session_name(blob_name, checksum)
+    with open(path, "rb") as file:
+        upload = None
+        if session_file.exists():
+            logger.info(f"Resuming upload of {path} to {blob_name}.")
+            try:
+                upload = _resume_upload(
+                    client._http, session_file.read_text(), file, size, chunk_size
+                )
+            except InvalidResponse as error:
+                logger.info(f"Couldn't resume upload of {blob_name}: {error}")
+
+        if upload is None:
+            session_url = blob.create_resumable_upload_session(size=size)
+            session_file.write_text(session_url)
+            upload = _resume_upload(client._http, session_url, file, size, chunk_size)
+
+        result = _upload_chunks(client._http, upload)
+
+    session_file.unlink(missing_ok=True)
+    if result.get("crc32c") != checksum:
+        raise IOError(f"Checksum of {blob_name} doesn't match {path}")
+    logger.info(f"Uploaded {path} to {blob_name} in chunks.")
+
+
+def _resume_upload(
+    transport, session_url: str, file: BinaryIO, size: int, chunk_size: int
+) -> ResumableUpload:
+    """Resumes the upload of a file to a resumable session, from the bytes
+    the session has committed.
+
+    Raises:
+        InvalidResponse: If the session no longer exists.
+    """
+    # The upload is set up as though it had been initiated and then failed,
+    # so recovering it queries the session's progress. Its checksum is left
+    # to the caller, as a resumed upload doesn't see the committed bytes.
+    upload = ResumableUpload(session_url, chunk_size)
+    upload._resumable_url = session_url
+    upload._stream = file
+    upload._total_bytes = size
+    upload._content_type = "application/octet-stream"
+    upload._invalid = True
+    upload.recover(transport)
+    return upload
+
+
+def _upload_chunks(transport, upload: ResumableUpload) -> Dict:
+    """Uploads the rest of a file's chunks, recovering the upload after
+    failed requests.
+
+    Returns:
+        The metadata of the uploaded object.
+    """
+    recoveries = 0
+    while True:
+        try:
+            response = upload.transmit_next_chunk(transport, timeout=UPLOAD_TIMEOUT)
+        except InvalidResponse as error:
+            recoveries += 1
+            if not upload.invalid or recoveries > MAX_UPLOAD_RECOVERIES:
+                raise
+            logger.warning(f"Chunk upload failed, recovering: {error}")
+            upload.recover(transport)
+            continue
+
+        if upload.finished:
+            return response.json()
+
+
+def _session_name(blob_name: str, checksum: str) -> str:
+    """Names the record of an upload session. Sessions are keyed by the
+    file's contents too, so a changed file isn't resumed into an old session.
+    """
+    return hashlib.sha1(f"{blob_name}:{checksum}".encode("utf-8")).hexdigest()
+
+
+def _crc32c(path: Path) -> str:
+    """Computes the base64 encoded CRC32C checksum of a file, as reported by
+    cloud storage.
+    """
+    checksum = google_crc32c.Checksum()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            checksum.update(block)
+    return base64.b64encode(checksum.digest()).decode("utf-8")
@@ -4,7 +4,7 @@ from typing import Dict, List, Union
 
 import torch
 from loguru import logger
-from trainer.dataset import create_dataset, prepare_dataset
+from trainer.feature_cache import load_features
 from trainer.model_metadata import ModelMetadata
 from transformers import AutoModelForCTC, AutoProcessor, Trainer
 
@@ -25,9 +25,8 @@ def train(metadata: ModelMetadata, data_path: Path, dataset_path: Path) -> Path:
     cache_dir = data_path / "cache"
 
     logger.info("Preparing Datasets...")
-    dataset = create_dataset(metadata, dataset_path, cache_dir)
     processor = AutoProcessor.from_pretrained(metadata.base_model, cache_dir=cache_dir)
-    dataset = prepare_dataset(dataset, processor)
+    dataset = load_features(metadata, dataset_path, processor, data_path)
     logger.info("Finished Preparing Datasets")
 
     logger.info("Downloading pretrained model...")